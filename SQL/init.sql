@@ -7,6 +7,7 @@ CREATE TABLE IF NOT EXISTS factories (
     id SERIAL PRIMARY KEY,
     code VARCHAR(10) UNIQUE NOT NULL,  -- AMA, AMC, AMD
     name VARCHAR(100) NOT NULL,
+    aliases JSONB DEFAULT '[]',  -- 檔名 / 資料中的其他寫法（廠別偵測使用）
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -49,6 +50,7 @@ CREATE TABLE IF NOT EXISTS part_shipments (
     amount DECIMAL(12, 2) DEFAULT 0,
     shipment_date DATE,
     file_upload_id VARCHAR(100),
+    source_row INTEGER,  -- 原始檔案資料行索引 (原始內容封存於 Parquet)
     row_data JSONB,  -- 儲存原始行資料
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (factory_code, order_number) REFERENCES work_orders(factory_code, order_number) ON DELETE CASCADE,
@@ -65,6 +67,7 @@ CREATE TABLE IF NOT EXISTS part_sales (
     amount DECIMAL(12, 2) DEFAULT 0,
     sale_date DATE,
     file_upload_id VARCHAR(100),
+    source_row INTEGER,  -- 原始檔案資料行索引 (原始內容封存於 Parquet)
     row_data JSONB,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (factory_code, order_number) REFERENCES work_orders(factory_code, order_number) ON DELETE CASCADE,
@@ -82,11 +85,21 @@ CREATE TABLE IF NOT EXISTS technician_performance (
     bonus DECIMAL(12, 2) DEFAULT 0,
     performance_date DATE,
     file_upload_id VARCHAR(100),
+    source_row INTEGER,  -- 原始檔案資料行索引 (原始內容封存於 Parquet)
     row_data JSONB,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (factory_code, order_number) REFERENCES work_orders(factory_code, order_number) ON DELETE CASCADE
 );
 
+-- 6-1. 技師名單 (匯入技師績效時維護，搜尋 / 自動完成使用)
+CREATE TABLE IF NOT EXISTS technicians (
+    id SERIAL PRIMARY KEY,
+    factory_code VARCHAR(10) NOT NULL,
+    technician_name VARCHAR(100) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_technicians_factory_name UNIQUE (factory_code, technician_name)
+);
+
 -- 7. 維修收入分類記錄
 CREATE TABLE IF NOT EXISTS maintenance_income (
     id SERIAL PRIMARY KEY,
@@ -96,6 +109,7 @@ CREATE TABLE IF NOT EXISTS maintenance_income (
     amount DECIMAL(12, 2) DEFAULT 0,
     income_date DATE,
     file_upload_id VARCHAR(100),
+    source_row INTEGER,  -- 原始檔案資料行索引 (原始內容封存於 Parquet)
     row_data JSONB,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (factory_code, order_number) REFERENCES work_orders(factory_code, order_number) ON DELETE CASCADE
@@ -112,9 +126,55 @@ CREATE TABLE IF NOT EXISTS file_uploads (
     record_count INTEGER DEFAULT 0,
     status VARCHAR(20) DEFAULT 'processed',
     error_message TEXT,
+    error_summary JSONB,  -- 資料行錯誤摘要
     uploaded_by VARCHAR(100)
 );
 
+-- 9. 資料行指紋 (逐行增量匯入，避免每日累積檔重複寫入)
+CREATE TABLE IF NOT EXISTS row_fingerprints (
+    id SERIAL PRIMARY KEY,
+    factory_code VARCHAR(10) NOT NULL,
+    file_type VARCHAR(50) NOT NULL,
+    row_hash BIGINT NOT NULL,  -- 原始資料行內容的 64-bit 雜湊
+    file_upload_id VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_row_fingerprints_key UNIQUE (factory_code, file_type, row_hash)
+);
+
+-- 10. 資料版本 (每次匯入 / 撤銷遞增，報表 ETag 使用)
+CREATE TABLE IF NOT EXISTS data_versions (
+    id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO data_versions (id, version) VALUES (1, 0)
+ON CONFLICT (id) DO NOTHING;
+
+-- 11. 報表版型 (依標題列指紋記錄報表類型、標題列位置與欄位對應)
+CREATE TABLE IF NOT EXISTS report_templates (
+    id SERIAL PRIMARY KEY,
+    signature VARCHAR(64) UNIQUE NOT NULL,
+    file_type VARCHAR(50) NOT NULL,
+    header_row INTEGER NOT NULL DEFAULT 0,
+    column_mapping JSONB NOT NULL,  -- 原始標題 -> 標準欄位
+    factory_column VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 既有資料庫升級：來源資料行索引
+ALTER TABLE part_shipments ADD COLUMN IF NOT EXISTS source_row INTEGER;
+ALTER TABLE part_sales ADD COLUMN IF NOT EXISTS source_row INTEGER;
+ALTER TABLE technician_performance ADD COLUMN IF NOT EXISTS source_row INTEGER;
+ALTER TABLE maintenance_income ADD COLUMN IF NOT EXISTS source_row INTEGER;
+ALTER TABLE file_uploads ADD COLUMN IF NOT EXISTS error_summary JSONB;
+ALTER TABLE factories ADD COLUMN IF NOT EXISTS aliases JSONB DEFAULT '[]';
+
+-- 既有資料庫升級：由既有技師績效建立技師名單
+INSERT INTO technicians (factory_code, technician_name)
+SELECT DISTINCT factory_code, technician_name FROM technician_performance
+ON CONFLICT (factory_code, technician_name) DO NOTHING;
+
 -- ==========================================
 -- 建立索引提升查詢效能
 -- ==========================================
@@ -126,10 +186,30 @@ CREATE INDEX IF NOT EXISTS idx_part_sales_order ON part_sales(factory_code, orde
 CREATE INDEX IF NOT EXISTS idx_part_sales_part ON part_sales(part_number);
 CREATE INDEX IF NOT EXISTS idx_technician_factory ON technician_performance(factory_code);
 CREATE INDEX IF NOT EXISTS idx_technician_name ON technician_performance(technician_name);
+CREATE INDEX IF NOT EXISTS idx_technician_factory_date ON technician_performance(factory_code, performance_date);
 CREATE INDEX IF NOT EXISTS idx_maintenance_order ON maintenance_income(factory_code, order_number);
+CREATE INDEX IF NOT EXISTS idx_part_shipments_factory_date ON part_shipments(factory_code, shipment_date);
+CREATE INDEX IF NOT EXISTS idx_part_sales_factory_date ON part_sales(factory_code, sale_date);
+CREATE INDEX IF NOT EXISTS idx_maintenance_factory_date ON maintenance_income(factory_code, income_date);
+CREATE INDEX IF NOT EXISTS idx_part_shipments_upload ON part_shipments(file_upload_id);
+CREATE INDEX IF NOT EXISTS idx_part_sales_upload ON part_sales(file_upload_id);
+CREATE INDEX IF NOT EXISTS idx_technician_upload ON technician_performance(file_upload_id);
+CREATE INDEX IF NOT EXISTS idx_maintenance_upload ON maintenance_income(file_upload_id);
 CREATE INDEX IF NOT EXISTS idx_file_hash ON file_uploads(file_hash);
 CREATE INDEX IF NOT EXISTS idx_file_type ON file_uploads(file_type);
 
+-- 搜尋 / 自動完成：前綴以 pattern_ops btree，子字串以 pg_trgm GIN
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_work_orders_number_prefix ON work_orders(order_number varchar_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_work_orders_number_trgm ON work_orders USING gin (order_number gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_part_categories_number_prefix ON part_categories(part_number varchar_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_part_categories_number_trgm ON part_categories USING gin (part_number gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_part_categories_description_trgm ON part_categories USING gin (description gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_technicians_name_prefix ON technicians(technician_name varchar_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_technicians_name_trgm ON technicians USING gin (technician_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_row_fingerprints_sync ON row_fingerprints(factory_code, file_type, id);
+CREATE INDEX IF NOT EXISTS idx_row_fingerprints_upload ON row_fingerprints(file_upload_id);
+
 -- ==========================================
 -- 建立 Views 用於業績查詢
 -- ==========================================
@@ -0,0 +1,71 @@
+"""
+歷史月彙總：PostgreSQL vs DuckDB(Parquet 快照)
+使用方式（於 backend 目錄下，需可連線的資料庫）:
+    ANALYTICS_ENABLED=true python -m benchmarks.bench_analytics --start 2020-01-01 --end 2024-12-31 --export
+"""
+import argparse
+import statistics
+import time
+from datetime import date
+
+import crud
+from database import PerformanceSessionLocal
+from utils import analytics
+
+
+def timed(fn, repeat: int):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="比較 PostgreSQL 與 DuckDB 的歷史報表查詢")
+    arg_parser.add_argument("--start", type=date.fromisoformat, required=True)
+    arg_parser.add_argument("--end", type=date.fromisoformat, required=True)
+    arg_parser.add_argument("--factory", default=None)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--export", action="store_true", help="先重新匯出所有快照")
+    args = arg_parser.parse_args()
+
+    if args.export:
+        start = time.perf_counter()
+        analytics.export_snapshots()
+        print(f"匯出快照: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    db = PerformanceSessionLocal()
+    try:
+        pg_seconds, pg_rows = timed(
+            lambda: crud.get_performance_trend(db, args.start, args.end, "month", args.factory),
+            args.repeat
+        )
+        factory_codes = [factory.code for factory in crud.get_factories(db)]
+    finally:
+        db.close()
+
+    duck_seconds, duck_rows = timed(
+        lambda: analytics.query_monthly_history(args.start, args.end, factory_codes, args.factory),
+        args.repeat
+    )
+
+    print(f"PostgreSQL views/SQL: {pg_seconds * 1000:>8.1f} ms  ({len(pg_rows)} 列)")
+    print(f"DuckDB + Parquet:     {duck_seconds * 1000:>8.1f} ms  ({len(duck_rows)} 列)")
+    if duck_seconds:
+        print(f"加速比: {pg_seconds / duck_seconds:.1f}x")
+
+    # 結果一致性檢查（金額允許浮點誤差）
+    pg_totals = {(r["factory_code"], r["bucket"]): float(r["income"]) for r in pg_rows}
+    mismatches = []
+    for row in duck_rows:
+        key = (row["factory_code"], row["bucket"])
+        if key in pg_totals and abs(pg_totals[key] - float(row["income"])) > 0.01:
+            mismatches.append(key)
+    print(f"收入不一致的資料點: {len(mismatches)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+讀取後端效能比較
+使用方式（於 backend 目錄下）:
+    python -m benchmarks.bench_readers --rows 20000 --repeat 3
+"""
+import argparse
+import time
+from io import BytesIO
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+from utils.readers import BACKENDS
+
+REPORT_TYPES = ["零件出貨", "零件銷售", "Shelf Life Code", "技師績效", "維修收入"]
+
+
+def generate_report(file_type: str, rows: int, seed: int = 0) -> pd.DataFrame:
+    """產生與 ERP 報表欄位一致的模擬資料"""
+    rng = np.random.default_rng(seed)
+    factories = rng.choice(["AMA", "AMC", "AMD"], size=rows)
+    orders = [f"WO{n:08d}" for n in rng.integers(0, rows // 3 + 1, size=rows)]
+    parts = [f"P{n:06d}" for n in rng.integers(0, 5000, size=rows)]
+    dates = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, size=rows), unit="D")
+
+    if file_type == "零件出貨":
+        return pd.DataFrame({
+            "廠別": factories, "工單號": orders, "零件編號": parts,
+            "數量": rng.integers(1, 20, size=rows), "金額": rng.uniform(10, 5000, size=rows).round(2),
+            "出貨日期": dates,
+        })
+    if file_type == "零件銷售":
+        return pd.DataFrame({
+            "廠別": factories, "工單號": orders, "零件編號": parts,
+            "數量": rng.integers(1, 20, size=rows), "金額": rng.uniform(10, 5000, size=rows).round(2),
+            "銷售日期": dates,
+        })
+    if file_type == "Shelf Life Code":
+        return pd.DataFrame({
+            "零件編號": parts, "Shelf Life Code": rng.choice(["A", "B", "C", "N"], size=rows),
+        })
+    if file_type == "技師績效":
+        return pd.DataFrame({
+            "廠別": factories, "工單號": orders,
+            "技師名稱": [f"技師{n:03d}" for n in rng.integers(0, 200, size=rows)],
+            "工時": rng.uniform(0.5, 8, size=rows).round(2), "時薪": rng.uniform(200, 600, size=rows).round(0),
+            "獎金": rng.uniform(0, 2000, size=rows).round(0), "日期": dates,
+        })
+    return pd.DataFrame({
+        "廠別": factories, "工單號": orders,
+        "分類": rng.choice(["保養", "一般維修", "鈑噴", "保險"], size=rows),
+        "金額": rng.uniform(100, 30000, size=rows).round(2), "收入日期": dates,
+    })
+
+
+def encode(df: pd.DataFrame) -> Dict[str, bytes]:
+    """將同一份資料輸出為各種檔案格式"""
+    payloads = {}
+
+    buffer = BytesIO()
+    df.to_excel(buffer, index=False, engine="openpyxl")
+    payloads["xlsx"] = buffer.getvalue()
+
+    payloads["csv"] = df.to_csv(index=False).encode("utf-8-sig")
+
+    if BACKENDS["parquet"].is_available():
+        buffer = BytesIO()
+        df.to_parquet(buffer, index=False)
+        payloads["parquet"] = buffer.getvalue()
+
+    return payloads
+
+
+def timeit(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="比較各讀取後端的效能")
+    arg_parser.add_argument("--rows", type=int, default=20000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    plans = [("openpyxl", "xlsx"), ("calamine", "xlsx"), ("csv", "csv"), ("parquet", "parquet")]
+
+    print(f"{'報表類型':<16}{'後端':<10}{'格式':<9}{'秒':>9}{'相對 openpyxl':>15}")
+    for file_type in REPORT_TYPES:
+        payloads = encode(generate_report(file_type, args.rows))
+        baseline = None
+        for backend_name, file_format in plans:
+            backend = BACKENDS[backend_name]
+            if not backend.is_available() or file_format not in payloads:
+                print(f"{file_type:<16}{backend_name:<10}{file_format:<9}{'(未安裝)':>9}")
+                continue
+            content = payloads[file_format]
+            seconds = timeit(lambda: backend.read(content), args.repeat)
+            baseline = baseline or seconds
+            print(f"{file_type:<16}{backend_name:<10}{file_format:<9}{seconds:>9.3f}{baseline / seconds:>14.1f}x")
+
+
+if __name__ == "__main__":
+    main()
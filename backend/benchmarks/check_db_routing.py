@@ -0,0 +1,38 @@
+"""
+檢查資料庫路由設定
+以兩個本機 PostgreSQL 實例測試，例如:
+    DATABASE_URL=postgresql://postgres@localhost:5432/dms \
+    DATABASE_REPLICA_URL=postgresql://postgres@localhost:5433/dms \
+    python -m benchmarks.check_db_routing
+"""
+from sqlalchemy import text
+
+from database import SessionLocal, ReportsSessionLocal, PerformanceSessionLocal, POOL_OPTIONS
+
+ROUTE_SESSIONS = {
+    "ingest": SessionLocal,
+    "reports": ReportsSessionLocal,
+    "performance": PerformanceSessionLocal,
+}
+
+
+def main():
+    print(f"連線池設定: {POOL_OPTIONS}")
+    for route_class, factory in ROUTE_SESSIONS.items():
+        db = factory()
+        try:
+            row = db.execute(text("""
+                SELECT inet_server_port() AS port,
+                       pg_is_in_recovery() AS is_replica,
+                       current_setting('statement_timeout') AS statement_timeout
+            """)).one()
+            print(
+                f"{route_class:<12} port={row.port} replica={row.is_replica} "
+                f"statement_timeout={row.statement_timeout}"
+            )
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
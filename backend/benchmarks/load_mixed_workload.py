@@ -0,0 +1,237 @@
+"""
+混合負載測試：上傳進行中時，儀表板讀取的延遲與吞吐量
+- 上傳：以產生的報表檔案持續呼叫 POST /api/upload/excel
+- 讀取：多個模擬使用者依權重隨機呼叫 /api/performance/* 與 /api/reports/*
+- 輸出各路由的 p50 / p95 / p99 延遲與吞吐量，並與儲存的基準比較
+需先以本機 PostgreSQL 啟動 API（會寫入測試資料，請使用測試資料庫）:
+    uvicorn main:app --port 8080
+使用方式（於 backend 目錄下）:
+    python -m benchmarks.load_mixed_workload --duration 60 --readers 20 --save-baseline benchmarks/load_baseline.json
+    python -m benchmarks.load_mixed_workload --duration 60 --readers 20 --baseline benchmarks/load_baseline.json
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from io import BytesIO
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.bench_readers import REPORT_TYPES, generate_report
+
+UPLOAD_ROUTE = "POST /api/upload/excel"
+FACTORY_CODES = ["AMA", "AMC", "AMD"]
+
+
+def read_routes(today: date) -> List[Tuple[str, str, int]]:
+    """(路由名稱, 路徑, 權重)；路由名稱不含查詢參數，用於彙總"""
+    start = (today - timedelta(days=90)).isoformat()
+    end = today.isoformat()
+    year_ago = (today - timedelta(days=365)).isoformat()
+    return [
+        ("GET /api/performance/summary", "/api/performance/summary", 4),
+        ("GET /api/performance/factory", f"/api/performance/factory?start_date={start}&end_date={end}", 4),
+        ("GET /api/performance/technician", "/api/performance/technician?factory_code={factory}", 2),
+        ("GET /api/performance/technician/leaderboard", "/api/performance/technician/leaderboard?top_n=10", 3),
+        ("GET /api/performance/trend", f"/api/performance/trend?start_date={year_ago}&end_date={end}&bucket=week", 3),
+        ("GET /api/performance/part-category-analysis", "/api/performance/part-category-analysis", 2),
+        ("GET /api/reports/part-shipments", "/api/reports/part-shipments?factory_code={factory}&limit=100", 2),
+        ("GET /api/reports/part-sales", "/api/reports/part-sales?factory_code={factory}&limit=100", 2),
+        ("GET /api/reports/maintenance-income", "/api/reports/maintenance-income?factory_code={factory}&limit=100", 2),
+    ]
+
+
+class Recorder:
+    """各路由的延遲樣本與錯誤數（多執行緒共用）"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, seconds: float, ok: bool):
+        with self._lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def request(url: str, data: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None, timeout: float = 300) -> bool:
+    req = urllib.request.Request(url, data=data, headers=headers or {}, method="POST" if data else "GET")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status < 400
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+def multipart(file_name: str, content: bytes) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="files"; filename="{urllib.parse.quote(file_name)}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode("utf-8")
+    return head + content + f"\r\n--{boundary}--\r\n".encode("utf-8"), f"multipart/form-data; boundary={boundary}"
+
+
+def workbook(df, file_format: str) -> bytes:
+    if file_format == "csv":
+        return df.to_csv(index=False).encode("utf-8-sig")
+    buffer = BytesIO()
+    df.to_excel(buffer, index=False, engine="openpyxl")
+    return buffer.getvalue()
+
+
+def uploader(base_url: str, args, recorder: Recorder, stop: threading.Event, worker: int):
+    """依 --upload-interval 持續上傳新產生的報表（每份內容不同，不會被判定為重複）"""
+    rng = random.Random(1000 + worker)
+    file_types = [t for t in REPORT_TYPES if t != "Shelf Life Code"]
+    n = 0
+    while not stop.is_set():
+        file_type = rng.choice(file_types)
+        factory = rng.choice(FACTORY_CODES)
+        df = generate_report(file_type, args.rows, seed=rng.randrange(1 << 30)).drop(columns=["廠別"])
+        body, content_type = multipart(
+            f"{factory}_{file_type}_load{worker}_{n}.{args.upload_format}", workbook(df, args.upload_format)
+        )
+        n += 1
+
+        started = time.perf_counter()
+        ok = request(f"{base_url}/api/upload/excel", body, {"Content-Type": content_type})
+        recorder.record(UPLOAD_ROUTE, time.perf_counter() - started, ok)
+        stop.wait(max(0.0, args.upload_interval - (time.perf_counter() - started)))
+
+
+def reader(base_url: str, args, routes, recorder: Recorder, stop: threading.Event, worker: int):
+    """模擬儀表板使用者：依權重挑選路由，兩次請求間隔 1 / read_rate 秒"""
+    rng = random.Random(worker)
+    names, paths, weights = zip(*routes)
+    interval = 1.0 / args.read_rate if args.read_rate > 0 else 0.0
+    while not stop.is_set():
+        idx = rng.choices(range(len(names)), weights=weights)[0]
+        path = paths[idx].replace("{factory}", rng.choice(FACTORY_CODES))
+
+        started = time.perf_counter()
+        ok = request(f"{base_url}{path}", timeout=60)
+        elapsed = time.perf_counter() - started
+        recorder.record(names[idx], elapsed, ok)
+        if interval:
+            stop.wait(max(0.0, interval - elapsed))
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    idx = min(len(sorted_samples) - 1, max(0, int(round(q / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[idx]
+
+
+def summarize(recorder: Recorder, duration: float) -> Dict[str, Dict[str, float]]:
+    report = {}
+    for route, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        report[route] = {
+            "count": len(ordered),
+            "errors": recorder.errors.get(route, 0),
+            "error_rate": round(recorder.errors.get(route, 0) / len(ordered), 4),
+            "throughput": round(len(ordered) / duration, 3),
+            "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+            "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+            "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+        }
+    return report
+
+
+def compare(report: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """延遲（p95 / p99）高於基準或吞吐量低於基準超過 tolerance，或錯誤率升高時視為退步"""
+    regressions = []
+    for route, current in report.items():
+        base = baseline.get(route)
+        if not base:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if base[key] and current[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{route} {key}: {base[key]} -> {current[key]}")
+        if base["throughput"] and current["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{route} throughput: {base['throughput']} -> {current['throughput']}")
+        if current["error_rate"] > base.get("error_rate", 0):
+            regressions.append(f"{route} error_rate: {base.get('error_rate', 0)} -> {current['error_rate']}")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="上傳與儀表板讀取的混合負載測試")
+    arg_parser.add_argument("--base-url", default="http://127.0.0.1:8080")
+    arg_parser.add_argument("--duration", type=float, default=60, help="測試秒數")
+    arg_parser.add_argument("--readers", type=int, default=20, help="同時在線的儀表板使用者數")
+    arg_parser.add_argument("--read-rate", type=float, default=1.0, help="每位使用者每秒請求數（0 = 不間斷）")
+    arg_parser.add_argument("--uploaders", type=int, default=1, help="同時上傳的使用者數（0 = 只測讀取）")
+    arg_parser.add_argument("--upload-interval", type=float, default=5.0, help="每位上傳者兩次上傳的間隔秒數")
+    arg_parser.add_argument("--upload-format", choices=["xlsx", "csv"], default="xlsx")
+    arg_parser.add_argument("--rows", type=int, default=5000, help="每份上傳的資料行數")
+    arg_parser.add_argument("--baseline", default=None, help="與此基準檔比較，退步時結束碼為 1")
+    arg_parser.add_argument("--save-baseline", default=None, help="將本次結果存為基準檔")
+    arg_parser.add_argument("--tolerance", type=float, default=0.2, help="允許的退步比例")
+    args = arg_parser.parse_args()
+
+    base_url = args.base_url.rstrip("/")
+    routes = read_routes(date.today())
+    recorder = Recorder()
+    stop = threading.Event()
+
+    threads = [
+        threading.Thread(target=uploader, args=(base_url, args, recorder, stop, i), daemon=True)
+        for i in range(args.uploaders)
+    ] + [
+        threading.Thread(target=reader, args=(base_url, args, routes, recorder, stop, i), daemon=True)
+        for i in range(args.readers)
+    ]
+    print(
+        f"{args.readers} 位讀取者（每人 {args.read_rate}/s）、{args.uploaders} 位上傳者"
+        f"（每 {args.upload_interval}s 一份 {args.rows} 行 {args.upload_format}），持續 {args.duration:.0f}s"
+    )
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(args.duration)
+    stop.set()
+    for thread in threads:
+        # 上傳可能仍在進行，等待其完成以記錄延遲
+        thread.join()
+    duration = time.perf_counter() - started
+
+    report = summarize(recorder, duration)
+    print(f"\n{'路由':<46}{'次數':>7}{'錯誤':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, row in report.items():
+        print(
+            f"{route:<46}{row['count']:>7}{row['errors']:>6}{row['throughput']:>9.2f}"
+            f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+        )
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "routes": report}, f, ensure_ascii=False, indent=2)
+        print(f"\n已儲存基準: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline["routes"], args.tolerance)
+        if regressions:
+            print(f"\n與基準相比退步（容許 {args.tolerance:.0%}）:")
+            for line in regressions:
+                print(f"  {line}")
+            raise SystemExit(1)
+        print(f"\n與基準相比沒有退步（容許 {args.tolerance:.0%}）")
+
+
+if __name__ == "__main__":
+    main()
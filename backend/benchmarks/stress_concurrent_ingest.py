@@ -0,0 +1,181 @@
+"""
+並行匯入壓力測試（需要本機 PostgreSQL，會寫入測試廠別 ST01、ST02…）
+- 多個廠別、同一廠別多份報表同時匯入，共用工單號與零件編號
+- 檢查：沒有失敗的交易 / 死結、每份上傳的筆數正確、工單沒有重複
+- 不同廠別應並行完成；同一 (廠別, 報表類型) 依序排隊
+- 另有超過連線池大小（pool_size + max_overflow）的上傳排隊等待同一把匯入鎖：
+  等待者各占一條連線時，持有鎖的請求不可再向連線池要連線
+使用方式（於 backend 目錄下）:
+    RAW_ARCHIVE_ENABLED=false DATABASE_URL=postgresql://postgres@localhost:5432/dms \
+    python -m benchmarks.stress_concurrent_ingest --factories 4 --uploads 3 --rows 2000 --cleanup
+"""
+import argparse
+import asyncio
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from fastapi import BackgroundTasks
+from sqlalchemy import text
+
+import crud
+from database import POOL_OPTIONS, SessionLocal
+from routers.upload import ingest_file
+from benchmarks.bench_readers import generate_report
+
+# 共用工單 / 零件的報表類型（同一廠別不同類型會同時建立相同工單）
+STRESS_FILE_TYPES = ["零件出貨", "零件銷售", "技師績效", "維修收入"]
+
+
+def build_uploads(factories: int, uploads: int, rows: int, queued: int) -> List[Tuple[str, str, bytes]]:
+    """
+    每個廠別、每種報表類型各產生 uploads 份（不含廠別欄位，廠別由檔名識別）
+    另產生 queued 份同一 (廠別, 報表類型) 的上傳，全部排隊等待同一把匯入鎖
+    """
+    plan = []
+    for n in range(queued):
+        df = generate_report("零件銷售", rows, seed=900000 + n).drop(columns=["廠別"])
+        plan.append(("STQ", f"STQ_零件銷售_{n}.csv", df.to_csv(index=False).encode("utf-8-sig")))
+    for f in range(factories):
+        code = f"ST{f + 1:02d}"
+        for file_type in STRESS_FILE_TYPES:
+            for n in range(uploads):
+                # 同一廠別的各份報表使用相同的亂數種子範圍：工單號大量重疊
+                df = generate_report(file_type, rows, seed=f * 1000 + n).drop(columns=["廠別"])
+                plan.append((code, f"{code}_{file_type}_{n}.csv", df.to_csv(index=False).encode("utf-8-sig")))
+    return plan
+
+
+def register_factories(codes):
+    """測試廠別須先登錄在 factories，檔名才能識別廠別"""
+    db = SessionLocal()
+    try:
+        with crud.atomic(db):
+            for code in codes:
+                crud.ensure_factory(db, code)
+    finally:
+        db.close()
+
+
+def run_upload(code: str, file_name: str, content: bytes, barrier: threading.Barrier) -> dict:
+    file_hash = hashlib.sha256(content).hexdigest()
+    db = SessionLocal()
+    barrier.wait()
+    started = time.perf_counter()
+    try:
+        results = asyncio.run(ingest_file(file_name, content, file_hash, False, None, BackgroundTasks(), db))
+        return {
+            "factory": code, "file_name": file_name, "file_hash": file_hash, "ok": True,
+            "records": sum(r.record_count for r in results), "seconds": time.perf_counter() - started,
+        }
+    except Exception as e:
+        return {
+            "factory": code, "file_name": file_name, "file_hash": file_hash, "ok": False,
+            "error": f"{type(e).__name__}: {getattr(e, 'detail', e)}", "seconds": time.perf_counter() - started,
+        }
+    finally:
+        db.close()
+
+
+def verify(results: List[dict]) -> List[str]:
+    """比對資料庫中的筆數，並確認工單沒有重複"""
+    problems = []
+    db = SessionLocal()
+    try:
+        for result in results:
+            if not result["ok"]:
+                continue
+            stored = db.execute(text("""
+                SELECT (SELECT COUNT(*) FROM part_shipments WHERE file_upload_id = :h)
+                     + (SELECT COUNT(*) FROM part_sales WHERE file_upload_id = :h)
+                     + (SELECT COUNT(*) FROM technician_performance WHERE file_upload_id = :h)
+                     + (SELECT COUNT(*) FROM maintenance_income WHERE file_upload_id = :h)
+            """), {"h": result["file_hash"]}).scalar()
+            if stored != result["records"]:
+                problems.append(f"{result['file_name']}: 回報 {result['records']} 筆，資料庫 {stored} 筆")
+        duplicates = db.execute(text("""
+            SELECT COUNT(*) FROM (
+                SELECT factory_code, order_number FROM work_orders
+                WHERE factory_code LIKE 'ST%'
+                GROUP BY factory_code, order_number HAVING COUNT(*) > 1
+            ) d
+        """)).scalar()
+        if duplicates:
+            problems.append(f"重複的工單: {duplicates}")
+    finally:
+        db.close()
+    return problems
+
+
+def cleanup(results: List[dict]):
+    db = SessionLocal()
+    try:
+        with crud.atomic(db):
+            for result in results:
+                upload = crud.get_file_by_hash(db, result["file_hash"])
+                if upload:
+                    crud.delete_file_upload(db, upload)
+            db.execute(text("DELETE FROM row_fingerprints WHERE factory_code LIKE 'ST%'"))
+    finally:
+        db.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="並行匯入壓力測試")
+    arg_parser.add_argument("--factories", type=int, default=4)
+    arg_parser.add_argument("--uploads", type=int, default=3, help="每個 (廠別, 報表類型) 的上傳數")
+    arg_parser.add_argument("--rows", type=int, default=2000)
+    pool_limit = POOL_OPTIONS["pool_size"] + POOL_OPTIONS["max_overflow"]
+    arg_parser.add_argument(
+        "--queued", type=int, default=pool_limit + 1,
+        help=f"同一 (廠別, 報表類型) 排隊的上傳數（預設超過連線池上限 {pool_limit}）"
+    )
+    arg_parser.add_argument("--workers", type=int, default=0, help="並行數（預設全部同時開始）")
+    arg_parser.add_argument("--cleanup", action="store_true", help="結束後刪除測試上傳")
+    args = arg_parser.parse_args()
+
+    plan = build_uploads(args.factories, args.uploads, args.rows, args.queued)
+    register_factories(sorted({code for code, _, _ in plan}))
+    workers = args.workers or len(plan)
+    print(
+        f"{len(plan)} 份上傳，{args.factories} 個廠別 + {args.queued} 份排隊於同一匯入鎖，"
+        f"每份 {args.rows} 行，並行 {workers}（連線池上限 {pool_limit}）"
+    )
+
+    barrier = threading.Barrier(min(workers, len(plan)))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda item: run_upload(*item, barrier), plan))
+    wall = time.perf_counter() - started
+
+    failed = [r for r in results if not r["ok"]]
+    for r in failed:
+        print(f"失敗 {r['file_name']}: {r['error']}")
+
+    print(f"{'廠別':<8}{'上傳數':>8}{'筆數':>10}{'累計秒':>10}{'最長秒':>10}")
+    for code in sorted({r["factory"] for r in results}):
+        rows = [r for r in results if r["factory"] == code and r["ok"]]
+        print(
+            f"{code:<8}{len(rows):>8}{sum(r['records'] for r in rows):>10}"
+            f"{sum(r['seconds'] for r in rows):>10.2f}{max((r['seconds'] for r in rows), default=0):>10.2f}"
+        )
+    serial = sum(r["seconds"] for r in results)
+    print(f"總耗時 {wall:.2f}s，各上傳累計 {serial:.2f}s（並行度 {serial / wall:.1f}x）")
+
+    problems = verify(results)
+    for problem in problems:
+        print(f"檢查失敗: {problem}")
+
+    if args.cleanup:
+        cleanup(results)
+        print("已刪除測試上傳")
+
+    if failed or problems:
+        raise SystemExit(1)
+    print("全部通過")
+
+
+if __name__ == "__main__":
+    main()
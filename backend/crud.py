@@ -1,10 +1,93 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import List, Optional
+from sqlalchemy import text, func, select, cast, Float
+from typing import Dict, List, Optional
 from datetime import date
+from contextlib import contextmanager
+import hashlib
+import json
 import models
 import schemas
 
+# ==========================================
+# 交易控制
+# ==========================================
+
+@contextmanager
+def atomic(db: Session):
+    """
+    單一交易區塊
+    - 區塊內的 CRUD 操作只 flush 不 commit
+    - 離開區塊時一次提交，發生錯誤則整批回滾
+    """
+    if db.info.get("atomic"):
+        yield db
+        return
+    
+    db.info["atomic"] = True
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.info.pop("atomic", None)
+        callbacks = db.info.pop("on_commit", [])
+    # 只在提交成功後執行（回滾時上面已重新拋出例外）
+    for callback in callbacks:
+        callback()
+
+def on_commit(db: Session, callback):
+    """交易區塊提交後執行 callback（例如更新程序內快取）；回滾時捨棄，區塊外立即執行"""
+    if db.info.get("atomic"):
+        db.info.setdefault("on_commit", []).append(callback)
+    else:
+        callback()
+
+def _commit(db: Session):
+    """交易區塊內只 flush，否則直接 commit"""
+    if db.info.get("atomic"):
+        db.flush()
+    else:
+        db.commit()
+
+# Advisory lock 命名空間（pg_advisory_xact_lock 的第一個鍵）
+ADVISORY_LOCK_FILE_HASH = 1
+ADVISORY_LOCK_FACTORY_INGEST = 2
+
+# 不分廠別的報表類型（寫入共用的 part_categories），鎖只依報表類型
+FACTORY_INDEPENDENT_FILE_TYPES = {"Shelf Life Code"}
+
+def ingest_lock_value(factory_code: str, file_type: Optional[str]) -> str:
+    """匯入鎖的鍵：(廠別, 報表類型)"""
+    if file_type in FACTORY_INDEPENDENT_FILE_TYPES:
+        return f"*:{file_type}"
+    return f"{factory_code}:{file_type}"
+
+def advisory_lock_key(value: str) -> int:
+    """字串轉為 advisory lock 的 int4 鍵（碰撞只會讓兩者互相等待）"""
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def try_advisory_xact_lock(db: Session, namespace: int, value: str) -> bool:
+    """
+    嘗試取得交易層級的 advisory lock（不等待）
+    鎖在目前交易提交或回滾時自動釋放
+    """
+    return bool(db.execute(
+        text("SELECT pg_try_advisory_xact_lock(:namespace, :key)"),
+        {"namespace": namespace, "key": advisory_lock_key(value)}
+    ).scalar())
+
+def _run_dimension_upsert(db: Session, query, params: dict) -> int:
+    """
+    維度資料（廠別 / 工單 / 零件分類 / 技師）的 upsert 在 session 本身的連線與交易中執行
+    - 不另外向連線池取得連線：排隊等待匯入鎖的請求各自占用連線時，持有鎖的請求仍能完成
+    - 各 upsert 依鍵排序寫入，並行的匯入以相同順序取得唯一索引上的鎖
+    - 匯入失敗回滾時，本次建立的維度資料一併回滾
+    """
+    return db.execute(query, params).rowcount
+
 # ==========================================
 # 基礎 CRUD 操作
 # ==========================================
@@ -19,16 +102,65 @@ def get_factory_by_code(db: Session, code: str) -> Optional[models.Factory]:
 
 def create_factory(db: Session, code: str, name: str) -> models.Factory:
     """創建新廠別"""
+    from utils.factory_registry import invalidate_factory_registry
     db_factory = models.Factory(code=code, name=name)
     db.add(db_factory)
-    db.commit()
+    _commit(db)
     db.refresh(db_factory)
+    invalidate_factory_registry()
     return db_factory
 
 # ==========================================
 # 工單操作
 # ==========================================
 
+def ensure_factory(db: Session, code: str, name: Optional[str] = None) -> bool:
+    """確保廠別存在（並行建立同一廠別時不報錯），回傳是否新建立"""
+    if get_factory_by_code(db, code):
+        return False
+    created = _run_dimension_upsert(db, text("""
+        INSERT INTO factories (code, name) VALUES (:code, :name)
+        ON CONFLICT (code) DO NOTHING
+    """), {"code": code, "name": name or code}) > 0
+    if created:
+        from utils.factory_registry import invalidate_factory_registry
+        # 提交後才重新載入，否則其他請求可能在提交前載入而看不到新廠別
+        on_commit(db, invalidate_factory_registry)
+    return created
+
+def upsert_work_orders(db: Session, factory_code: str, order_numbers) -> Dict[str, int]:
+    """
+    批量確保工單存在，回傳 order_number -> work_order id
+    - 依工單號排序寫入，並行的請求以相同順序取得唯一索引上的鎖
+    - ON CONFLICT DO NOTHING：其他請求同時建立同一工單時不會讓交易失敗
+    """
+    keys = sorted(set(order_numbers))
+    if not keys:
+        return {}
+    _run_dimension_upsert(db, text("""
+        INSERT INTO work_orders (factory_code, order_number)
+        SELECT :factory_code, o FROM unnest(CAST(:keys AS VARCHAR[])) AS o
+        ORDER BY o
+        ON CONFLICT (factory_code, order_number) DO NOTHING
+    """), {"factory_code": factory_code, "keys": keys})
+    result = db.execute(text("""
+        SELECT id, order_number FROM work_orders
+        WHERE factory_code = :factory_code AND order_number = ANY(:keys)
+    """), {"factory_code": factory_code, "keys": keys})
+    return {row.order_number: row.id for row in result}
+
+def upsert_part_categories(db: Session, part_numbers, category: str = "未分類"):
+    """批量確保零件分類存在（已存在者不變更），排序寫入避免死結"""
+    keys = sorted(set(part_numbers))
+    if not keys:
+        return
+    _run_dimension_upsert(db, text("""
+        INSERT INTO part_categories (part_number, category)
+        SELECT p, :category FROM unnest(CAST(:keys AS VARCHAR[])) AS p
+        ORDER BY p
+        ON CONFLICT (part_number) DO NOTHING
+    """), {"category": category, "keys": keys})
+
 def get_or_create_work_order(db: Session, factory_code: str, order_number: str) -> models.WorkOrder:
     """獲取或創建工單"""
     work_order = db.query(models.WorkOrder).filter(
@@ -42,7 +174,7 @@ def get_or_create_work_order(db: Session, factory_code: str, order_number: str)
             order_number=order_number
         )
         db.add(work_order)
-        db.commit()
+        _commit(db)
         db.refresh(work_order)
     
     return work_order
@@ -71,7 +203,7 @@ def get_or_create_part_category(
             description=description
         )
         db.add(part_cat)
-        db.commit()
+        _commit(db)
         db.refresh(part_cat)
     
     return part_cat
@@ -98,7 +230,7 @@ def update_part_category_from_shelf_life(
         )
         db.add(part_cat)
     
-    db.commit()
+    _commit(db)
     db.refresh(part_cat)
     return part_cat
 
@@ -131,32 +263,173 @@ def create_file_upload(
         status=status
     )
     db.add(file_upload)
-    db.commit()
+    _commit(db)
     db.refresh(file_upload)
     return file_upload
 
-def delete_records_by_upload_id(db: Session, upload_id: int, file_type: str):
-    """根據上傳ID刪除舊記錄（用於覆蓋）"""
-    upload_id_str = str(upload_id)
-    
-    if file_type == "零件出貨":
-        db.query(models.PartShipment).filter(
-            models.PartShipment.file_upload_id == upload_id_str
-        ).delete()
-    elif file_type == "零件銷售":
-        db.query(models.PartSale).filter(
-            models.PartSale.file_upload_id == upload_id_str
-        ).delete()
-    elif file_type == "技師績效":
-        db.query(models.TechnicianPerformance).filter(
-            models.TechnicianPerformance.file_upload_id == upload_id_str
-        ).delete()
-    elif file_type == "維修收入":
-        db.query(models.MaintenanceIncome).filter(
-            models.MaintenanceIncome.file_upload_id == upload_id_str
-        ).delete()
-    
-    db.commit()
+FACT_MODELS = [
+    models.PartShipment,
+    models.PartSale,
+    models.TechnicianPerformance,
+    models.MaintenanceIncome,
+]
+
+def get_file_upload(db: Session, upload_id: int) -> Optional[models.FileUpload]:
+    """根據 ID 查詢上傳記錄"""
+    return db.query(models.FileUpload).filter(models.FileUpload.id == upload_id).first()
+
+def delete_records_by_upload_id(
+    db: Session,
+    file_hash: str,
+    factory_code: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    刪除某次上傳寫入的所有資料（用於覆蓋 / 撤銷上傳）
+    - 事實資料表的 file_upload_id 存放的是檔案雜湊值
+    - 每張表一個 set-based DELETE，走 file_upload_id 索引
+    - 一併刪除資料行指紋，讓相同資料可重新匯入
+    """
+    deleted = {}
+    
+    for model in FACT_MODELS + [models.RowFingerprint]:
+        query = db.query(model).filter(model.file_upload_id == file_hash)
+        if factory_code:
+            query = query.filter(model.factory_code == factory_code)
+        deleted[model.__tablename__] = query.delete(synchronize_session=False)
+    
+    _commit(db)
+    return deleted
+
+def delete_file_upload(db: Session, file_upload: models.FileUpload) -> Dict[str, int]:
+    """撤銷上傳：刪除其所有資料與上傳記錄"""
+    deleted = delete_records_by_upload_id(db, file_upload.file_hash, file_upload.factory_code)
+    
+    # 直接下 DELETE，讓同一交易中可立即寫入相同雜湊值的新記錄
+    db.query(models.FileUpload).filter(
+        models.FileUpload.id == file_upload.id
+    ).delete(synchronize_session=False)
+    _commit(db)
+    
+    return deleted
+
+# ==========================================
+# 資料版本（ETag 使用）
+# ==========================================
+
+def get_data_version(db: Session) -> int:
+    """查詢目前資料版本"""
+    version = db.execute(text("SELECT version FROM data_versions WHERE id = 1")).scalar()
+    return version or 0
+
+def bump_data_version(db: Session) -> int:
+    """資料異動後遞增版本（在匯入交易中執行，提交後才對讀取端生效）"""
+    version = db.execute(text("""
+        INSERT INTO data_versions (id, version) VALUES (1, 1)
+        ON CONFLICT (id) DO UPDATE SET version = data_versions.version + 1, updated_at = CURRENT_TIMESTAMP
+        RETURNING version
+    """)).scalar()
+    _commit(db)
+    return version
+
+# ==========================================
+# 資料行指紋（增量匯入）
+# ==========================================
+
+def get_row_fingerprints_since(
+    db: Session,
+    factory_code: str,
+    file_type: str,
+    since_id: int = 0
+) -> List[tuple]:
+    """查詢指定 ID 之後新增的資料行指紋，回傳 (id, row_hash)"""
+    query = text("""
+        SELECT id, row_hash FROM row_fingerprints
+        WHERE factory_code = :factory_code AND file_type = :file_type AND id > :since_id
+        ORDER BY id
+    """)
+    result = db.execute(query, {
+        "factory_code": factory_code,
+        "file_type": file_type,
+        "since_id": since_id
+    })
+    return [tuple(row) for row in result]
+
+def get_existing_row_fingerprints(
+    db: Session,
+    factory_code: str,
+    file_type: str,
+    row_hashes: List[int]
+) -> List[int]:
+    """確認哪些指紋已存在（走唯一索引）"""
+    if not row_hashes:
+        return []
+    query = text("""
+        SELECT row_hash FROM row_fingerprints
+        WHERE factory_code = :factory_code AND file_type = :file_type
+          AND row_hash = ANY(:row_hashes)
+    """)
+    result = db.execute(query, {
+        "factory_code": factory_code,
+        "file_type": file_type,
+        "row_hashes": row_hashes
+    })
+    return [row.row_hash for row in result]
+
+def bulk_insert_row_fingerprints(
+    db: Session,
+    factory_code: str,
+    file_type: str,
+    row_hashes: List[int],
+    file_hash: str
+):
+    """批量寫入資料行指紋（已存在者略過）"""
+    query = text("""
+        INSERT INTO row_fingerprints (factory_code, file_type, row_hash, file_upload_id)
+        SELECT :factory_code, :file_type, h, :file_hash FROM unnest(CAST(:row_hashes AS BIGINT[])) AS h
+        ON CONFLICT (factory_code, file_type, row_hash) DO NOTHING
+    """)
+    db.execute(query, {
+        "factory_code": factory_code,
+        "file_type": file_type,
+        "row_hashes": row_hashes,
+        "file_hash": file_hash
+    })
+    _commit(db)
+
+# ==========================================
+# 報表版型
+# ==========================================
+
+def get_report_templates(db: Session, signatures: List[str]) -> List[models.ReportTemplate]:
+    """依標題列指紋查詢已記錄的報表版型"""
+    if not signatures:
+        return []
+    return db.query(models.ReportTemplate).filter(
+        models.ReportTemplate.signature.in_(signatures)
+    ).all()
+
+def create_report_template(
+    db: Session,
+    signature: str,
+    file_type: str,
+    header_row: int,
+    column_mapping: Dict[str, str],
+    factory_column: Optional[str]
+):
+    """記錄新的報表版型（其他請求已記錄同一指紋時略過）"""
+    query = text("""
+        INSERT INTO report_templates (signature, file_type, header_row, column_mapping, factory_column)
+        VALUES (:signature, :file_type, :header_row, CAST(:column_mapping AS JSONB), :factory_column)
+        ON CONFLICT (signature) DO NOTHING
+    """)
+    db.execute(query, {
+        "signature": signature,
+        "file_type": file_type,
+        "header_row": header_row,
+        "column_mapping": json.dumps(column_mapping, ensure_ascii=False),
+        "factory_column": factory_column
+    })
+    _commit(db)
 
 # ==========================================
 # 業績查詢操作
@@ -189,6 +462,262 @@ def get_technician_performance_summary(db: Session, factory_code: Optional[str]
     
     return [dict(row._mapping) for row in result]
 
+def get_technician_leaderboard(
+    db: Session,
+    start_date: date,
+    end_date: date,
+    previous_start_date: date,
+    factory_code: Optional[str] = None,
+    top_n: int = 10
+) -> List[dict]:
+    """
+    技師排行榜（各廠前 N 名）
+    - 本期與上期在同一次索引範圍掃描中以 FILTER 分別彙總
+    - 排名、百分位數、上期排名皆以視窗函數在資料庫計算
+    """
+    query = text("""
+        WITH period AS (
+            SELECT
+                tp.factory_code,
+                tp.technician_name,
+                COUNT(*) FILTER (WHERE tp.performance_date >= :start_date) > 0 AS has_current,
+                COUNT(DISTINCT tp.order_number) FILTER (WHERE tp.performance_date >= :start_date) AS total_orders,
+                COALESCE(SUM(tp.work_hours) FILTER (WHERE tp.performance_date >= :start_date), 0) AS total_hours,
+                COALESCE(SUM(tp.salary + tp.bonus) FILTER (WHERE tp.performance_date >= :start_date), 0) AS total_income,
+                SUM(tp.salary + tp.bonus) FILTER (WHERE tp.performance_date < :start_date) AS previous_income
+            FROM technician_performance tp
+            WHERE tp.performance_date BETWEEN :previous_start_date AND :end_date
+              AND (CAST(:factory_code AS VARCHAR) IS NULL OR tp.factory_code = :factory_code)
+            GROUP BY tp.factory_code, tp.technician_name
+        ),
+        ranked AS (
+            SELECT
+                period.*,
+                RANK() OVER (
+                    PARTITION BY factory_code, has_current ORDER BY total_income DESC
+                ) AS rank,
+                PERCENT_RANK() OVER (
+                    PARTITION BY factory_code, has_current ORDER BY total_income
+                ) AS percentile,
+                COUNT(*) OVER (PARTITION BY factory_code, has_current) AS technician_count,
+                CASE WHEN previous_income IS NOT NULL THEN RANK() OVER (
+                    PARTITION BY factory_code, previous_income IS NOT NULL ORDER BY previous_income DESC
+                ) END AS previous_rank
+            FROM period
+        )
+        SELECT
+            r.factory_code,
+            f.name AS factory_name,
+            r.technician_name,
+            r.rank,
+            r.percentile,
+            r.technician_count,
+            r.total_orders,
+            r.total_hours,
+            r.total_income,
+            r.previous_income,
+            r.previous_rank,
+            r.total_income - COALESCE(r.previous_income, 0) AS income_change,
+            CASE WHEN r.previous_income > 0
+                THEN (r.total_income - r.previous_income) / r.previous_income
+            END AS income_change_ratio
+        FROM ranked r
+        LEFT JOIN factories f ON f.code = r.factory_code
+        WHERE r.has_current AND r.rank <= :top_n
+        ORDER BY r.factory_code, r.rank, r.technician_name
+    """)
+    result = db.execute(query, {
+        "start_date": start_date,
+        "end_date": end_date,
+        "previous_start_date": previous_start_date,
+        "factory_code": factory_code,
+        "top_n": top_n
+    })
+    return [dict(row._mapping) for row in result]
+
+TREND_BUCKET_STEPS = {
+    "day": "1 day",
+    "week": "1 week",
+    "month": "1 month",
+}
+
+def get_performance_trend(
+    db: Session,
+    start_date: date,
+    end_date: date,
+    bucket: str = "month",
+    factory_code: Optional[str] = None
+) -> List[dict]:
+    """
+    業績趨勢（依日 / 週 / 月分桶）
+    - 四張事實資料表各自以 date_trunc 在資料庫彙總
+    - generate_series 補齊沒有資料的區間
+    """
+    query = text("""
+        WITH buckets AS (
+            SELECT CAST(generate_series(
+                date_trunc(:bucket, CAST(:start_date AS TIMESTAMP)),
+                date_trunc(:bucket, CAST(:end_date AS TIMESTAMP)),
+                CAST(:step AS INTERVAL)
+            ) AS DATE) AS bucket
+        ),
+        factory_list AS (
+            SELECT code AS factory_code FROM factories
+            WHERE CAST(:factory_code AS VARCHAR) IS NULL OR code = :factory_code
+        ),
+        facts AS (
+            SELECT factory_code, CAST(date_trunc(:bucket, income_date) AS DATE) AS bucket,
+                   SUM(amount) AS income, 0 AS parts_sales, 0 AS parts_shipments, 0 AS labor_cost
+            FROM maintenance_income
+            WHERE income_date BETWEEN :start_date AND :end_date
+              AND (CAST(:factory_code AS VARCHAR) IS NULL OR factory_code = :factory_code)
+            GROUP BY 1, 2
+            UNION ALL
+            SELECT factory_code, CAST(date_trunc(:bucket, sale_date) AS DATE),
+                   0, SUM(amount), 0, 0
+            FROM part_sales
+            WHERE sale_date BETWEEN :start_date AND :end_date
+              AND (CAST(:factory_code AS VARCHAR) IS NULL OR factory_code = :factory_code)
+            GROUP BY 1, 2
+            UNION ALL
+            SELECT factory_code, CAST(date_trunc(:bucket, shipment_date) AS DATE),
+                   0, 0, SUM(amount), 0
+            FROM part_shipments
+            WHERE shipment_date BETWEEN :start_date AND :end_date
+              AND (CAST(:factory_code AS VARCHAR) IS NULL OR factory_code = :factory_code)
+            GROUP BY 1, 2
+            UNION ALL
+            SELECT factory_code, CAST(date_trunc(:bucket, performance_date) AS DATE),
+                   0, 0, 0, SUM(salary + bonus)
+            FROM technician_performance
+            WHERE performance_date BETWEEN :start_date AND :end_date
+              AND (CAST(:factory_code AS VARCHAR) IS NULL OR factory_code = :factory_code)
+            GROUP BY 1, 2
+        ),
+        aggregated AS (
+            SELECT factory_code, bucket,
+                   SUM(income) AS income,
+                   SUM(parts_sales) AS parts_sales,
+                   SUM(parts_shipments) AS parts_shipments,
+                   SUM(labor_cost) AS labor_cost
+            FROM facts
+            GROUP BY factory_code, bucket
+        )
+        SELECT
+            fl.factory_code,
+            b.bucket,
+            COALESCE(a.income, 0) AS income,
+            COALESCE(a.parts_sales, 0) AS parts_sales,
+            COALESCE(a.parts_shipments, 0) AS parts_shipments,
+            COALESCE(a.labor_cost, 0) AS labor_cost
+        FROM factory_list fl
+        CROSS JOIN buckets b
+        LEFT JOIN aggregated a ON a.factory_code = fl.factory_code AND a.bucket = b.bucket
+        ORDER BY fl.factory_code, b.bucket
+    """)
+    result = db.execute(query, {
+        "start_date": start_date,
+        "end_date": end_date,
+        "bucket": bucket,
+        "step": TREND_BUCKET_STEPS[bucket],
+        "factory_code": factory_code
+    })
+    return [dict(row._mapping) for row in result]
+
+# 批次業績查詢：事實資料表 -> (日期欄位, {指標: 彙總運算式})
+BATCH_METRIC_SOURCES = {
+    "maintenance_income": ("income_date", {
+        "income": "SUM(amount)",
+        "order_count": "COUNT(DISTINCT order_number)",
+    }),
+    "part_sales": ("sale_date", {
+        "parts_sales": "SUM(amount)",
+    }),
+    "part_shipments": ("shipment_date", {
+        "parts_shipments": "SUM(amount)",
+    }),
+    "technician_performance": ("performance_date", {
+        "labor_cost": "SUM(salary + bonus)",
+        "work_hours": "SUM(work_hours)",
+        "technician_count": "COUNT(DISTINCT technician_name)",
+    }),
+}
+
+# 衍生指標及其所需的基本指標
+BATCH_DERIVED_METRICS = {
+    "net_profit": ("income", "labor_cost"),
+}
+
+BATCH_METRICS = [
+    metric for _, metrics in BATCH_METRIC_SOURCES.values() for metric in metrics
+] + list(BATCH_DERIVED_METRICS)
+
+def get_batch_performance(
+    db: Session,
+    specs: List[dict],
+    metrics: List[str]
+) -> List[dict]:
+    """
+    批次業績查詢
+    - 所有 (廠別, 起日, 迄日) 以 unnest 陣列組成一張 specs 表
+    - 每張事實資料表以 LATERAL 子查詢對每個 spec 走 (factory_code, 日期) 索引彙總
+    - 只查詢所需指標的資料表，一次往返取得全部結果
+    """
+    needed = set(metrics)
+    for metric in metrics:
+        needed.update(BATCH_DERIVED_METRICS.get(metric, ()))
+    
+    select_columns = []
+    joins = []
+    for table, (date_column, table_metrics) in BATCH_METRIC_SOURCES.items():
+        wanted = [m for m in table_metrics if m in needed]
+        if not wanted:
+            continue
+        alias = f"m_{table}"
+        aggregates = ", ".join(f"{table_metrics[m]} AS {m}" for m in wanted)
+        joins.append(f"""
+            LEFT JOIN LATERAL (
+                SELECT {aggregates}
+                FROM {table} t
+                WHERE t.factory_code = s.factory_code
+                  AND t.{date_column} BETWEEN s.start_date AND s.end_date
+            ) {alias} ON TRUE""")
+        select_columns.extend(f"COALESCE({alias}.{m}, 0) AS {m}" for m in wanted)
+    
+    for metric, (left, right) in BATCH_DERIVED_METRICS.items():
+        if metric in needed:
+            select_columns.append(
+                f"COALESCE(m_maintenance_income.{left}, 0) - COALESCE(m_technician_performance.{right}, 0) AS {metric}"
+            )
+    
+    query = text(f"""
+        SELECT s.spec_index, s.factory_code, s.start_date, s.end_date
+               {"".join(", " + column for column in select_columns)}
+        FROM unnest(
+            CAST(:spec_indexes AS INTEGER[]),
+            CAST(:factory_codes AS VARCHAR[]),
+            CAST(:start_dates AS DATE[]),
+            CAST(:end_dates AS DATE[])
+        ) AS s(spec_index, factory_code, start_date, end_date)
+        {"".join(joins)}
+        ORDER BY s.spec_index
+    """)
+    result = db.execute(query, {
+        "spec_indexes": list(range(len(specs))),
+        "factory_codes": [spec["factory_code"] for spec in specs],
+        "start_dates": [spec["start_date"] for spec in specs],
+        "end_dates": [spec["end_date"] for spec in specs],
+    })
+    
+    rows = []
+    for row in result:
+        item = dict(row._mapping)
+        item["metrics"] = {metric: item.pop(metric) for metric in metrics}
+        for metric in needed - set(metrics):
+            item.pop(metric, None)
+        rows.append(item)
+    return rows
+
 def get_part_sales_summary(db: Session, category: Optional[str] = None) -> List[dict]:
     """獲取零件銷售統計"""
     if category:
@@ -214,22 +743,22 @@ def get_part_sales_summary(db: Session, category: Optional[str] = None) -> List[
 def bulk_insert_part_shipments(db: Session, shipments: List[models.PartShipment]):
     """批量插入零件出貨記錄"""
     db.bulk_save_objects(shipments)
-    db.commit()
+    _commit(db)
 
 def bulk_insert_part_sales(db: Session, sales: List[models.PartSale]):
     """批量插入零件銷售記錄"""
     db.bulk_save_objects(sales)
-    db.commit()
+    _commit(db)
 
 def bulk_insert_technician_performance(db: Session, performances: List[models.TechnicianPerformance]):
     """批量插入技師績效記錄"""
     db.bulk_save_objects(performances)
-    db.commit()
+    _commit(db)
 
 def bulk_insert_maintenance_income(db: Session, incomes: List[models.MaintenanceIncome]):
     """批量插入維修收入記錄"""
     db.bulk_save_objects(incomes)
-    db.commit()
+    _commit(db)
 
 # 在 crud.py 末尾添加
 
@@ -282,7 +811,7 @@ def create_or_update_part_category(
         )
         db.add(part_cat)
     
-    db.commit()
+    _commit(db)
     db.refresh(part_cat)
     return part_cat
 
@@ -304,7 +833,7 @@ def create_part_shipment(db: Session, factory_code: str, record: dict) -> models
         row_data=record.get('row_data')
     )
     db.add(shipment)
-    db.commit()
+    _commit(db)
     db.refresh(shipment)
     return shipment
 
@@ -323,7 +852,7 @@ def create_part_sale(db: Session, factory_code: str, record: dict) -> models.Par
         row_data=record.get('row_data')
     )
     db.add(sale)
-    db.commit()
+    _commit(db)
     db.refresh(sale)
     return sale
 
@@ -343,7 +872,7 @@ def create_technician_performance(db: Session, factory_code: str, record: dict)
         row_data=record.get('row_data')
     )
     db.add(performance)
-    db.commit()
+    _commit(db)
     db.refresh(performance)
     return performance
 
@@ -360,7 +889,7 @@ def create_maintenance_income(db: Session, factory_code: str, record: dict) -> m
         row_data=record.get('row_data')
     )
     db.add(income)
-    db.commit()
+    _commit(db)
     db.refresh(income)
     return income
 
@@ -388,11 +917,47 @@ def analyze_part_categories(
     db: Session,
     factory_code: Optional[str] = None,
     start_date: Optional[date] = None,
-    end_date: Optional[date] = None
+    end_date: Optional[date] = None,
+    group_by: Optional[List[str]] = None
 ) -> dict:
-    """分析零件分類銷售"""
+    """
+    分析零件分類銷售
+    - 優先由記憶體中的零件銷售 cube 回答（整月期間）
+    - 無法由 cube 回答時改走 SQL
+    - group_by 可為 factory_code / category / month / part_number 的組合
+    """
+    from utils.part_cube import query_cube
+    
+    group_by = group_by or ['category']
+    
+    rows = query_cube(db, group_by, factory_code=factory_code, start_date=start_date, end_date=end_date)
+    source = 'cube'
+    if rows is None:
+        rows = _analyze_part_categories_sql(db, group_by, factory_code, start_date, end_date)
+        source = 'sql'
+    
+    if group_by == ['category']:
+        return {'categories': rows, 'source': source}
+    return {'group_by': group_by, 'rows': rows, 'source': source}
+
+def _analyze_part_categories_sql(
+    db: Session,
+    group_by: List[str],
+    factory_code: Optional[str],
+    start_date: Optional[date],
+    end_date: Optional[date]
+) -> List[dict]:
+    """零件分類銷售（SQL 版本）"""
+    dimension_columns = {
+        'factory_code': models.PartSale.factory_code,
+        'category': models.PartCategory.category,
+        'month': func.date_trunc('month', models.PartSale.sale_date),
+        'part_number': models.PartSale.part_number,
+    }
+    dimensions = [dimension_columns[dim].label(dim) for dim in group_by]
+    
     query = db.query(
-        models.PartCategory.category,
+        *dimensions,
         func.count(models.PartSale.id).label('count'),
         func.sum(models.PartSale.amount).label('total_amount')
     ).join(
@@ -409,18 +974,69 @@ def analyze_part_categories(
     if end_date:
         query = query.filter(models.PartSale.sale_date <= end_date)
     
-    result = query.group_by(models.PartCategory.category).all()
+    result = query.group_by(*dimensions).order_by(func.sum(models.PartSale.amount).desc()).all()
     
-    return {
-        'categories': [
-            {
-                'category': row.category,
-                'count': row.count,
-                'total_amount': float(row.total_amount or 0)
-            }
-            for row in result
-        ]
-    }
+    rows = []
+    for row in result:
+        item = {dim: getattr(row, dim) for dim in group_by}
+        if item.get('month') is not None:
+            item['month'] = item['month'].date()
+        item['count'] = row.count
+        item['total_amount'] = float(row.total_amount or 0)
+        rows.append(item)
+    return rows
+
+# 列表查詢的精簡欄位（不含 row_data；金額直接轉成浮點數，避免 Decimal 的慢速序列化）
+LEAN_LIST_COLUMNS = {
+    models.PartShipment: ("shipment_date", [
+        "id", "factory_code", "order_number", "work_order_id", "part_number",
+        "quantity", "amount", "shipment_date", "file_upload_id", "source_row", "created_at",
+    ]),
+    models.PartSale: ("sale_date", [
+        "id", "factory_code", "order_number", "work_order_id", "part_number",
+        "quantity", "amount", "sale_date", "file_upload_id", "source_row", "created_at",
+    ]),
+    models.MaintenanceIncome: ("income_date", [
+        "id", "factory_code", "order_number", "work_order_id", "income_category",
+        "amount", "income_date", "file_upload_id", "source_row", "created_at",
+    ]),
+}
+
+def get_fact_rows(
+    db: Session,
+    model,
+    factory_code: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = 100
+) -> tuple:
+    """
+    精簡列表查詢
+    - 只選取需要的欄位，回傳 (欄位名稱, 資料列 tuple)，不建立 ORM 物件
+    """
+    date_column_name, column_names = LEAN_LIST_COLUMNS[model]
+    date_column = getattr(model, date_column_name)
+    
+    columns = []
+    for name in column_names:
+        column = getattr(model, name)
+        if name == "amount":
+            column = cast(column, Float).label("amount")
+        columns.append(column)
+    
+    query = select(*columns)
+    
+    if factory_code:
+        query = query.where(model.factory_code == factory_code)
+    
+    if start_date:
+        query = query.where(date_column >= start_date)
+    
+    if end_date:
+        query = query.where(date_column <= end_date)
+    
+    result = db.execute(query.order_by(date_column.desc()).limit(limit))
+    return column_names, result.all()
 
 def get_part_shipments(
     db: Session,
@@ -485,6 +1101,13 @@ def get_maintenance_income(
     
     return query.order_by(models.MaintenanceIncome.income_date.desc()).limit(limit).all()
 
+def get_fact_record(db: Session, table_name: str, record_id: int):
+    """根據資料表名稱與 ID 查詢事實資料"""
+    for model in FACT_MODELS:
+        if model.__tablename__ == table_name:
+            return db.query(model).filter(model.id == record_id).first()
+    return None
+
 def get_work_order_with_details(db: Session, factory_code: str, order_number: str):
     """查詢工單詳細資訊"""
     work_order = db.query(models.WorkOrder).filter(
@@ -502,3 +1125,129 @@ def get_work_order_with_details(db: Session, factory_code: str, order_number: st
         'technician_performances': work_order.technician_performances,
         'maintenance_incomes': work_order.maintenance_incomes
     }
+
+# ==========================================
+# 搜尋 / 自動完成
+# ==========================================
+
+# 查詢字串短於此長度時只做前綴比對（trigram 索引至少需要 3 個字元才能縮小範圍）
+SEARCH_MIN_SUBSTRING_CHARS = 3
+# 子字串比對先取的候選筆數上限，再依相似度排序：大量命中時查詢時間仍有上限
+# 候選為索引掃描先找到的前幾筆（未依相似度挑選），命中超過上限時子字串結果為近似值
+SEARCH_CANDIDATE_LIMIT = 500
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _ranked_search(
+    db: Session,
+    table: str,
+    columns: str,
+    key: str,
+    score: str,
+    query_text: str,
+    limit: int,
+    extra_match: Optional[str] = None,
+    filters: str = "",
+    params: Optional[dict] = None,
+    min_substring_chars: int = SEARCH_MIN_SUBSTRING_CHARS
+) -> List[dict]:
+    """
+    前綴 + 子字串搜尋並排序
+    - 前綴：key LIKE 'q%'（varchar_pattern_ops btree），依 key 排序取前 limit 筆
+    - 子字串：ILIKE '%q%'（pg_trgm GIN），取有限候選後依相似度排序
+      GIN 無法依相似度取候選：命中超過 SEARCH_CANDIDATE_LIMIT 筆時，
+      只在先掃描到的候選中排序，可能漏掉相似度更高的子字串結果（前綴結果不受影響）
+    - 結果前綴優先，其次相似度；完全相符的相似度為 1
+    table / columns / key / score 皆為程式內固定字串，不接受使用者輸入
+    """
+    escaped = _like_escape(query_text)
+    params = {
+        **(params or {}),
+        "q": query_text,
+        "prefix": f"{escaped}%",
+        "contains": f"%{escaped}%",
+        "limit": limit,
+        "candidates": SEARCH_CANDIDATE_LIMIT,
+    }
+    prefix_sql = f"""
+        (SELECT {columns}, 'prefix' AS match_type, {score} AS score
+         FROM {table}
+         WHERE {key} LIKE :prefix {filters}
+         ORDER BY {key}
+         LIMIT :limit)
+    """
+    if len(query_text) < min_substring_chars:
+        sql = f"SELECT * FROM {prefix_sql} hits ORDER BY score DESC LIMIT :limit"
+    else:
+        substring_match = f"({key} ILIKE :contains OR {extra_match} ILIKE :contains)" if extra_match else f"{key} ILIKE :contains"
+        sql = f"""
+            SELECT * FROM (
+            {prefix_sql}
+            UNION ALL
+            (SELECT {columns}, 'substring' AS match_type, {score} AS score
+             FROM (
+                 SELECT {columns} FROM {table}
+                 WHERE {substring_match} AND {key} NOT LIKE :prefix {filters}
+                 LIMIT :candidates
+             ) candidates
+             ORDER BY score DESC
+             LIMIT :limit)
+            ) hits
+            ORDER BY match_type = 'prefix' DESC, score DESC
+            LIMIT :limit
+        """
+    result = db.execute(text(sql), params)
+    return [dict(row._mapping) for row in result]
+
+def search_work_orders(
+    db: Session,
+    query_text: str,
+    factory_code: Optional[str] = None,
+    limit: int = 10
+) -> List[dict]:
+    """以部分工單號搜尋工單"""
+    return _ranked_search(
+        db, "work_orders", "factory_code, order_number", "order_number",
+        "similarity(order_number, :q)", query_text, limit,
+        filters="AND factory_code = :factory_code" if factory_code else "",
+        params={"factory_code": factory_code}
+    )
+
+def search_parts(db: Session, query_text: str, limit: int = 10) -> List[dict]:
+    """以部分料號或零件說明搜尋零件"""
+    return _ranked_search(
+        db, "part_categories", "part_number, category, description", "part_number",
+        "GREATEST(similarity(part_number, :q), similarity(COALESCE(description, ''), :q))",
+        query_text, limit, extra_match="description"
+    )
+
+def search_technicians(
+    db: Session,
+    query_text: str,
+    factory_code: Optional[str] = None,
+    limit: int = 10
+) -> List[dict]:
+    """
+    以部分姓名搜尋技師
+    名單資料表很小，單一字元（例如姓氏）也做子字串比對
+    """
+    return _ranked_search(
+        db, "technicians", "factory_code, technician_name", "technician_name",
+        "similarity(technician_name, :q)", query_text, limit,
+        filters="AND factory_code = :factory_code" if factory_code else "",
+        params={"factory_code": factory_code},
+        min_substring_chars=1
+    )
+
+def upsert_technicians(db: Session, factory_code: str, technician_names):
+    """批量確保技師名單存在（排序寫入避免死結）"""
+    keys = sorted(set(technician_names))
+    if not keys:
+        return
+    _run_dimension_upsert(db, text("""
+        INSERT INTO technicians (factory_code, technician_name)
+        SELECT :factory_code, t FROM unnest(CAST(:keys AS VARCHAR[])) AS t
+        ORDER BY t
+        ON CONFLICT (factory_code, technician_name) DO NOTHING
+    """), {"factory_code": factory_code, "keys": keys})
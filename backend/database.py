@@ -1,11 +1,15 @@
 import os
-from sqlalchemy import create_engine
+import hashlib
+import logging
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # 優先使用 Zeabur 注入的連接字串
 DATABASE_URL = os.getenv("POSTGRES_CONNECTION_STRING") or os.getenv("DATABASE_URL")
 
@@ -27,15 +31,191 @@ if not DATABASE_URL:
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(DATABASE_URL)
+# 唯讀副本（可選）：報表 / 業績查詢走副本，匯入維持在主庫
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+if DATABASE_REPLICA_URL and DATABASE_REPLICA_URL.startswith("postgres://"):
+    DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace("postgres://", "postgresql://", 1)
+
+# 連線池設定
+POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+}
+
+# 各路由類別的 statement_timeout（毫秒，0 表示不限制）
+STATEMENT_TIMEOUTS = {
+    "ingest": int(os.getenv("DB_STATEMENT_TIMEOUT_INGEST_MS", "0")),
+    "reports": int(os.getenv("DB_STATEMENT_TIMEOUT_REPORTS_MS", "15000")),
+    "performance": int(os.getenv("DB_STATEMENT_TIMEOUT_PERFORMANCE_MS", "30000")),
+}
+
+engine = create_engine(DATABASE_URL, **POOL_OPTIONS)
+read_engine = create_engine(DATABASE_REPLICA_URL, **POOL_OPTIONS) if DATABASE_REPLICA_URL else engine
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReportsSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+PerformanceSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
-# 依賴注入：獲取資料庫 session
-def get_db():
-    db = SessionLocal()
+
+def _statement_timeout_listener(timeout_ms: int):
+    """每個交易開始時設定 statement_timeout（SET LOCAL 只作用於該交易）"""
+    def set_statement_timeout(session, transaction, connection):
+        if connection.dialect.name == "postgresql":
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+    return set_statement_timeout
+
+
+for _factory, _route_class in (
+    (SessionLocal, "ingest"),
+    (ReportsSessionLocal, "reports"),
+    (PerformanceSessionLocal, "performance"),
+):
+    if STATEMENT_TIMEOUTS[_route_class] > 0:
+        event.listen(_factory, "after_begin", _statement_timeout_listener(STATEMENT_TIMEOUTS[_route_class]))
+
+
+def _session_scope(factory):
+    db = factory()
     try:
         yield db
     finally:
         db.close()
+
+# 依賴注入：獲取資料庫 session（主庫，匯入使用）
+def get_db():
+    yield from _session_scope(SessionLocal)
+
+# 依賴注入：報表查詢 session（有設定副本時走副本）
+def get_reports_db():
+    yield from _session_scope(ReportsSessionLocal)
+
+# 依賴注入：業績查詢 session（有設定副本時走副本）
+def get_performance_db():
+    yield from _session_scope(PerformanceSessionLocal)
+
+
+# ==========================================
+# 啟動時的資料表檢查
+# ==========================================
+
+# verify: 比對已記錄的 schema 版本，一致時略過 create_all（預設）
+# create: 每次啟動都執行 create_all（舊行為）
+# skip:   完全不檢查（由 SQL/init.sql 或部署流程負責）
+SCHEMA_STARTUP_MODE = os.getenv("SCHEMA_STARTUP_MODE", "verify").lower()
+
+
+# 既有資料庫升級：create_all 只建立缺少的資料表，不會替既有資料表加欄位 / 約束
+# 每一項都可重複執行（與 SQL/init.sql 的升級段落相同）；內容變動時 schema 版本隨之改變，下次啟動自動套用
+SCHEMA_UPGRADES = [
+    "ALTER TABLE part_shipments ADD COLUMN IF NOT EXISTS source_row INTEGER",
+    "ALTER TABLE part_sales ADD COLUMN IF NOT EXISTS source_row INTEGER",
+    "ALTER TABLE technician_performance ADD COLUMN IF NOT EXISTS source_row INTEGER",
+    "ALTER TABLE maintenance_income ADD COLUMN IF NOT EXISTS source_row INTEGER",
+    "ALTER TABLE file_uploads ADD COLUMN IF NOT EXISTS error_summary JSONB",
+    "ALTER TABLE factories ADD COLUMN IF NOT EXISTS aliases JSONB DEFAULT '[]'",
+    # 與 init.sql 的 UNIQUE 約束同名：由 init.sql 建立的資料庫不會重複建立
+    "CREATE UNIQUE INDEX IF NOT EXISTS work_orders_factory_code_order_number_key "
+    "ON work_orders (factory_code, order_number)",
+    # 覆蓋 / 撤銷上傳時依上傳刪除指紋（指紋是最大的資料表，不可全表掃描）
+    "CREATE INDEX IF NOT EXISTS idx_row_fingerprints_upload ON row_fingerprints (file_upload_id)",
+    # 技師名單：由既有的績效明細補齊（之後匯入時維護）
+    "INSERT INTO technicians (factory_code, technician_name) "
+    "SELECT DISTINCT factory_code, technician_name FROM technician_performance "
+    "ON CONFLICT (factory_code, technician_name) DO NOTHING",
+    # 搜尋 / 自動完成：前綴以 pattern_ops btree，子字串與 similarity() 需要 pg_trgm
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS idx_work_orders_number_prefix ON work_orders (order_number varchar_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_work_orders_number_trgm ON work_orders USING gin (order_number gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_part_categories_number_prefix ON part_categories (part_number varchar_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_part_categories_number_trgm "
+    "ON part_categories USING gin (part_number gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_part_categories_description_trgm "
+    "ON part_categories USING gin (description gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_technicians_name_prefix ON technicians (technician_name varchar_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS idx_technicians_name_trgm ON technicians USING gin (technician_name gin_trgm_ops)",
+]
+
+
+def schema_fingerprint() -> str:
+    """由 ORM 定義（資料表、欄位、索引、唯一約束）與升級語句計算 schema 版本"""
+    from sqlalchemy import UniqueConstraint
+
+    parts = []
+    for table in sorted(Base.metadata.tables.values(), key=lambda t: t.name):
+        parts.extend(f"{table.name}.{column.name}:{column.type}" for column in table.columns)
+        parts.extend(f"{table.name}#{index.name}" for index in sorted(table.indexes, key=lambda i: i.name or ""))
+        parts.extend(sorted(
+            f"{table.name}!{constraint.name}" for constraint in table.constraints
+            if isinstance(constraint, UniqueConstraint)
+        ))
+    parts.extend(SCHEMA_UPGRADES)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def _apply_upgrades() -> bool:
+    """
+    套用 SCHEMA_UPGRADES，並補建 ORM 宣告但既有資料表缺少的索引
+    每一項各自一個交易：單項失敗（例如既有資料違反唯一約束）不影響其他項
+    回傳是否全部成功
+    """
+    ok = True
+    for statement in SCHEMA_UPGRADES:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(statement))
+        except Exception as e:
+            ok = False
+            logger.error(f"資料表升級失敗: {statement}: {str(e)}")
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                with engine.begin() as conn:
+                    index.create(bind=conn, checkfirst=True)
+            except Exception as e:
+                ok = False
+                logger.error(f"建立索引 {index.name} 失敗: {str(e)}")
+    return ok
+
+
+def ensure_schema():
+    """
+    啟動時確認資料表；版本一致時只需一次查詢
+    版本不同時建立缺少的資料表、套用升級，全部成功後才記錄新版本
+    """
+    if SCHEMA_STARTUP_MODE == "skip":
+        return
+    
+    version = schema_fingerprint()
+    
+    if SCHEMA_STARTUP_MODE == "verify":
+        try:
+            with engine.connect() as conn:
+                stored = conn.execute(text("SELECT version FROM schema_version WHERE id = 1")).scalar()
+            if stored == version:
+                logger.info(f"資料表版本一致 ({version[:12]})，略過建立")
+                return
+        except Exception:
+            logger.info("尚未記錄資料表版本")
+    
+    Base.metadata.create_all(bind=engine)
+    if not _apply_upgrades():
+        # 不記錄版本：下次啟動重新嘗試
+        logger.error("資料表升級未完成，請檢查上方錯誤（可改以 SQL/init.sql 手動升級）")
+        return
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                id INTEGER PRIMARY KEY,
+                version VARCHAR(64) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        conn.execute(text("""
+            INSERT INTO schema_version (id, version) VALUES (1, :version)
+            ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, applied_at = CURRENT_TIMESTAMP
+        """), {"version": version})
+    logger.info(f"資料表已建立 / 更新，版本 {version[:12]}")
@@ -1,18 +1,56 @@
 from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
-from database import engine, Base
+from database import ensure_schema, PerformanceSessionLocal
+from utils.http_cache import conditional_get_middleware
 from routers import upload, reports, performance
-import uvicorn
 import os
+import logging
+import threading
 from pathlib import Path
 
-# 建立資料表
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(title="廠業績管理系統 API")
 
+# 建立 / 檢查資料表（啟動時執行，不在 import 時連線資料庫）
+@app.on_event("startup")
+def check_schema():
+    ensure_schema()
+
+# 背景預先建立零件銷售 cube（不阻塞啟動）
+@app.on_event("startup")
+def warm_part_cube():
+    if os.getenv("PART_CUBE_WARMUP", "true").lower() not in ("1", "true", "yes"):
+        return
+    
+    def build():
+        from utils.part_cube import PART_CUBE_ENABLED, refresh_cube
+        if not PART_CUBE_ENABLED:
+            return
+        db = PerformanceSessionLocal()
+        try:
+            refresh_cube(db, force=True)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"預先建立零件銷售 cube 失敗: {str(e)}")
+        finally:
+            db.close()
+    
+    threading.Thread(target=build, name="part-cube-warmup", daemon=True).start()
+
+# 分析模式：背景補齊過時或未完整匯出的快照（完成前歷史報表改由 PostgreSQL 計算）
+@app.on_event("startup")
+def sync_analytics_snapshots():
+    from utils.analytics import ANALYTICS_ENABLED, refresh_stale_snapshots
+    if not ANALYTICS_ENABLED:
+        return
+    
+    threading.Thread(target=refresh_stale_snapshots, name="analytics-export", daemon=True).start()
+
+# 報表 / 業績回應：ETag 條件式 GET 與 gzip 壓縮（先註冊，位於 CORS 內層，304 也會帶 CORS 標頭）
+app.middleware("http")(conditional_get_middleware)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # CORS 設定
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +58,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # 建立 static 資料夾（如果不存在）
@@ -47,5 +86,6 @@ async def upload_page():
     return {"error": "上傳頁面不存在"}
 
 if __name__ == "__main__":
+    import uvicorn
     port = int(os.getenv("PORT", 8080))
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Numeric, Date, DateTime, ForeignKey, Text, JSON, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -9,12 +9,17 @@ class Factory(Base):
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(10), unique=True, nullable=False, index=True)
     name = Column(String(100), nullable=False)
+    aliases = Column(JSON)  # 檔名 / 資料中可能出現的其他寫法，例如 ["AMA廠", "A廠"]
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     work_orders = relationship("WorkOrder", back_populates="factory")
 
 class WorkOrder(Base):
     __tablename__ = "work_orders"
+    __table_args__ = (
+        # 與 SQL/init.sql 的 UNIQUE(factory_code, order_number) 同名；批量 upsert 的 ON CONFLICT 依賴此約束
+        UniqueConstraint("factory_code", "order_number", name="work_orders_factory_code_order_number_key"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     factory_code = Column(String(10), ForeignKey("factories.code"), nullable=False)
@@ -44,6 +49,10 @@ class PartCategory(Base):
 
 class PartShipment(Base):
     __tablename__ = "part_shipments"
+    __table_args__ = (
+        Index("idx_part_shipments_upload", "file_upload_id"),
+        Index("idx_part_shipments_factory_date", "factory_code", "shipment_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     factory_code = Column(String(10), nullable=False)
@@ -54,6 +63,7 @@ class PartShipment(Base):
     amount = Column(Numeric(12, 2), default=0)
     shipment_date = Column(Date)
     file_upload_id = Column(String(100))
+    source_row = Column(Integer)  # 原始檔案中的資料行索引，對應 raw archive
     row_data = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -62,6 +72,10 @@ class PartShipment(Base):
 
 class PartSale(Base):
     __tablename__ = "part_sales"
+    __table_args__ = (
+        Index("idx_part_sales_upload", "file_upload_id"),
+        Index("idx_part_sales_factory_date", "factory_code", "sale_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     factory_code = Column(String(10), nullable=False)
@@ -72,6 +86,7 @@ class PartSale(Base):
     amount = Column(Numeric(12, 2), default=0)
     sale_date = Column(Date)
     file_upload_id = Column(String(100))
+    source_row = Column(Integer)  # 原始檔案中的資料行索引，對應 raw archive
     row_data = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -80,6 +95,10 @@ class PartSale(Base):
 
 class TechnicianPerformance(Base):
     __tablename__ = "technician_performance"
+    __table_args__ = (
+        Index("idx_technician_upload", "file_upload_id"),
+        Index("idx_technician_factory_date", "factory_code", "performance_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     factory_code = Column(String(10), nullable=False)
@@ -91,13 +110,30 @@ class TechnicianPerformance(Base):
     bonus = Column(Numeric(12, 2), default=0)
     performance_date = Column(Date)
     file_upload_id = Column(String(100))
+    source_row = Column(Integer)  # 原始檔案中的資料行索引，對應 raw archive
     row_data = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     work_order = relationship("WorkOrder", back_populates="technician_performances")
 
+class Technician(Base):
+    """技師名單（匯入技師績效時維護，供搜尋 / 自動完成使用，不必掃描績效明細）"""
+    __tablename__ = "technicians"
+    __table_args__ = (
+        UniqueConstraint("factory_code", "technician_name", name="uq_technicians_factory_name"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    factory_code = Column(String(10), nullable=False)
+    technician_name = Column(String(100), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class MaintenanceIncome(Base):
     __tablename__ = "maintenance_income"
+    __table_args__ = (
+        Index("idx_maintenance_upload", "file_upload_id"),
+        Index("idx_maintenance_factory_date", "factory_code", "income_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     factory_code = Column(String(10), nullable=False)
@@ -107,6 +143,7 @@ class MaintenanceIncome(Base):
     amount = Column(Numeric(12, 2), default=0)
     income_date = Column(Date)
     file_upload_id = Column(String(100))
+    source_row = Column(Integer)  # 原始檔案中的資料行索引，對應 raw archive
     row_data = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -124,5 +161,41 @@ class FileUpload(Base):
     record_count = Column(Integer, default=0)
     status = Column(String(20), default="processed")
     error_message = Column(Text)
+    error_summary = Column(JSON)  # 資料行錯誤依規則 / 欄位彙總（含少量樣本）
     uploaded_by = Column(String(100))
 
+
+
+class RowFingerprint(Base):
+    __tablename__ = "row_fingerprints"
+    __table_args__ = (
+        UniqueConstraint("factory_code", "file_type", "row_hash", name="uq_row_fingerprints_key"),
+        Index("idx_row_fingerprints_sync", "factory_code", "file_type", "id"),
+        # 覆蓋 / 撤銷上傳時依上傳刪除指紋
+        Index("idx_row_fingerprints_upload", "file_upload_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    factory_code = Column(String(10), nullable=False)
+    file_type = Column(String(50), nullable=False)
+    row_hash = Column(BigInteger, nullable=False)
+    file_upload_id = Column(String(100))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ReportTemplate(Base):
+    __tablename__ = "report_templates"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    signature = Column(String(64), unique=True, nullable=False, index=True)  # 標題列指紋
+    file_type = Column(String(50), nullable=False)
+    header_row = Column(Integer, nullable=False, default=0)  # 標題列在工作表中的位置（0 起算）
+    column_mapping = Column(JSON, nullable=False)  # 原始標題 -> 標準欄位
+    factory_column = Column(String(100))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
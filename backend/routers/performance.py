@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from datetime import date
-from database import get_db
+from datetime import date, timedelta
+from database import get_performance_db
 import crud
 import schemas
 
@@ -13,7 +13,7 @@ def get_factory_performance(
     factory_code: Optional[str] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_performance_db)
 ):
     """
     查詢廠別業績
@@ -37,7 +37,7 @@ def get_technician_performance(
     technician_name: Optional[str] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_performance_db)
 ):
     """
     查詢技師個人業績
@@ -54,17 +54,58 @@ def get_technician_performance(
         end_date=end_date
     )
 
+@router.get("/technician/leaderboard", response_model=schemas.TechnicianLeaderboard)
+def get_technician_leaderboard(
+    factory_code: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    top_n: int = Query(default=10, ge=1, le=100),
+    db: Session = Depends(get_performance_db)
+):
+    """
+    技師排行榜
+    - 各廠前 N 名（伺服器端以視窗函數排名）
+    - 排名、百分位數
+    - 與上一期（等長的前一段期間）比較
+    - 未指定期間時預設為最近 30 天
+    """
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - timedelta(days=29)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date 不可晚於 end_date")
+    
+    previous_end_date = start_date - timedelta(days=1)
+    previous_start_date = previous_end_date - (end_date - start_date)
+    
+    entries = crud.get_technician_leaderboard(
+        db,
+        start_date=start_date,
+        end_date=end_date,
+        previous_start_date=previous_start_date,
+        factory_code=factory_code,
+        top_n=top_n
+    )
+    
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "previous_start_date": previous_start_date,
+        "previous_end_date": previous_end_date,
+        "top_n": top_n,
+        "entries": entries
+    }
+
 @router.get("/summary")
 def get_performance_summary(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_performance_db)
 ):
     """
     綜合業績摘要
     - 所有廠別總計
     - 各廠別對比
-    - 趨勢分析
+    - 趨勢分析（分桶時間序列請見 /trend）
     """
     factories = crud.calculate_factory_performance(
         db,
@@ -86,21 +127,167 @@ def get_performance_summary(
         "factories": factories
     }
 
+TREND_BUCKETS = ["day", "week", "month"]
+
+def _count_buckets(start_date: date, end_date: date, bucket: str) -> int:
+    """計算期間內的分桶數"""
+    if bucket == "day":
+        return (end_date - start_date).days + 1
+    if bucket == "week":
+        start_week = start_date - timedelta(days=start_date.weekday())
+        end_week = end_date - timedelta(days=end_date.weekday())
+        return (end_week - start_week).days // 7 + 1
+    return (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+
+@router.post("/batch", response_model=List[schemas.BatchPerformanceResult])
+def get_batch_performance(
+    request: schemas.BatchPerformanceRequest,
+    db: Session = Depends(get_performance_db)
+):
+    """
+    批次業績查詢
+    - 一次傳入多組 (廠別, 起日, 迄日) 與指標
+    - 以單一查詢計算全部組合（年增率 / 月增率比較畫面只需一次往返）
+    - 結果依傳入順序回傳（spec_index）
+    """
+    unknown = [metric for metric in request.metrics if metric not in crud.BATCH_METRICS]
+    if unknown or not request.metrics:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支援的指標: {unknown}，可用指標: {crud.BATCH_METRICS}"
+        )
+    
+    for spec in request.specs:
+        if spec.start_date > spec.end_date:
+            raise HTTPException(status_code=400, detail=f"start_date 不可晚於 end_date: {spec}")
+    
+    return crud.get_batch_performance(
+        db,
+        specs=[spec.model_dump() for spec in request.specs],
+        metrics=list(dict.fromkeys(request.metrics))
+    )
+
+def _group_series(rows: List[dict]) -> List[dict]:
+    """將 (廠別, 分桶) 資料列整理為每廠一條時間序列"""
+    series = {}
+    for row in rows:
+        series.setdefault(row["factory_code"], []).append(row)
+    return [
+        {"factory_code": code, "points": points}
+        for code, points in series.items()
+    ]
+
+@router.get("/trend", response_model=schemas.PerformanceTrend)
+def get_performance_trend(
+    start_date: date,
+    end_date: date,
+    bucket: str = Query(default="month", pattern="^(day|week|month)$"),
+    factory_code: Optional[str] = None,
+    max_points: int = Query(default=400, ge=1, le=2000),
+    db: Session = Depends(get_performance_db)
+):
+    """
+    業績趨勢
+    - 各廠收入、零件銷售、零件出貨、人工成本
+    - 依日 / 週 / 月在資料庫分桶，無資料的區間補 0
+    - 分桶數超過 max_points 時自動改用較粗的分桶
+    """
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date 不可晚於 end_date")
+    
+    effective_bucket = bucket
+    for candidate in TREND_BUCKETS[TREND_BUCKETS.index(bucket):]:
+        effective_bucket = candidate
+        if _count_buckets(start_date, end_date, candidate) <= max_points:
+            break
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail=f"期間過長：以月分桶仍超過 {max_points} 個資料點"
+        )
+    
+    rows = crud.get_performance_trend(
+        db,
+        start_date=start_date,
+        end_date=end_date,
+        bucket=effective_bucket,
+        factory_code=factory_code
+    )
+    
+    return {
+        "bucket": effective_bucket,
+        "requested_bucket": bucket,
+        "start_date": start_date,
+        "end_date": end_date,
+        "series": _group_series(rows)
+    }
+
+@router.get("/history", response_model=schemas.PerformanceTrend)
+def get_performance_history(
+    start_date: date,
+    end_date: date,
+    factory_code: Optional[str] = None,
+    source: str = Query(default="auto", pattern="^(auto|analytics|postgres)$"),
+    db: Session = Depends(get_performance_db)
+):
+    """
+    多年度歷史業績（月彙總）
+    - 分析模式啟用且各資料表都已完整匯出快照時，以 DuckDB 查詢 Parquet 快照
+    - 否則（或 source=postgres）由 PostgreSQL 計算
+    """
+    from utils.analytics import snapshots_available, query_monthly_history
+    
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date 不可晚於 end_date")
+    
+    use_analytics = source == "analytics" or (source == "auto" and snapshots_available())
+    if use_analytics:
+        if not snapshots_available():
+            raise HTTPException(status_code=503, detail="分析快照尚未建立")
+        factory_codes = [factory.code for factory in crud.get_factories(db)]
+        rows = query_monthly_history(start_date, end_date, factory_codes, factory_code)
+    else:
+        rows = crud.get_performance_trend(
+            db,
+            start_date=start_date,
+            end_date=end_date,
+            bucket="month",
+            factory_code=factory_code
+        )
+    
+    return {
+        "bucket": "month",
+        "requested_bucket": "month",
+        "start_date": start_date,
+        "end_date": end_date,
+        "series": _group_series(rows)
+    }
+
+PART_CATEGORY_DIMENSIONS = {"factory_code", "category", "month", "part_number"}
+
 @router.get("/part-category-analysis")
 def get_part_category_analysis(
     factory_code: Optional[str] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db)
+    group_by: str = Query(default="category", description="以逗號分隔: factory_code, category, month, part_number"),
+    db: Session = Depends(get_performance_db)
 ):
     """
     零件分類分析
     - 零件 vs 配件 vs 精品 的銷售佔比
+    - 可依廠別 / 分類 / 月份 / 料號切片彙總
+    - 整月期間由記憶體 cube 回答，其餘走 SQL
     """
+    dimensions = [dim.strip() for dim in group_by.split(",") if dim.strip()]
+    invalid = [dim for dim in dimensions if dim not in PART_CATEGORY_DIMENSIONS]
+    if invalid or not dimensions:
+        raise HTTPException(status_code=400, detail=f"不支援的 group_by: {group_by}")
+    
     return crud.analyze_part_categories(
         db,
         factory_code=factory_code,
         start_date=start_date,
-        end_date=end_date
+        end_date=end_date,
+        group_by=dimensions
     )
-
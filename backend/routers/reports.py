@@ -1,70 +1,182 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import date
-from database import get_db
+from database import get_reports_db
 import crud
 import schemas
+import models
+from utils.fast_json import LeanJSONResponse, rows_to_records, rows_to_columns
+from utils.raw_archive import read_raw_row
 
 router = APIRouter()
 
-@router.get("/part-shipments")
+# /search 與 /autocomplete 支援的類型
+SEARCH_TYPES = {"work_order", "part", "technician"}
+
+@router.get("/part-shipments", response_class=LeanJSONResponse)
 def get_part_shipments(
     factory_code: Optional[str] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     limit: int = Query(default=100, le=1000),
-    db: Session = Depends(get_db)
+    format: str = Query(default="rows", pattern="^(rows|columns)$"),
+    db: Session = Depends(get_reports_db)
 ):
-    """查詢零件出貨記錄"""
-    return crud.get_part_shipments(
+    """查詢零件出貨記錄（format=columns 時回傳欄導向陣列）"""
+    columns, rows = crud.get_fact_rows(
         db,
+        models.PartShipment,
         factory_code=factory_code,
         start_date=start_date,
         end_date=end_date,
         limit=limit
     )
+    if format == "columns":
+        return LeanJSONResponse(rows_to_columns(columns, rows))
+    return LeanJSONResponse(rows_to_records(columns, rows))
 
-@router.get("/part-sales")
+@router.get("/part-sales", response_class=LeanJSONResponse)
 def get_part_sales(
     factory_code: Optional[str] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     limit: int = Query(default=100, le=1000),
-    db: Session = Depends(get_db)
+    format: str = Query(default="rows", pattern="^(rows|columns)$"),
+    db: Session = Depends(get_reports_db)
 ):
-    """查詢零件銷售記錄"""
-    return crud.get_part_sales(
+    """查詢零件銷售記錄（format=columns 時回傳欄導向陣列）"""
+    columns, rows = crud.get_fact_rows(
         db,
+        models.PartSale,
         factory_code=factory_code,
         start_date=start_date,
         end_date=end_date,
         limit=limit
     )
+    if format == "columns":
+        return LeanJSONResponse(rows_to_columns(columns, rows))
+    return LeanJSONResponse(rows_to_records(columns, rows))
 
-@router.get("/maintenance-income")
+@router.get("/maintenance-income", response_class=LeanJSONResponse)
 def get_maintenance_income(
     factory_code: Optional[str] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     limit: int = Query(default=100, le=1000),
-    db: Session = Depends(get_db)
+    format: str = Query(default="rows", pattern="^(rows|columns)$"),
+    db: Session = Depends(get_reports_db)
 ):
-    """查詢維修收入記錄"""
-    return crud.get_maintenance_income(
+    """查詢維修收入記錄（format=columns 時回傳欄導向陣列）"""
+    columns, rows = crud.get_fact_rows(
         db,
+        models.MaintenanceIncome,
         factory_code=factory_code,
         start_date=start_date,
         end_date=end_date,
         limit=limit
     )
+    if format == "columns":
+        return LeanJSONResponse(rows_to_columns(columns, rows))
+    return LeanJSONResponse(rows_to_records(columns, rows))
+
+@router.get("/search", response_model=schemas.SearchResults)
+def search(
+    q: str = Query(..., min_length=1, max_length=100, description="部分工單號 / 料號 / 零件說明 / 技師姓名"),
+    types: str = Query(default="work_order,part,technician", description="以逗號分隔: work_order, part, technician"),
+    factory_code: Optional[str] = None,
+    limit: int = Query(default=10, ge=1, le=50),
+    db: Session = Depends(get_reports_db)
+):
+    """
+    搜尋工單、零件與技師
+    - 前綴相符優先，其次為子字串相符（依 trigram 相似度排序）
+    - 子字串相符大量命中時只在前 500 筆候選中排序，結果為近似值
+    - 少於 3 個字元時工單與零件只做前綴比對
+    """
+    query_text = _search_text(q)
+    selected = _search_types(types)
+    return {
+        "query": query_text,
+        "work_orders": crud.search_work_orders(db, query_text, factory_code, limit) if "work_order" in selected else [],
+        "parts": crud.search_parts(db, query_text, limit) if "part" in selected else [],
+        "technicians": crud.search_technicians(db, query_text, factory_code, limit) if "technician" in selected else [],
+    }
+
+@router.get("/autocomplete", response_model=List[schemas.AutocompleteSuggestion])
+def autocomplete(
+    q: str = Query(..., min_length=1, max_length=100),
+    types: str = Query(default="work_order,part,technician", description="以逗號分隔: work_order, part, technician"),
+    factory_code: Optional[str] = None,
+    limit: int = Query(default=8, ge=1, le=20),
+    db: Session = Depends(get_reports_db)
+):
+    """輸入框自動完成：各類型的建議依前綴 / 相似度排序後合併，取前 limit 筆"""
+    query_text = _search_text(q)
+    selected = _search_types(types)
+    suggestions = []
+    if "work_order" in selected:
+        suggestions += [
+            ({"type": "work_order", "value": h["order_number"], "factory_code": h["factory_code"]}, h)
+            for h in crud.search_work_orders(db, query_text, factory_code, limit)
+        ]
+    if "part" in selected:
+        suggestions += [
+            ({"type": "part", "value": h["part_number"], "factory_code": None, "label": h["description"]}, h)
+            for h in crud.search_parts(db, query_text, limit)
+        ]
+    if "technician" in selected:
+        suggestions += [
+            ({"type": "technician", "value": h["technician_name"], "factory_code": h["factory_code"]}, h)
+            for h in crud.search_technicians(db, query_text, factory_code, limit)
+        ]
+    suggestions.sort(key=lambda item: (item[1]["match_type"] != "prefix", -item[1]["score"]))
+    return [suggestion for suggestion, _ in suggestions[:limit]]
+
+def _search_text(q: str) -> str:
+    # 只有空白的查詢去除空白後會變成 LIKE '%'，等於列出全部資料
+    query_text = q.strip()
+    if not query_text:
+        raise HTTPException(status_code=400, detail="搜尋字串不可為空白")
+    return query_text
+
+def _search_types(types: str) -> set:
+    selected = {t.strip() for t in types.split(",") if t.strip()}
+    unknown = selected - SEARCH_TYPES
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支援的搜尋類型: {', '.join(sorted(unknown))}")
+    return selected
 
 @router.get("/work-orders/{factory_code}/{order_number}")
 def get_work_order_detail(
     factory_code: str,
     order_number: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_reports_db)
 ):
     """查詢工單詳細資訊（包含所有關聯資料）"""
     return crud.get_work_order_with_details(db, factory_code, order_number)
 
+@router.get("/raw-rows/{table_name}/{record_id}")
+def get_raw_row(
+    table_name: str,
+    record_id: int,
+    db: Session = Depends(get_reports_db)
+):
+    """查詢事實資料對應的原始 Excel 資料行（來源追溯）"""
+    record = crud.get_fact_record(db, table_name, record_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"找不到資料: {table_name}/{record_id}")
+    if record.source_row is None or not record.file_upload_id:
+        raise HTTPException(status_code=404, detail="此筆資料沒有來源資料行資訊")
+    
+    raw_row = read_raw_row(record.file_upload_id, record.source_row)
+    if raw_row is None:
+        raise HTTPException(status_code=404, detail="找不到原始資料封存")
+    
+    return {
+        "table": table_name,
+        "record_id": record_id,
+        "file_hash": record.file_upload_id,
+        "source_row": record.source_row,
+        "raw_row": raw_row
+    }
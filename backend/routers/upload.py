@@ -1,28 +1,40 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
-from database import get_db
+from typing import List, Optional
+from database import get_db, get_reports_db
 import crud
 import schemas
 import models
-from utils.excel_parser import ExcelParser
-from utils.factory_detector import (
-    detect_factory_from_filename, 
-    detect_file_type,
-    detect_factories_from_dataframe,
-    get_factory_column_name,
-    filter_dataframe_by_factory
-)
 from utils.file_hasher import calculate_file_hash
+from utils.raw_archive import write_archive, delete_archive
+from utils.http_cache import note_data_version
+from utils.analytics import ANALYTICS_ENABLED, FILE_TYPE_TABLES, export_snapshots
+from utils.row_errors import RowErrorCollector
+# 注意：pandas / openpyxl 相關模組（excel_parser、factory_detector、row_fingerprint）
+# 在函式內延遲載入，只提供查詢的 worker 不需付出載入成本
+import asyncio
+from contextlib import ExitStack
 import logging
+import os
+import time
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# 相同檔案並行上傳時，等待先到請求完成的最長時間與輪詢間隔（秒）
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv("SINGLE_FLIGHT_WAIT_SECONDS", "600"))
+SINGLE_FLIGHT_POLL_SECONDS = 0.5
+# 同一廠別、同一報表類型的上傳排隊等待的最長時間（秒）
+INGEST_LOCK_WAIT_SECONDS = float(os.getenv("INGEST_LOCK_WAIT_SECONDS", "900"))
+
 @router.post("/excel", response_model=List[schemas.FileUploadResponse])
 async def upload_excel_files(
+    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
+    overwrite: bool = Query(default=False, description="相同檔案已上傳時，刪除舊資料後重新匯入"),
+    replace_upload_id: Optional[int] = Query(default=None, description="以本次上傳取代指定的上傳記錄"),
     db: Session = Depends(get_db)
 ):
     """
@@ -32,99 +44,411 @@ async def upload_excel_files(
     - 自動識別報表類型
     - 防止重複上傳
     - 支援多廠別資料
+    - 覆蓋模式：舊資料刪除與新資料寫入在同一交易中完成
     """
     results = []
     
+    replaced_upload = _get_replaced_upload(db, replace_upload_id)
+    
     for file in files:
+        # 讀取檔案內容
+        content = await file.read()
+        file_hash = calculate_file_hash(content)
+        
+        results.extend(await ingest_file(
+            file.filename, content, file_hash, overwrite, replaced_upload, background_tasks, db
+        ))
+        replaced_upload = None
+    
+    return results
+
+
+@router.post("/validate", response_model=List[schemas.ValidationReport])
+async def validate_excel_files(files: List[UploadFile] = File(...)):
+    """
+    試跑驗證（不寫入資料庫）
+    - 讀取檔案、識別報表類型與廠別、對應欄位、向量化型別檢查
+    - 回傳各規則的無效筆數與樣本，讓使用者在正式上傳前修正
+    """
+    from utils.upload_validator import validate_upload
+
+    from utils.memory_governor import release
+
+    reports = []
+    for file in files:
+        content = await file.read()
+        # 試跑同樣會讀入整份檔案，受相同的記憶體預算限制
+        plan = await _reserve_memory(file.filename, content)
         try:
-            logger.info(f"開始處理檔案: {file.filename}")
-            
-            # 讀取檔案內容
-            content = await file.read()
-            file_hash = calculate_file_hash(content)
-            
-            # 檢查是否已上傳過
-            existing_file = crud.get_file_by_hash(db, file_hash)
-            if existing_file:
-                logger.info(f"檔案 {file.filename} 已存在，跳過")
-                results.append(existing_file)
-                continue
-            
-            # 識別報表類型
-            file_type = detect_file_type(file.filename)
-            logger.info(f"識別的報表類型: {file_type}")
-            
-            # 解析 Excel
-            parser = ExcelParser()
-            df = parser.read_excel(content)
-            logger.info(f"Excel 檔案讀取成功，共 {len(df)} 行資料")
+            reports.append(await run_in_threadpool(validate_upload, file.filename, content))
+        finally:
+            release(plan)
+    return reports
+
+
+@router.get("/history", response_model=List[schemas.FileUploadResponse])
+def get_upload_history(
+    factory_code: Optional[str] = Query(default=None, description="廠別代碼"),
+    limit: int = Query(default=50, ge=1, le=500),
+    db: Session = Depends(get_reports_db)
+):
+    """上傳歷史（含各次上傳的資料行錯誤摘要）"""
+    return crud.get_file_uploads(db, factory_code=factory_code, limit=limit)
+
+
+# ==================== 可續傳的分段上傳 ====================
+
+@router.post("/sessions", response_model=schemas.UploadSession)
+def create_upload_session(request: schemas.UploadSessionCreate):
+    """
+    建立可續傳的上傳工作階段
+    - 之後以 PUT /sessions/{id}?offset=N 上傳分段（可重送、可亂序）
+    - 連線中斷後以 GET /sessions/{id} 查詢已收到的區段，只補傳缺少的部分
+    """
+    from utils.upload_sessions import create_session
+    return _session_call(create_session, request.file_name, request.total_size)
+
+
+@router.put("/sessions/{session_id}", response_model=schemas.UploadSession)
+async def upload_session_chunk(
+    session_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="分段在檔案中的起始位移（bytes）")
+):
+    """上傳一個分段（請求本文為原始位元組）"""
+    from utils.upload_sessions import write_chunk
+    chunk = await request.body()
+    return await run_in_threadpool(_session_call, write_chunk, session_id, offset, chunk)
+
+
+@router.get("/sessions/{session_id}", response_model=schemas.UploadSession)
+def get_upload_session(session_id: str):
+    """查詢已收到的區段"""
+    from utils.upload_sessions import get_session
+    return _session_call(get_session, session_id)
+
+
+@router.post("/sessions/{session_id}/complete", response_model=List[schemas.FileUploadResponse])
+async def complete_upload_session(
+    session_id: str,
+    background_tasks: BackgroundTasks,
+    overwrite: bool = Query(default=False, description="相同檔案已上傳時，刪除舊資料後重新匯入"),
+    replace_upload_id: Optional[int] = Query(default=None, description="以本次上傳取代指定的上傳記錄"),
+    db: Session = Depends(get_db)
+):
+    """
+    完成分段上傳並匯入
+    - SHA-256 已在接收分段時增量算好，直接進入重複檢查與匯入
+    - 匯入成功後刪除暫存檔；失敗時保留工作階段，可修正後重試
+    """
+    from utils.upload_sessions import finalize_session, discard_session
+    
+    replaced_upload = _get_replaced_upload(db, replace_upload_id)
+    file_name, content, file_hash = _session_call(finalize_session, session_id)
+    
+    results = await ingest_file(
+        file_name, content, file_hash, overwrite, replaced_upload, background_tasks, db
+    )
+    discard_session(session_id)
+    return results
+
+
+@router.delete("/sessions/{session_id}")
+def abort_upload_session(session_id: str):
+    """取消上傳並刪除暫存檔"""
+    from utils.upload_sessions import discard_session
+    _session_call(discard_session, session_id)
+    return {"session_id": session_id, "status": "aborted"}
+
+
+def _session_call(func, *args):
+    from utils.upload_sessions import UploadSessionError
+    try:
+        return func(*args)
+    except UploadSessionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+async def _wait_for_advisory_lock(
+    db: Session,
+    namespace: int,
+    value: str,
+    wait_seconds: float,
+    busy_message: str
+) -> bool:
+    """
+    取得交易層級的 advisory lock，回傳是否未經等待即取得
+    - 以 pg_try_advisory_xact_lock 輪詢，等待期間讓出事件迴圈，
+      同一 worker 內持有鎖的請求才能繼續完成
+    - 鎖隨交易提交 / 回滾（或 session 關閉）釋放
+    """
+    if crud.try_advisory_xact_lock(db, namespace, value):
+        return True
+    
+    logger.info(f"{busy_message}，等待完成")
+    deadline = time.monotonic() + wait_seconds
+    while not crud.try_advisory_xact_lock(db, namespace, value):
+        if time.monotonic() > deadline:
+            raise HTTPException(status_code=409, detail=f"{busy_message}，請稍後再試")
+        await asyncio.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+    return False
+
+
+async def _acquire_file_lock(db: Session, file_hash: str, file_name: str) -> bool:
+    """同一檔案同時只允許一個請求匯入"""
+    return await _wait_for_advisory_lock(
+        db, crud.ADVISORY_LOCK_FILE_HASH, file_hash,
+        SINGLE_FLIGHT_WAIT_SECONDS, f"檔案 {file_name} 正由其他請求匯入中"
+    )
+
+
+async def _acquire_ingest_locks(db: Session, factory_codes: List[str], file_type: Optional[str], file_name: str):
+    """
+    取得本檔案涉及的每個 (廠別, 報表類型) 匯入鎖
+    - 依鍵排序取得：多廠別檔案之間不會互相持有對方等待的鎖
+    """
+    values = sorted({crud.ingest_lock_value(code, file_type) for code in factory_codes})
+    for value in values:
+        await _wait_for_advisory_lock(
+            db, crud.ADVISORY_LOCK_FACTORY_INGEST, value,
+            INGEST_LOCK_WAIT_SECONDS, f"{value} 正由其他上傳匯入中（{file_name}）"
+        )
+
+
+async def _reserve_memory(file_name: str, content: bytes, wait_seconds: Optional[float] = None):
+    """估算並保留記憶體預算；單檔超過預算回 413，總預算排隊逾時回 429"""
+    from utils.memory_governor import MemoryBudgetError, plan_upload, reserve
+    try:
+        plan = plan_upload(file_name, content)
+        await reserve(plan, wait_seconds)
+    except MemoryBudgetError as e:
+        logger.warning(str(e))
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+    return plan
+
+
+def _get_replaced_upload(db: Session, replace_upload_id: Optional[int]):
+    if replace_upload_id is None:
+        return None
+    replaced_upload = crud.get_file_upload(db, replace_upload_id)
+    if not replaced_upload:
+        raise HTTPException(status_code=404, detail=f"找不到上傳記錄: {replace_upload_id}")
+    return replaced_upload
+
+
+async def ingest_file(
+    file_name: str,
+    content: bytes,
+    file_hash: str,
+    overwrite: bool,
+    replaced_upload,
+    background_tasks: BackgroundTasks,
+    db: Session
+) -> list:
+    """
+    匯入單一檔案（一般上傳與分段上傳共用）
+    回傳此檔案產生（或既有）的上傳記錄
+    """
+    from utils.report_templates import read_report
+    from utils.memory_governor import MemorySampler, release
+    from utils.ingest_pipeline import ingest_limits
+    
+    results = []
+    # 記憶體預算的保留、峰值取樣與區塊設定，檔案處理結束時一併釋放
+    memory = ExitStack()
+    
+    try:
+        logger.info(f"開始處理檔案: {file_name}")
+        
+        # 檢查是否已上傳過
+        existing_file = crud.get_file_by_hash(db, file_hash)
+        if existing_file and not overwrite:
+            logger.info(f"檔案 {file_name} 已存在，跳過")
+            return [existing_file]
+        
+        # 同一檔案同時只允許一個請求匯入（跨 worker）；鎖持有到本檔案的交易結束
+        await _acquire_file_lock(db, file_hash, file_name)
+        # 取得鎖後一律重新檢查：上面的檢查到取得鎖之間，另一個請求可能已匯入同一檔案
+        # （即使不必等待也可能發生），此時直接回傳其結果，不重複解析
+        finished = crud.get_file_by_hash(db, file_hash)
+        if finished and (not overwrite or existing_file is None or finished.id != existing_file.id):
+            logger.info(f"檔案 {file_name} 已由其他請求匯入完成，沿用其結果")
+            return [finished]
+        existing_file = finished
+        
+        # 需要在同一交易中移除的舊上傳
+        replaced = [u for u in (existing_file, replaced_upload) if u is not None]
+        
+        # 記憶體預算：讀取前依檔案大小與工作表尺寸估算，超過時縮小區塊、排隊或拒絕
+        plan = await _reserve_memory(file_name, content)
+        memory.callback(release, plan)
+        memory.enter_context(MemorySampler(plan))
+        memory.enter_context(ingest_limits(plan.chunk_rows, plan.max_pending))
+        
+        # 讀取 Excel 並套用報表版型（報表類型、標題列位置、欄位對應、廠別欄位）
+        # 讀取、解析與寫入都在執行緒池執行，不阻塞事件迴圈（同一 worker 的其他請求照常回應）
+        df, template = await run_in_threadpool(read_report, content, file_name, db)
+        file_type = template.file_type
+        logger.info(f"Excel 檔案讀取成功，共 {len(df)} 行資料，報表類型: {file_type}")
+        
+        # 資料行錯誤依規則 / 欄位彙總，不逐行輸出 log
+        errors = RowErrorCollector()
+        
+        # 整個檔案（含覆蓋時的舊資料刪除）在同一交易中完成，讀取端不會看到半套資料
+        with crud.atomic(db):
+            factory_codes = await run_in_threadpool(_detect_factories, file_name, df, template, db)
             
-            # 嘗試從檔案名稱識別廠別
-            factory_code = detect_factory_from_filename(file.filename)
+            # 同一廠別、同一報表類型的匯入依序進行，不同廠別完全並行
+            await _acquire_ingest_locks(db, factory_codes, file_type, file_name)
             
-            # 如果檔案名稱中沒有廠別，從 Excel 資料中偵測
-            if not factory_code:
-                factories = detect_factories_from_dataframe(df)
-                if not factories:
-                    error_msg = f"無法從檔案名稱或資料中識別廠別: {file.filename}"
-                    logger.error(error_msg)
-                    raise HTTPException(
-                        status_code=400,
-                        detail=error_msg
-                    )
-                
-                logger.info(f"從資料中偵測到廠別: {factories}")
-                
-                # 如果有多個廠別，需要分別處理
-                if len(factories) > 1:
-                    logger.info(f"檔案包含多個廠別: {factories}，將分別處理")
-                    for factory in factories:
-                        result = await process_single_factory(
-                            file, content, file_hash, df, factory, file_type, db
-                        )
-                        results.append(result)
-                else:
-                    factory_code = factories[0]
-                    result = await process_single_factory(
-                        file, content, file_hash, df, factory_code, file_type, db
-                    )
-                    results.append(result)
+            results, data_version = await run_in_threadpool(
+                _write_file, file_name, content, file_hash, df, template, factory_codes, replaced, errors, db
+            )
+        
+        note_data_version(data_version)
+        
+        # 通知零件銷售 cube：分類或既有資料變動時重建，新增銷售時增量同步
+        from utils.part_cube import invalidate_cube, mark_stale
+        if replaced or file_type == "Shelf Life Code":
+            invalidate_cube()
+        elif file_type == "零件銷售":
+            mark_stale()
+        
+        # 分析模式：背景更新受影響分區的 Parquet 快照
+        if ANALYTICS_ENABLED and (replaced or file_type in FILE_TYPE_TABLES):
+            if replaced:
+                background_tasks.add_task(export_snapshots, None, None)
             else:
-                logger.info(f"從檔案名稱識別到廠別: {factory_code}")
-                result = await process_single_factory(
-                    file, content, file_hash, df, factory_code, file_type, db
-                )
-                results.append(result)
+                background_tasks.add_task(export_snapshots, file_type, list(factory_codes))
         
-        except HTTPException as e:
-            logger.error(f"HTTP 錯誤: {e.detail}")
-            raise
+        # 原始資料行封存到欄式檔案（失敗不影響已提交的資料）
+        try:
+            await run_in_threadpool(write_archive, file_hash, df)
         except Exception as e:
-            logger.error(f"處理檔案 {file.filename} 時發生錯誤: {str(e)}", exc_info=True)
-            raise HTTPException(
-                status_code=500,
-                detail=f"處理檔案 {file.filename} 時發生錯誤: {str(e)}"
-            )
+            logger.warning(f"封存原始資料失敗: {str(e)}")
+    
+    except HTTPException as e:
+        logger.error(f"HTTP 錯誤: {e.detail}")
+        raise
+    except Exception as e:
+        logger.error(f"處理檔案 {file_name} 時發生錯誤: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"處理檔案 {file_name} 時發生錯誤: {str(e)}"
+        )
+    finally:
+        memory.close()
     
     return results
 
 
-async def process_single_factory(
-    file: UploadFile,
+def _detect_factories(file_name: str, df, template, db: Session) -> List[str]:
+    """識別檔案涉及的廠別：先看檔案名稱，再看資料（都沒有時 400）"""
+    from utils.factory_registry import refresh_factory_registry
+    from utils.factory_detector import (
+        detect_factory_from_filename,
+        detect_factories_from_dataframe
+    )
+    
+    # 嘗試從檔案名稱識別廠別（廠別登錄過期時先從 factories 重新載入）
+    refresh_factory_registry(db)
+    factory_code = detect_factory_from_filename(file_name)
+    
+    if factory_code:
+        logger.info(f"從檔案名稱識別到廠別: {factory_code}")
+        return [factory_code]
+    
+    # 如果檔案名稱中沒有廠別，從 Excel 資料中偵測
+    factory_codes = detect_factories_from_dataframe(df, template.factory_column)
+    if not factory_codes:
+        error_msg = f"無法從檔案名稱或資料中識別廠別: {file_name}"
+        logger.error(error_msg)
+        raise HTTPException(
+            status_code=400,
+            detail=error_msg
+        )
+    
+    logger.info(f"從資料中偵測到廠別: {factory_codes}")
+    # 如果有多個廠別，需要分別處理
+    if len(factory_codes) > 1:
+        logger.info(f"檔案包含多個廠別: {factory_codes}，將分別處理")
+    return factory_codes
+
+
+def _write_file(
+    file_name: str,
+    content: bytes,
+    file_hash: str,
+    df,
+    template,
+    factory_codes: List[str],
+    replaced: list,
+    errors: RowErrorCollector,
+    db: Session
+):
+    """
+    在 ingest_file 的交易中移除舊上傳、寫入各廠別資料並遞增資料版本
+    回傳 (上傳記錄, 資料版本)
+    """
+    from utils.report_templates import remember
+    
+    for old_upload in replaced:
+        deleted = crud.delete_file_upload(db, old_upload)
+        logger.info(f"移除上傳 {old_upload.id} 的舊資料: {deleted}")
+    
+    # 新版型與本次匯入一起提交
+    remember(db, template)
+    
+    results = {}
+    for factory in factory_codes:
+        # 多廠別檔案共用同一筆上傳記錄（factory_code 為 None），只回傳一次
+        result = process_single_factory(
+            file_name, content, file_hash, df, factory, template.file_type, db, errors, template
+        )
+        results[result.id] = result
+    results = list(results.values())
+    
+    # 整份檔案只輸出一行錯誤摘要，並記錄在上傳記錄中
+    errors.log_summary(logger, f"匯入 {file_name}")
+    error_summary = errors.summary()
+    for result in results:
+        result.error_summary = error_summary
+    db.flush()
+    
+    return results, crud.bump_data_version(db)
+
+
+def process_single_factory(
+    file_name: str,
     content: bytes,
     file_hash: str,
     df,
     factory_code: str,
     file_type: str,
-    db: Session
+    db: Session,
+    errors: RowErrorCollector,
+    template=None
 ) -> schemas.FileUploadResponse:
     """
     處理單一廠別的資料
+    template 為 utils.report_templates 辨識出的版型，指紋計算後只保留對應欄位
     """
+    from utils.factory_detector import filter_dataframe_by_factory
+    from utils.row_fingerprint import (
+        DELTA_INGEST_ENABLED,
+        DELTA_EXEMPT_FILE_TYPES,
+        compute_row_fingerprints,
+        split_new_rows,
+        register_fingerprints
+    )
+    
     logger.info(f"開始處理廠別 {factory_code} 的資料")
     
     # 如果有多個廠別，篩選該廠別的資料
-    factory_df = filter_dataframe_by_factory(df, factory_code)
+    factory_df = filter_dataframe_by_factory(
+        df, factory_code, template.factory_column if template is not None else None
+    )
     
     if len(factory_df) == 0:
         logger.warning(f"廠別 {factory_code} 沒有資料")
@@ -132,40 +456,72 @@ async def process_single_factory(
     
     logger.info(f"廠別 {factory_code} 的資料行數: {len(factory_df)}")
     
-    # 確保廠別存在
-    factory = crud.get_factory_by_code(db, factory_code)
-    if not factory:
-        logger.info(f"廠別 {factory_code} 不存在，創建新廠別")
-        factory = crud.create_factory(db, factory_code, factory_code)
+    # 增量匯入：每日累積檔只寫入未曾匯入過的資料行
+    fingerprints = None
+    written_rows = None
+    if DELTA_INGEST_ENABLED and file_type not in DELTA_EXEMPT_FILE_TYPES:
+        import pandas as pd
+        hashes = compute_row_fingerprints(factory_df)
+        is_new = split_new_rows(db, factory_code, file_type, hashes)
+        skipped = int(len(is_new) - is_new.sum())
+        if skipped:
+            logger.info(f"廠別 {factory_code} 有 {skipped} 筆資料行已匯入過，略過")
+        factory_df = factory_df[is_new]
+        # 指紋依資料行索引對應：驗證 / 轉換失敗而未寫入的資料行不登記，修正後可重新匯入
+        fingerprints = pd.Series(hashes[is_new], index=factory_df.index)
+        written_rows = []
+    
+    # 指紋以原始欄位計算；之後只需要標準欄位
+    if template is not None and template.column_mapping:
+        factory_df = template.project(factory_df)
+    
+    # 確保廠別存在（並行上傳同一新廠別時不會衝突）
+    if crud.ensure_factory(db, factory_code):
+        logger.info(f"廠別 {factory_code} 不存在，已創建新廠別")
     
     # 根據報表類型處理資料
     record_count = 0
     
     try:
         if file_type == "零件出貨":
-            record_count = await process_part_shipment(factory_df, factory_code, file_hash, db)
+            record_count = process_part_shipment(factory_df, factory_code, file_hash, db, errors, written_rows)
         elif file_type == "零件銷售":
-            record_count = await process_part_sales(factory_df, factory_code, file_hash, db)
+            record_count = process_part_sales(factory_df, factory_code, file_hash, db, errors, written_rows)
         elif file_type == "Shelf Life Code":
-            record_count = await process_shelf_life(factory_df, db)
+            record_count = process_shelf_life(factory_df, db, errors)
         elif file_type == "技師績效":
-            record_count = await process_technician_performance(factory_df, factory_code, file_hash, db)
+            record_count = process_technician_performance(
+                factory_df, factory_code, file_hash, db, errors, written_rows
+            )
         elif file_type == "維修收入":
-            record_count = await process_maintenance_income(factory_df, factory_code, file_hash, db)
+            record_count = process_maintenance_income(
+                factory_df, factory_code, file_hash, db, errors, written_rows
+            )
         else:
             logger.warning(f"未知的報表類型: {file_type}")
             record_count = 0
         
         logger.info(f"成功處理 {record_count} 筆記錄")
         
+        if fingerprints is not None:
+            register_fingerprints(db, factory_code, file_type, fingerprints.loc[written_rows].values, file_hash)
+        
     except Exception as e:
         logger.error(f"處理 {file_type} 資料時出錯: {str(e)}", exc_info=True)
         raise
     
+    # 多廠別檔案：同一交易中已為其他廠別建立過記錄時，合併為一筆（file_hash 唯一）
+    file_upload = crud.get_file_by_hash(db, file_hash)
+    if file_upload:
+        file_upload.factory_code = None
+        file_upload.record_count = (file_upload.record_count or 0) + record_count
+        db.flush()
+        return file_upload
+    
     # 建立檔案上傳記錄
     file_upload = crud.create_file_upload(
         db,
-        file_name=file.filename,
+        file_name=file_name,
         file_hash=file_hash,
         factory_code=factory_code,
         file_type=file_type,
@@ -177,100 +533,117 @@ async def process_single_factory(
     return file_upload
 
 
-async def process_part_shipment(df, factory_code: str, file_hash: str, db: Session) -> int:
-    """處理零件出貨資料"""
+def process_part_shipment(
+    df,
+    factory_code: str,
+    file_hash: str,
+    db: Session,
+    errors: RowErrorCollector,
+    written_rows: Optional[list] = None
+) -> int:
+    """處理零件出貨資料（解析與寫入以管線方式重疊進行）"""
     logger.info(f"開始處理零件出貨資料，廠別: {factory_code}")
     
+    from utils.excel_parser import ExcelParser
+    from utils.ingest_pipeline import run_ingest
     parser = ExcelParser()
-    records = parser.parse_part_shipment(df, factory_code)
     
-    shipments = []
-    for record in records:
-        try:
-            # 獲取或創建工單
-            work_order = crud.get_or_create_work_order(
-                db, factory_code, record['order_number']
-            )
-            
-            # 獲取或創建零件分類
-            part_category = crud.get_or_create_part_category(
-                db, record['part_number']
-            )
-            
-            # 創建零件出貨模型對象
-            shipment = models.PartShipment(
-                factory_code=factory_code,
-                order_number=record['order_number'],
-                work_order_id=work_order.id,
-                part_number=record['part_number'],
-                quantity=record['quantity'],
-                amount=record['amount'],
-                shipment_date=record.get('shipment_date'),
-                file_upload_id=file_hash
-            )
-            shipments.append(shipment)
-        except Exception as e:
-            logger.error(f"處理零件出貨記錄時出錯: {str(e)}")
-            continue
+    def write(records) -> int:
+        # 工單與零件分類整批 upsert（排序寫入，並行匯入不會死結）
+        work_order_ids = crud.upsert_work_orders(db, factory_code, (r['order_number'] for r in records))
+        crud.upsert_part_categories(db, (r['part_number'] for r in records))
+        shipments = []
+        for record in records:
+            try:
+                # 創建零件出貨模型對象
+                shipment = models.PartShipment(
+                    factory_code=factory_code,
+                    order_number=record['order_number'],
+                    work_order_id=work_order_ids[record['order_number']],
+                    part_number=record['part_number'],
+                    quantity=record['quantity'],
+                    amount=record['amount'],
+                    shipment_date=record.get('shipment_date'),
+                    file_upload_id=file_hash,
+                    source_row=record.get('source_row')
+                )
+                shipments.append(shipment)
+            except Exception as e:
+                errors.add("write_error", None, record.get('source_row'), e)
+                continue
+        
+        # 批量插入
+        if shipments:
+            crud.bulk_insert_part_shipments(db, shipments)
+            if written_rows is not None:
+                written_rows.extend(item.source_row for item in shipments)
+        return len(shipments)
     
-    # 批量插入
-    if shipments:
-        crud.bulk_insert_part_shipments(db, shipments)
+    count = run_ingest(df, lambda chunk: parser.parse_part_shipment(chunk, factory_code, errors), write)
     
-    logger.info(f"零件出貨資料處理完成，共 {len(shipments)} 筆")
-    return len(shipments)
+    logger.info(f"零件出貨資料處理完成，共 {count} 筆")
+    return count
 
 
-async def process_part_sales(df, factory_code: str, file_hash: str, db: Session) -> int:
-    """處理零件銷售資料"""
+def process_part_sales(
+    df,
+    factory_code: str,
+    file_hash: str,
+    db: Session,
+    errors: RowErrorCollector,
+    written_rows: Optional[list] = None
+) -> int:
+    """處理零件銷售資料（解析與寫入以管線方式重疊進行）"""
     logger.info(f"開始處理零件銷售資料，廠別: {factory_code}")
     
+    from utils.excel_parser import ExcelParser
+    from utils.ingest_pipeline import run_ingest
     parser = ExcelParser()
-    records = parser.parse_part_sales(df, factory_code)
     
-    sales = []
-    for record in records:
-        try:
-            # 獲取或創建工單
-            work_order = crud.get_or_create_work_order(
-                db, factory_code, record['order_number']
-            )
-            
-            # 獲取或創建零件分類
-            part_category = crud.get_or_create_part_category(
-                db, record['part_number']
-            )
-            
-            # 創建零件銷售模型對象
-            sale = models.PartSale(
-                factory_code=factory_code,
-                order_number=record['order_number'],
-                work_order_id=work_order.id,
-                part_number=record['part_number'],
-                quantity=record['quantity'],
-                amount=record['amount'],
-                sale_date=record.get('sale_date'),
-                file_upload_id=file_hash
-            )
-            sales.append(sale)
-        except Exception as e:
-            logger.error(f"處理零件銷售記錄時出錯: {str(e)}")
-            continue
+    def write(records) -> int:
+        # 工單與零件分類整批 upsert（排序寫入，並行匯入不會死結）
+        work_order_ids = crud.upsert_work_orders(db, factory_code, (r['order_number'] for r in records))
+        crud.upsert_part_categories(db, (r['part_number'] for r in records))
+        sales = []
+        for record in records:
+            try:
+                # 創建零件銷售模型對象
+                sale = models.PartSale(
+                    factory_code=factory_code,
+                    order_number=record['order_number'],
+                    work_order_id=work_order_ids[record['order_number']],
+                    part_number=record['part_number'],
+                    quantity=record['quantity'],
+                    amount=record['amount'],
+                    sale_date=record.get('sale_date'),
+                    file_upload_id=file_hash,
+                    source_row=record.get('source_row')
+                )
+                sales.append(sale)
+            except Exception as e:
+                errors.add("write_error", None, record.get('source_row'), e)
+                continue
+        
+        # 批量插入
+        if sales:
+            crud.bulk_insert_part_sales(db, sales)
+            if written_rows is not None:
+                written_rows.extend(item.source_row for item in sales)
+        return len(sales)
     
-    # 批量插入
-    if sales:
-        crud.bulk_insert_part_sales(db, sales)
+    count = run_ingest(df, lambda chunk: parser.parse_part_sales(chunk, factory_code, errors), write)
     
-    logger.info(f"零件銷售資料處理完成，共 {len(sales)} 筆")
-    return len(sales)
+    logger.info(f"零件銷售資料處理完成，共 {count} 筆")
+    return count
 
 
-async def process_shelf_life(df, db: Session) -> int:
+def process_shelf_life(df, db: Session, errors: RowErrorCollector) -> int:
     """處理 Shelf Life Code 資料"""
     logger.info("開始處理 Shelf Life Code 資料")
     
+    from utils.excel_parser import ExcelParser
     parser = ExcelParser()
-    records = parser.parse_shelf_life(df)
+    records = parser.parse_shelf_life(df, errors)
     
     count = 0
     for record in records:
@@ -283,85 +656,152 @@ async def process_shelf_life(df, db: Session) -> int:
             )
             count += 1
         except Exception as e:
-            logger.error(f"處理 Shelf Life 記錄時出錯: {str(e)}")
+            errors.add("write_error", "part_number", None, e)
             continue
     
     logger.info(f"Shelf Life Code 資料處理完成，共 {count} 筆")
     return count
 
 
-async def process_technician_performance(df, factory_code: str, file_hash: str, db: Session) -> int:
-    """處理技師績效資料"""
+def process_technician_performance(
+    df,
+    factory_code: str,
+    file_hash: str,
+    db: Session,
+    errors: RowErrorCollector,
+    written_rows: Optional[list] = None
+) -> int:
+    """處理技師績效資料（解析與寫入以管線方式重疊進行）"""
     logger.info(f"開始處理技師績效資料，廠別: {factory_code}")
     
+    from utils.excel_parser import ExcelParser
+    from utils.ingest_pipeline import run_ingest
     parser = ExcelParser()
-    records = parser.parse_technician_performance(df, factory_code)
     
-    performances = []
-    for record in records:
-        try:
-            # 獲取或創建工單
-            work_order = crud.get_or_create_work_order(
-                db, factory_code, record['order_number']
-            )
-            
-            # 創建技師績效模型對象
-            performance = models.TechnicianPerformance(
-                factory_code=factory_code,
-                order_number=record['order_number'],
-                work_order_id=work_order.id,
-                technician_name=record['technician_name'],
-                hours=record['hours'],
-                hourly_rate=record['hourly_rate'],
-                bonus=record.get('bonus', 0),
-                file_upload_id=file_hash
-            )
-            performances.append(performance)
-        except Exception as e:
-            logger.error(f"處理技師績效記錄時出錯: {str(e)}")
-            continue
+    def write(records) -> int:
+        # 工單與技師名單整批 upsert（排序寫入，並行匯入不會死結）
+        work_order_ids = crud.upsert_work_orders(db, factory_code, (r['order_number'] for r in records))
+        crud.upsert_technicians(db, factory_code, (r['technician_name'] for r in records))
+        performances = []
+        for record in records:
+            try:
+                # 創建技師績效模型對象（薪資 = 工時 × 時薪）
+                performance = models.TechnicianPerformance(
+                    factory_code=factory_code,
+                    order_number=record['order_number'],
+                    work_order_id=work_order_ids[record['order_number']],
+                    technician_name=record['technician_name'],
+                    work_hours=record['hours'],
+                    salary=record['hours'] * record['hourly_rate'],
+                    bonus=record.get('bonus', 0),
+                    performance_date=record.get('performance_date'),
+                    file_upload_id=file_hash,
+                    source_row=record.get('source_row')
+                )
+                performances.append(performance)
+            except Exception as e:
+                errors.add("write_error", None, record.get('source_row'), e)
+                continue
+        
+        # 批量插入
+        if performances:
+            crud.bulk_insert_technician_performance(db, performances)
+            if written_rows is not None:
+                written_rows.extend(item.source_row for item in performances)
+        return len(performances)
     
-    # 批量插入
-    if performances:
-        crud.bulk_insert_technician_performance(db, performances)
+    count = run_ingest(df, lambda chunk: parser.parse_technician_performance(chunk, factory_code, errors), write)
     
-    logger.info(f"技師績效資料處理完成，共 {len(performances)} 筆")
-    return len(performances)
+    logger.info(f"技師績效資料處理完成，共 {count} 筆")
+    return count
 
 
-async def process_maintenance_income(df, factory_code: str, file_hash: str, db: Session) -> int:
-    """處理維修收入資料"""
+def process_maintenance_income(
+    df,
+    factory_code: str,
+    file_hash: str,
+    db: Session,
+    errors: RowErrorCollector,
+    written_rows: Optional[list] = None
+) -> int:
+    """處理維修收入資料（解析與寫入以管線方式重疊進行）"""
     logger.info(f"開始處理維修收入資料，廠別: {factory_code}")
     
+    from utils.excel_parser import ExcelParser
+    from utils.ingest_pipeline import run_ingest
     parser = ExcelParser()
-    records = parser.parse_maintenance_income(df, factory_code)
     
-    incomes = []
-    for record in records:
-        try:
-            # 獲取或創建工單
-            work_order = crud.get_or_create_work_order(
-                db, factory_code, record['order_number']
-            )
-            
-            # 創建維修收入模型對象
-            income = models.MaintenanceIncome(
-                factory_code=factory_code,
-                order_number=record['order_number'],
-                work_order_id=work_order.id,
-                category=record['category'],
-                amount=record['amount'],
-                income_date=record.get('income_date'),
-                file_upload_id=file_hash
-            )
-            incomes.append(income)
-        except Exception as e:
-            logger.error(f"處理維修收入記錄時出錯: {str(e)}")
-            continue
+    def write(records) -> int:
+        # 工單整批 upsert（排序寫入，並行匯入不會死結）
+        work_order_ids = crud.upsert_work_orders(db, factory_code, (r['order_number'] for r in records))
+        incomes = []
+        for record in records:
+            try:
+                # 創建維修收入模型對象
+                income = models.MaintenanceIncome(
+                    factory_code=factory_code,
+                    order_number=record['order_number'],
+                    work_order_id=work_order_ids[record['order_number']],
+                    income_category=record['category'],
+                    amount=record['amount'],
+                    income_date=record.get('income_date'),
+                    file_upload_id=file_hash,
+                    source_row=record.get('source_row')
+                )
+                incomes.append(income)
+            except Exception as e:
+                errors.add("write_error", None, record.get('source_row'), e)
+                continue
+        
+        # 批量插入
+        if incomes:
+            crud.bulk_insert_maintenance_income(db, incomes)
+            if written_rows is not None:
+                written_rows.extend(item.source_row for item in incomes)
+        return len(incomes)
+    
+    count = run_ingest(df, lambda chunk: parser.parse_maintenance_income(chunk, factory_code, errors), write)
+    
+    logger.info(f"維修收入資料處理完成，共 {count} 筆")
+    return count
+
+
+@router.delete("/{upload_id}")
+def undo_upload(
+    upload_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """
+    撤銷上傳
+    - 刪除該次上傳寫入四張事實資料表的所有資料
+    - 刪除上傳記錄，同一檔案可重新上傳
+    """
+    file_upload = crud.get_file_upload(db, upload_id)
+    if not file_upload:
+        raise HTTPException(status_code=404, detail=f"找不到上傳記錄: {upload_id}")
+    
+    # 記錄已刪除，提交後無法再從 ORM 物件讀取，先取出之後需要的欄位
+    file_hash = file_upload.file_hash
+    factory_code = file_upload.factory_code
+    file_type = file_upload.file_type
+    file_name = file_upload.file_name
+    
+    with crud.atomic(db):
+        deleted = crud.delete_file_upload(db, file_upload)
+        data_version = crud.bump_data_version(db)
+    note_data_version(data_version)
+    delete_archive(file_hash)
+    
+    from utils.part_cube import invalidate_cube
+    invalidate_cube()
     
-    # 批量插入
-    if incomes:
-        crud.bulk_insert_maintenance_income(db, incomes)
+    if ANALYTICS_ENABLED:
+        background_tasks.add_task(export_snapshots, file_type, [factory_code] if factory_code else None)
     
-    logger.info(f"維修收入資料處理完成，共 {len(incomes)} 筆")
-    return len(incomes)
+    logger.info(f"已撤銷上傳 {upload_id}: {deleted}")
+    return {
+        "upload_id": upload_id,
+        "file_name": file_name,
+        "deleted": deleted
+    }
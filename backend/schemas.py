@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict
 from datetime import date, datetime
 from decimal import Decimal
 
@@ -16,6 +16,20 @@ class Factory(FactoryBase):
         from_attributes = True
 
 # 檔案上傳相關
+class RowErrorSample(BaseModel):
+    row: Optional[int] = Field(description="原始資料行索引（對應 source_row）")
+    value: Optional[str]
+
+class RowErrorGroup(BaseModel):
+    rule: str = Field(description="required / integer / number / date / write_error")
+    column: Optional[str]
+    count: int
+    samples: List[RowErrorSample]
+
+class RowErrorSummary(BaseModel):
+    total: int
+    errors: List[RowErrorGroup]
+
 class FileUploadResponse(BaseModel):
     id: int
     file_name: str
@@ -25,10 +39,50 @@ class FileUploadResponse(BaseModel):
     record_count: int
     status: str
     upload_date: datetime
+    error_summary: Optional[RowErrorSummary] = None
     
     class Config:
         from_attributes = True
 
+class UploadSessionCreate(BaseModel):
+    file_name: str = Field(..., min_length=1, max_length=255)
+    total_size: int = Field(..., gt=0, description="檔案大小（bytes）")
+
+class UploadSession(BaseModel):
+    session_id: str
+    file_name: str
+    total_size: int
+    received_bytes: int
+    ranges: List[List[int]] = Field(description="已收到的區段 [start, end)")
+    complete: bool
+    chunk_size: int = Field(description="建議的分段大小（bytes）")
+
+class ValidationSample(BaseModel):
+    row: int
+    value: Optional[str]
+
+class ValidationRule(BaseModel):
+    rule: str = Field(description="required / integer / number / date / missing_column")
+    column: str
+    source_column: Optional[str]
+    invalid_count: int
+    samples: List[ValidationSample]
+
+class ValidationReport(BaseModel):
+    file_name: str
+    file_type: Optional[str]
+    factories: Dict[str, int] = Field(description="偵測到的廠別與各自的資料行數")
+    factory_source: Optional[str] = Field(description="filename / data")
+    row_count: int
+    mapped_columns: Dict[str, str] = Field(description="原始標題 -> 標準欄位")
+    missing_columns: List[str]
+    unmapped_columns: List[str]
+    valid_rows: int
+    invalid_rows: int
+    rules: List[ValidationRule]
+    errors: List[str]
+    elapsed_ms: float
+
 # 業績相關
 class FactoryPerformance(BaseModel):
     factory_code: str
@@ -51,6 +105,63 @@ class TechnicianPerformanceSummary(BaseModel):
     total_income: Decimal
     avg_hourly_rate: Decimal
 
+class TechnicianLeaderboardEntry(BaseModel):
+    factory_code: str
+    factory_name: Optional[str]
+    technician_name: str
+    rank: int
+    percentile: float
+    technician_count: int
+    total_orders: int
+    total_hours: Decimal
+    total_income: Decimal
+    previous_income: Optional[Decimal]
+    previous_rank: Optional[int]
+    income_change: Decimal
+    income_change_ratio: Optional[Decimal]
+
+class TechnicianLeaderboard(BaseModel):
+    start_date: date
+    end_date: date
+    previous_start_date: date
+    previous_end_date: date
+    top_n: int
+    entries: List[TechnicianLeaderboardEntry]
+
+class TrendPoint(BaseModel):
+    bucket: date
+    income: Decimal
+    parts_sales: Decimal
+    parts_shipments: Decimal
+    labor_cost: Decimal
+
+class FactoryTrend(BaseModel):
+    factory_code: str
+    points: List[TrendPoint]
+
+class PerformanceTrend(BaseModel):
+    bucket: str
+    requested_bucket: str
+    start_date: date
+    end_date: date
+    series: List[FactoryTrend]
+
+class BatchPerformanceSpec(BaseModel):
+    factory_code: str
+    start_date: date
+    end_date: date
+
+class BatchPerformanceRequest(BaseModel):
+    specs: List[BatchPerformanceSpec] = Field(..., min_length=1, max_length=200)
+    metrics: List[str] = Field(default=["income", "parts_sales", "parts_shipments", "labor_cost", "net_profit"])
+
+class BatchPerformanceResult(BaseModel):
+    spec_index: int
+    factory_code: str
+    start_date: date
+    end_date: date
+    metrics: Dict[str, Decimal]
+
 class PartSalesSummary(BaseModel):
     part_number: str
     category: Optional[str]
@@ -60,6 +171,38 @@ class PartSalesSummary(BaseModel):
     total_amount: Decimal
     avg_amount: Decimal
 
+# 搜尋 / 自動完成
+class WorkOrderSearchHit(BaseModel):
+    factory_code: str
+    order_number: str
+    match_type: str = Field(description="prefix / substring")
+    score: float
+
+class PartSearchHit(BaseModel):
+    part_number: str
+    category: Optional[str]
+    description: Optional[str]
+    match_type: str = Field(description="prefix / substring")
+    score: float
+
+class TechnicianSearchHit(BaseModel):
+    factory_code: str
+    technician_name: str
+    match_type: str = Field(description="prefix / substring")
+    score: float
+
+class SearchResults(BaseModel):
+    query: str
+    work_orders: List[WorkOrderSearchHit]
+    parts: List[PartSearchHit]
+    technicians: List[TechnicianSearchHit]
+
+class AutocompleteSuggestion(BaseModel):
+    type: str = Field(description="work_order / part / technician")
+    value: str
+    factory_code: Optional[str]
+    label: Optional[str] = Field(default=None, description="零件說明等補充文字")
+
 # 上傳結果
 class UploadResult(BaseModel):
     success: bool
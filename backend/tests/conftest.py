@@ -0,0 +1,73 @@
+import asyncio
+import hashlib
+import os
+
+# database 在載入時依環境變數建立 engine（不會立即連線）
+# 一律改用測試資料庫的連接字串，避免誤連 .env 中的正式資料庫
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+os.environ["POSTGRES_CONNECTION_STRING"] = TEST_DATABASE_URL or "postgresql://localhost/unused"
+os.environ["DATABASE_URL"] = os.environ["POSTGRES_CONNECTION_STRING"]
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ["RAW_ARCHIVE_ENABLED"] = "false"
+os.environ["ANALYTICS_ENABLED"] = "false"
+os.environ["PART_CUBE_WARMUP"] = "false"
+
+import pytest
+
+# 每個資料庫測試結束後清空的資料表
+TABLES = [
+    "part_shipments", "part_sales", "technician_performance", "maintenance_income",
+    "row_fingerprints", "file_uploads", "work_orders", "part_categories",
+    "technicians", "report_templates", "data_versions", "factories",
+]
+
+
+def reset_caches():
+    """清除各模組的程序內快取（資料表清空後 id 重新起算）"""
+    from utils import row_fingerprint, report_templates
+    from utils.factory_registry import invalidate_factory_registry
+    from utils.part_cube import invalidate_cube
+    row_fingerprint._indexes.clear()
+    report_templates._templates.clear()
+    invalidate_factory_registry()
+    invalidate_cube()
+
+
+@pytest.fixture(scope="session")
+def schema():
+    """需要 PostgreSQL：以 TEST_DATABASE_URL 指定（會清空其中的資料）"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("未設定 TEST_DATABASE_URL")
+    from database import ensure_schema
+    ensure_schema()
+
+
+@pytest.fixture
+def db(schema):
+    from sqlalchemy import text
+    from database import SessionLocal, engine
+
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"))
+        conn.execute(text("INSERT INTO factories (code, name) VALUES ('AMA', 'AMA廠'), ('AMC', 'AMC廠'), ('AMD', 'AMD廠')"))
+    reset_caches()
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def ingest(db):
+    """以 CSV 匯入 DataFrame，回傳上傳記錄"""
+    from fastapi import BackgroundTasks
+    from routers.upload import ingest_file
+
+    def run(file_name: str, df, overwrite: bool = False):
+        content = df.to_csv(index=False).encode("utf-8-sig")
+        file_hash = hashlib.sha256(content).hexdigest()
+        return asyncio.run(ingest_file(file_name, content, file_hash, overwrite, None, BackgroundTasks(), db))
+
+    return run
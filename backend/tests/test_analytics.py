@@ -0,0 +1,132 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import crud
+from utils import analytics
+
+
+@pytest.fixture
+def snapshots(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics, "ANALYTICS_ENABLED", True)
+    monkeypatch.setattr(analytics, "ANALYTICS_DIR", tmp_path)
+    return tmp_path
+
+
+def income(amount):
+    return pd.DataFrame({"工單號": ["WO1"], "分類": ["保養"], "金額": [amount], "收入日期": ["2024-05-03"]})
+
+
+def history():
+    rows = analytics.query_monthly_history(date(2024, 5, 1), date(2024, 5, 31), ["AMA", "AMC"])
+    return {row["factory_code"]: row["income"] for row in rows if row["income"]}
+
+
+def test_partial_export_is_not_available(snapshots, ingest):
+    ingest("AMA_維修收入_0501.csv", income(100.0))
+    ingest("AMC_維修收入_0501.csv", income(200.0))
+
+    analytics.export_snapshots("維修收入", ["AMA"])
+
+    # 資料表尚未完整匯出：改為匯出全部廠別
+    assert history() == {"AMA": 100.0, "AMC": 200.0}
+    # 其他資料表尚未匯出
+    assert not analytics.snapshots_available()
+
+    analytics.export_snapshots()
+    assert analytics.snapshots_available()
+
+
+def test_failed_export_falls_back_until_next_full_export(snapshots, ingest, monkeypatch):
+    ingest("AMA_維修收入_0501.csv", income(100.0))
+    analytics.export_snapshots()
+
+    def fail(db, table, factory_code):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(analytics, "export_partition", fail)
+        analytics.export_snapshots("維修收入", ["AMA"])
+    assert not analytics.snapshots_available()
+
+    analytics.export_snapshots("維修收入", ["AMA"])
+    assert analytics.snapshots_available()
+
+
+def test_startup_refreshes_tables_exported_at_older_version(snapshots, ingest, db):
+    ingest("AMA_維修收入_0501.csv", income(100.0))
+    analytics.export_snapshots()
+
+    # 例如分析模式關閉期間的匯入：沒有更新快照（測試的 ingest 不執行背景任務）
+    ingest("AMC_維修收入_0501.csv", income(200.0))
+    assert history() == {"AMA": 100.0}
+
+    analytics.refresh_stale_snapshots()
+
+    assert analytics.snapshots_available()
+    assert history() == {"AMA": 100.0, "AMC": 200.0}
+    assert all(
+        analytics._marker_version(table) == crud.get_data_version(db) for table in analytics.SNAPSHOT_TABLES
+    )
+
+
+def test_history_etag_changes_when_snapshots_catch_up(snapshots, ingest):
+    import asyncio
+    import httpx
+    from main import app
+
+    url = "/api/performance/history?start_date=2024-05-01&end_date=2024-05-31"
+
+    def request(headers=None):
+        async def send():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                return await client.get(url, headers=headers)
+        return asyncio.run(send())
+
+    def get():
+        response = request()
+        assert response.status_code == 200
+        totals = {s["factory_code"]: float(s["points"][0]["income"]) for s in response.json()["series"]}
+        totals = {code: amount for code, amount in totals.items() if amount}
+        return response.headers["etag"], totals
+
+    ingest("AMA_維修收入_0501.csv", income(100.0))
+    analytics.export_snapshots()
+    ingest("AMC_維修收入_0501.csv", income(200.0))
+
+    # 資料版本已更新但快照尚未匯出：內容仍是舊的
+    stale_etag, stale = get()
+    assert stale == {"AMA": 100.0}
+
+    analytics.export_snapshots("維修收入", ["AMC"])
+
+    etag, totals = get()
+    assert totals == {"AMA": 100.0, "AMC": 200.0}
+    assert etag != stale_etag
+    assert request({"If-None-Match": etag}).status_code == 304
+
+
+@pytest.mark.parametrize("factory_code", [None, "AMA", "AMD"])
+def test_history_matches_postgres(snapshots, ingest, db, factory_code):
+    ingest("AMA_維修收入_0501.csv", income(100.0))
+    ingest("AMC_技師績效_0501.csv", pd.DataFrame({
+        "工單號": ["WO1"], "技師名稱": ["王小明"], "工時": [2], "時薪": [500], "獎金": [100], "日期": ["2024-06-01"],
+    }))
+    analytics.export_snapshots()
+
+    def normalize(rows):
+        return [
+            (row["factory_code"], row["bucket"], float(row["income"]), float(row["labor_cost"]))
+            for row in rows
+        ]
+
+    start, end = date(2024, 4, 1), date(2024, 6, 30)
+    postgres = crud.get_performance_trend(db, start, end, "month", factory_code)
+    factory_codes = [factory.code for factory in crud.get_factories(db)]
+    duckdb = analytics.query_monthly_history(start, end, factory_codes, factory_code)
+
+    assert normalize(duckdb) == normalize(postgres)
+    # AMD 沒有任何資料仍補齊各月份
+    assert {row["factory_code"] for row in duckdb} == ({"AMA", "AMC", "AMD"} if factory_code is None else {factory_code})
+    assert len(duckdb) == 3 * (3 if factory_code is None else 1)
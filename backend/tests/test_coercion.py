@@ -0,0 +1,81 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import coercion
+from utils.coercion import coerce_date, coerce_fields, coerce_number, coerce_text
+from utils.row_errors import RowErrorCollector
+
+
+@pytest.fixture(autouse=True)
+def clear_converter_cache():
+    coercion._converter_cache.clear()
+
+
+def dates(values, name="日期"):
+    result = coerce_date(pd.Series(values, name=name))
+    return [None if pd.isna(value) else value.date() for value in result]
+
+
+@pytest.mark.parametrize("values", [
+    ["113/05/01", "113-5-2"],
+    ["113年5月1日", "113年05月02日"],
+    ["1130501", "1130502"],
+    [1130501, 1130502],
+    # 讀取器把整數欄位讀成浮點數（有空白儲存格時）
+    [1130501.0, 1130502.0],
+    ["1130501.0", "1130502.0"],
+])
+def test_roc_dates(values):
+    assert dates(values) == [date(2024, 5, 1), date(2024, 5, 2)]
+
+
+@pytest.mark.parametrize("values", [
+    ["2024-05-01", "2024-05-02"],
+    ["2024/05/01", "2024/05/02 13:30:00"],
+    [20240501.0, 20240502.0],
+    [45413, 45414],
+    [pd.Timestamp("2024-05-01"), "2024-05-02"],
+])
+def test_gregorian_and_excel_serial_dates(values):
+    assert dates(values) == [date(2024, 5, 1), date(2024, 5, 2)]
+
+
+def test_blank_and_invalid_dates_are_nat():
+    assert dates([1130501.0, np.nan, 1131340.0]) == [date(2024, 5, 1), None, None]
+    assert dates(["2024-05-01", "not a date", None]) == [date(2024, 5, 1), None, None]
+
+
+def test_numbers():
+    values = pd.Series(["1,234", "NT$ 56", "(78)", "90-", "１２３", "12.5元", "abc", None], name="金額")
+    result = coerce_number(values)
+    assert result[:6].tolist() == [1234.0, 56.0, -78.0, -90.0, 123.0, 12.5]
+    assert result[6:].isna().all()
+
+
+def test_text_is_normalized():
+    assert coerce_text(pd.Series(["  ＡＭＡ　", None, 12])).tolist() == ["AMA", "", "12"]
+
+
+def test_coerce_fields_marks_invalid_rows_and_reports_rules():
+    df = pd.DataFrame({
+        "order_number": ["WO1", " ", "WO3", "WO4"],
+        "quantity": ["1", "2", "x", None],
+        "sale_date": [1130501.0, 1130502.0, 1130503.0, "bad"],
+    })
+    errors = RowErrorCollector()
+
+    values, valid = coerce_fields(
+        df, {"order_number": "required", "quantity": "integer", "amount": "number", "sale_date": "date"}, errors
+    )
+
+    assert valid.tolist() == [True, False, False, False]
+    # 缺少的欄位與空白數值補 0
+    assert values["amount"].tolist() == [0.0] * 4
+    assert values.loc[0, "quantity"] == 1 and values.loc[3, "quantity"] == 0
+    assert values.loc[0, "sale_date"] == pd.Timestamp("2024-05-01")
+    assert {(group["rule"], group["column"], group["count"]) for group in errors.summary()["errors"]} == {
+        ("required", "order_number", 1), ("integer", "quantity", 1), ("date", "sale_date", 1),
+    }
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import crud
+from utils import factory_registry
+from utils.factory_detector import detect_factories_from_dataframe, detect_factory_from_filename
+from utils.factory_registry import DEFAULT_FACTORY_CODES, FactoryRegistry
+
+
+@pytest.fixture
+def loaded(monkeypatch):
+    """以 factories 資料列 rows 載入廠別登錄，測試結束後還原"""
+    previous = factory_registry._registry
+
+    def load(rows):
+        monkeypatch.setattr(crud, "get_factories", lambda db: rows)
+        return factory_registry.load_factory_registry(None)
+
+    yield load
+    factory_registry._registry = previous
+    factory_registry.invalidate_factory_registry()
+
+
+@pytest.fixture
+def registry():
+    return FactoryRegistry({"AMA": ["A廠", "ama-north"], "AMA2": [], "amc": ["C廠"]})
+
+
+def test_match_exact_ignores_case_and_whitespace(registry):
+    assert registry.match_exact(" ama ") == "AMA"
+    assert registry.match_exact("a廠") == "AMA"
+    assert registry.match_exact("AMC") == "AMC"
+    assert registry.match_exact("AMA 廠") is None
+
+
+def test_search_prefers_longest_alias(registry):
+    assert registry.search("2024_AMA2_零件銷售.xlsx") == "AMA2"
+    assert registry.search("ama-north_技師績效.csv") == "AMA"
+    assert registry.search("C廠_維修收入.csv") == "AMC"
+    assert registry.search("零件銷售.xlsx") is None
+
+
+def test_find_all_scans_values_once(registry):
+    assert registry.find_all(["出貨 AMA2 倉", "C廠", None, 42]) == {"AMA2", "AMC"}
+    assert FactoryRegistry({}).find_all(["AMA"]) == set()
+
+
+def test_empty_factories_table_falls_back_to_defaults(loaded):
+    registry = loaded([])
+
+    assert registry.codes == sorted(DEFAULT_FACTORY_CODES)
+    assert detect_factory_from_filename("AMC_零件銷售.xlsx") == "AMC"
+
+
+def test_registry_loads_aliases_from_factories(loaded):
+    loaded([SimpleNamespace(code="AMA", aliases=["北廠"]), SimpleNamespace(code="AMX", aliases=None)])
+
+    df = pd.DataFrame({"廠別": ["北廠", "AMX", "AMC"]})
+    # AMC 不在資料表中，不再視為廠別
+    assert sorted(detect_factories_from_dataframe(df)) == ["AMA", "AMX"]
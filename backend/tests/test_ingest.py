@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import time
+
+import pandas as pd
+from fastapi import BackgroundTasks
+from sqlalchemy import text
+
+import crud
+
+from routers.upload import ingest_file
+from utils import report_templates
+
+
+def sales(orders):
+    return pd.DataFrame({
+        "工單號": orders,
+        "零件編號": [f"P{i}" for i in range(len(orders))],
+        "數量": [1] * len(orders),
+        "金額": [100.0] * len(orders),
+        "銷售日期": ["2024-05-01"] * len(orders),
+    })
+
+
+def test_ingest_does_not_block_event_loop(db, monkeypatch):
+    read_report = report_templates.read_report
+
+    def slow_read_report(*args, **kwargs):
+        time.sleep(0.5)
+        return read_report(*args, **kwargs)
+
+    monkeypatch.setattr(report_templates, "read_report", slow_read_report)
+    content = sales(["WO1", "WO2"]).to_csv(index=False).encode("utf-8-sig")
+
+    async def scenario():
+        ticks = 0
+        upload = asyncio.ensure_future(ingest_file(
+            "AMA_零件銷售_0501.csv", content, hashlib.sha256(content).hexdigest(),
+            False, None, BackgroundTasks(), db
+        ))
+        while not upload.done():
+            ticks += 1
+            await asyncio.sleep(0.05)
+        return ticks, upload.result()
+
+    ticks, [result] = asyncio.run(scenario())
+
+    assert result.record_count == 2
+    # 讀取期間事件迴圈仍持續處理其他工作
+    assert ticks >= 5
+
+
+def test_file_committed_before_lock_is_not_imported_twice(db, ingest, monkeypatch):
+
+    df = sales(["WO1", "WO2"])
+    [first] = ingest("AMA_零件銷售_0501.csv", df)
+
+    # 模擬另一個請求在本請求第一次檢查之後、取得鎖之前提交（取得鎖不必等待）
+    get_file_by_hash = crud.get_file_by_hash
+    calls = []
+
+    def racing_get_file_by_hash(db, file_hash):
+        calls.append(file_hash)
+        return None if len(calls) == 1 else get_file_by_hash(db, file_hash)
+
+    monkeypatch.setattr(crud, "get_file_by_hash", racing_get_file_by_hash)
+    [again] = ingest("AMA_零件銷售_0501.csv", df)
+
+    assert again.id == first.id
+    # 未重新檢查時會再匯入一次，併入既有記錄並清除其廠別
+    assert (again.factory_code, again.record_count) == ("AMA", 2)
+    assert db.execute(text("SELECT COUNT(*) FROM part_sales")).scalar() == 2
+
+
+def test_multi_factory_file_returns_single_upload(db, ingest):
+    df = sales(["WO1", "WO2", "WO3"])
+    df["廠別"] = ["AMA", "AMC", "AMA"]
+
+    [result] = ingest("零件銷售_0501.csv", df)
+
+    # 多廠別檔案合併為一筆上傳記錄
+    assert result.factory_code is None
+    assert result.record_count == 3
+    assert db.execute(text("SELECT factory_code, COUNT(*) FROM part_sales GROUP BY 1 ORDER BY 1")).all() == [
+        ("AMA", 2), ("AMC", 1),
+    ]
+
+
+def test_ingest_uses_a_single_pooled_connection(db, ingest):
+    from sqlalchemy import event
+    from database import engine
+
+    checkouts = []
+    listener = lambda *args: checkouts.append(args)
+    event.listen(engine, "checkout", listener)
+    try:
+        [result] = ingest("AMA_零件銷售_0501.csv", sales(["WO1", "WO2"]))
+    finally:
+        event.remove(engine, "checkout", listener)
+
+    # 維度 upsert 不另外占用連線：等待匯入鎖的請求占滿連線池時，持有鎖的請求仍能完成
+    assert result.record_count == 2
+    assert len(checkouts) == 1
@@ -0,0 +1,114 @@
+import asyncio
+import re
+import zipfile
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+from utils import memory_governor
+from utils.ingest_pipeline import INGEST_CHUNK_ROWS, INGEST_MAX_PENDING_CHUNKS
+from utils.memory_governor import MB, MemoryBudgetError
+
+# 20002 列 × 5 欄，預估資料表約 16 MB；預設區塊（5000 列 × 6 塊）約需 72 MB
+CSV = b"a,b,c,d,e\n" + b"1,2,3,4,5\n" * 20000
+
+
+@pytest.fixture(autouse=True)
+def budgets(monkeypatch):
+    monkeypatch.setattr(memory_governor, "INGEST_BYTES_PER_CELL", 160)
+    monkeypatch.setattr(memory_governor, "INGEST_MEMORY_BUDGET_MB", 1024)
+    monkeypatch.setattr(memory_governor, "INGEST_GLOBAL_MEMORY_BUDGET_MB", 2048)
+    monkeypatch.setattr(memory_governor, "_reserved_bytes", 0)
+
+
+def test_plan_keeps_defaults_within_budget():
+    plan = memory_governor.plan_upload("AMA_零件銷售.csv", CSV)
+
+    assert (plan.rows, plan.columns) == (20002, 5)
+    assert not plan.constrained
+    assert plan.reserved_bytes <= 1024 * MB
+
+
+def test_plan_shrinks_chunks_when_only_the_frame_fits(monkeypatch):
+    monkeypatch.setattr(memory_governor, "INGEST_MEMORY_BUDGET_MB", 40)
+
+    plan = memory_governor.plan_upload("AMA_零件銷售.csv", CSV)
+
+    assert plan.constrained
+    assert memory_governor.MIN_CHUNK_ROWS <= plan.chunk_rows < INGEST_CHUNK_ROWS
+    assert plan.max_pending == 1 < INGEST_MAX_PENDING_CHUNKS
+    assert plan.frame_bytes < plan.reserved_bytes <= 40 * MB
+
+
+def test_plan_rejects_frame_larger_than_budget(monkeypatch):
+    monkeypatch.setattr(memory_governor, "INGEST_MEMORY_BUDGET_MB", 10)
+
+    with pytest.raises(MemoryBudgetError) as error:
+        memory_governor.plan_upload("AMA_零件銷售.csv", CSV)
+
+    assert error.value.status_code == 413
+    assert error.value.retry_after is None
+
+
+def test_reserve_queues_until_budget_is_released(monkeypatch):
+    monkeypatch.setattr(memory_governor, "INGEST_GLOBAL_MEMORY_BUDGET_MB", 100)
+    first = memory_governor.plan_upload("AMA_零件銷售.csv", CSV)
+    second = memory_governor.plan_upload("AMC_零件銷售.csv", CSV)
+    assert first.reserved_bytes + second.reserved_bytes > 100 * MB
+
+    # 沒有其他上傳時一律放行
+    asyncio.run(memory_governor.reserve(first, wait_seconds=0))
+
+    with pytest.raises(MemoryBudgetError) as error:
+        asyncio.run(memory_governor.reserve(second, wait_seconds=0.1))
+    assert error.value.status_code == 429
+    assert error.value.retry_after >= 1
+    assert memory_governor._reserved_bytes == first.reserved_bytes
+
+    memory_governor.release(first)
+    assert memory_governor._reserved_bytes == 0
+    asyncio.run(memory_governor.reserve(second, wait_seconds=0))
+    assert memory_governor._reserved_bytes == second.reserved_bytes
+
+
+def workbook(rows: int) -> bytes:
+    buffer = BytesIO()
+    pd.DataFrame({
+        "工單號": [f"WO{i}" for i in range(rows)],
+        "零件編號": [f"P{i}" for i in range(rows)],
+        "數量": range(rows),
+        "金額": [100.0] * rows,
+    }).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def with_dimension(content: bytes, ref: str) -> bytes:
+    """改寫第一個工作表的 <dimension>（模擬匯出程式寫錯尺寸）"""
+    source, target = zipfile.ZipFile(BytesIO(content)), BytesIO()
+    with zipfile.ZipFile(target, "w") as archive:
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename == "xl/worksheets/sheet1.xml":
+                data = re.sub(rb'<dimension ref="[^"]*"', f'<dimension ref="{ref}"'.encode(), data)
+            archive.writestr(info, data)
+    return target.getvalue()
+
+
+def test_xlsx_dimensions_from_generated_workbook():
+    # 101 列（含標題列）× 4 欄；XML 大小推算的儲存格數較多時取較大者（估算只會偏高）
+    rows, columns = memory_governor._xlsx_dimensions(workbook(100))
+    assert columns == 4
+    assert rows >= 101
+
+    larger, _ = memory_governor._xlsx_dimensions(workbook(1000))
+    assert larger >= 1001
+
+
+def test_xlsx_dimensions_ignore_understated_dimension():
+    content = workbook(1000)
+
+    rows, columns = memory_governor._xlsx_dimensions(with_dimension(content, "A1:D2"))
+
+    assert columns == 4
+    assert rows >= 1001
@@ -0,0 +1,47 @@
+import time
+from datetime import date
+
+import pandas as pd
+
+import crud
+from utils import part_cube
+from utils.http_cache import note_data_version
+
+
+def sales(part, amount):
+    return pd.DataFrame({
+        "工單號": ["WO1"], "零件編號": [part], "數量": [1], "金額": [amount], "銷售日期": ["2024-05-01"],
+    })
+
+
+def totals(db):
+    result = crud.analyze_part_categories(db, start_date=date(2024, 5, 1), end_date=date(2024, 5, 31))
+    assert result["source"] == "cube"
+    return {row["category"]: row["total_amount"] for row in result["categories"]}
+
+
+def other_worker(ingest, db, file_name, df):
+    """模擬由其他 worker 匯入：本 worker 的 cube 未收到通知，只看得到資料版本改變"""
+    cube = part_cube._cube
+    ingest(file_name, df)
+    part_cube._cube = cube
+    cube.checked_at = time.monotonic()
+    note_data_version(crud.get_data_version(db))
+
+
+def test_cube_syncs_when_data_version_changes(db, ingest):
+    ingest("AMA_零件銷售_0501.csv", sales("P1", 100.0))
+    assert totals(db) == {"未分類": 100.0}
+
+    other_worker(ingest, db, "AMA_零件銷售_0502.csv", sales("P2", 50.0))
+
+    assert totals(db) == {"未分類": 150.0}
+
+
+def test_cube_rebuilds_when_categories_change(db, ingest):
+    ingest("AMA_零件銷售_0501.csv", sales("P1", 100.0))
+    assert totals(db) == {"未分類": 100.0}
+
+    other_worker(ingest, db, "AMA_Shelf Life Code.csv", pd.DataFrame({"零件編號": ["P1"], "Shelf Life Code": ["A"]}))
+
+    assert "未分類" not in totals(db)
@@ -0,0 +1,78 @@
+from datetime import date
+
+import pandas as pd
+
+import crud
+
+
+def technicians(rows):
+    """rows: (工單號, 技師名稱, 工時, 時薪, 獎金, 日期)"""
+    return pd.DataFrame(rows, columns=["工單號", "技師名稱", "工時", "時薪", "獎金", "日期"])
+
+
+def test_technician_upload_feeds_leaderboard(db, ingest):
+    ingest("AMA_技師績效_0501.csv", technicians([
+        ("WO1", "王小明", 2, 500, 100, "2024-05-01"),
+        ("WO2", "王小明", 3, 500, 0, "2024-05-20"),
+        ("WO3", "陳大同", 4, 300, 0, "2024-05-02"),
+        # 上一期
+        ("WO0", "陳大同", 1, 300, 0, "2024-04-15"),
+    ]))
+
+    entries = crud.get_technician_leaderboard(
+        db,
+        start_date=date(2024, 5, 1),
+        end_date=date(2024, 5, 31),
+        previous_start_date=date(2024, 4, 1),
+    )
+
+    assert [(e["technician_name"], e["rank"], e["total_orders"]) for e in entries] == [
+        ("王小明", 1, 2), ("陳大同", 2, 1),
+    ]
+    assert float(entries[0]["total_hours"]) == 5
+    assert float(entries[0]["total_income"]) == 2 * 500 + 100 + 3 * 500
+    assert entries[0]["previous_income"] is None
+    assert float(entries[1]["previous_income"]) == 300
+
+
+def test_trend_includes_labor_cost(db, ingest):
+    ingest("AMA_技師績效_0501.csv", technicians([
+        ("WO1", "王小明", 2, 500, 100, "2024-05-01"),
+        ("WO2", "陳大同", 4, 300, 0, "2024-06-10"),
+    ]))
+    ingest("AMA_維修收入_0501.csv", pd.DataFrame({
+        "工單號": ["WO1"], "分類": ["保養"], "金額": [3000.0], "收入日期": ["2024-05-03"],
+    }))
+
+    rows = crud.get_performance_trend(
+        db, start_date=date(2024, 5, 1), end_date=date(2024, 6, 30), bucket="month", factory_code="AMA"
+    )
+
+    assert [(row["bucket"], float(row["income"]), float(row["labor_cost"])) for row in rows] == [
+        (date(2024, 5, 1), 3000, 1100), (date(2024, 6, 1), 0, 1200),
+    ]
+
+
+def test_batch_includes_technician_metrics(db, ingest):
+    ingest("AMA_技師績效_0501.csv", technicians([
+        ("WO1", "王小明", 2, 500, 100, "2024-05-01"),
+        ("WO2", "陳大同", 4, 300, 0, "2024-05-10"),
+        ("WO3", "陳大同", 1, 300, 0, "2024-06-10"),
+    ]))
+    ingest("AMA_維修收入_0501.csv", pd.DataFrame({
+        "工單號": ["WO1"], "分類": ["保養"], "金額": [3000.0], "收入日期": ["2024-05-03"],
+    }))
+
+    rows = crud.get_batch_performance(
+        db,
+        specs=[
+            {"factory_code": "AMA", "start_date": date(2024, 5, 1), "end_date": date(2024, 5, 31)},
+            {"factory_code": "AMA", "start_date": date(2024, 6, 1), "end_date": date(2024, 6, 30)},
+        ],
+        metrics=["labor_cost", "work_hours", "technician_count", "net_profit"],
+    )
+
+    assert [{k: float(v) for k, v in row["metrics"].items()} for row in rows] == [
+        {"labor_cost": 2300, "work_hours": 6, "technician_count": 2, "net_profit": 700},
+        {"labor_cost": 300, "work_hours": 1, "technician_count": 1, "net_profit": -300},
+    ]
@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+
+import pandas as pd
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import text
+
+from routers import upload
+from routers.upload import ingest_file
+from utils import report_templates
+
+
+def titled_sales(orders):
+    """標題列上方多一列報表標題（新版型：標題列為第 1 列）"""
+    df = pd.DataFrame({
+        "工單號": orders,
+        "零件編號": [f"P{i}" for i in range(len(orders))],
+        "數量": [1] * len(orders),
+        "金額": [100.0] * len(orders),
+        "銷售日期": ["2024-05-01"] * len(orders),
+    })
+    return ("零件銷售明細表,,,,\n" + df.to_csv(index=False)).encode("utf-8-sig")
+
+
+def run(db, file_name, content):
+    file_hash = hashlib.sha256(content).hexdigest()
+    return asyncio.run(ingest_file(file_name, content, file_hash, False, None, BackgroundTasks(), db))
+
+
+def stored_templates(db):
+    return db.execute(text("SELECT file_type, header_row FROM report_templates")).all()
+
+
+def test_learned_template_is_persisted_and_reused(db, monkeypatch):
+    [first] = run(db, "AMA_零件銷售_0501.csv", titled_sales(["WO1", "WO2"]))
+
+    assert first.record_count == 2
+    assert stored_templates(db) == [("零件銷售", 1)]
+
+    # 其他 worker（沒有程序內快取）由資料庫載入版型，不再重新辨識
+    report_templates._templates.clear()
+    monkeypatch.setattr(report_templates, "_learn", lambda *args: pytest.fail("版型應由資料庫載入"))
+    [second] = run(db, "AMA_零件銷售_0601.csv", titled_sales(["WO3"]))
+
+    assert second.record_count == 1
+    assert stored_templates(db) == [("零件銷售", 1)]
+
+
+def test_rolled_back_ingest_does_not_cache_template(db, monkeypatch):
+    def fail(*args):
+        raise HTTPException(status_code=400, detail="寫入失敗")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(upload, "process_single_factory", fail)
+        with pytest.raises(HTTPException):
+            run(db, "AMA_零件銷售_0501.csv", titled_sales(["WO1"]))
+
+    assert stored_templates(db) == []
+    assert not report_templates._templates
+
+    # 下次上傳仍辨識並記錄版型
+    run(db, "AMA_零件銷售_0501.csv", titled_sales(["WO1"]))
+    assert stored_templates(db) == [("零件銷售", 1)]
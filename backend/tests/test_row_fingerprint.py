@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import crud
+from utils import row_fingerprint
+from utils.row_fingerprint import compute_row_fingerprints, split_new_rows
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """以記憶體中的清單取代 row_fingerprints 資料表"""
+    rows = []
+    monkeypatch.setattr(row_fingerprint, "_indexes", {})
+    monkeypatch.setattr(
+        crud, "get_row_fingerprints_since",
+        lambda db, factory_code, file_type, since_id=0: [(i, h) for i, h in rows if i > since_id]
+    )
+    monkeypatch.setattr(
+        crud, "get_existing_row_fingerprints",
+        lambda db, factory_code, file_type, row_hashes: [h for _, h in rows if h in set(row_hashes)]
+    )
+    return rows
+
+
+def test_fingerprints_distinguish_repeated_rows():
+    df = pd.DataFrame({"工單號": ["A1", "A1", "A2"], "數量": [1, 1, 2]})
+    fingerprints = compute_row_fingerprints(df)
+
+    assert fingerprints.dtype == np.int64
+    assert len(set(fingerprints.tolist())) == 3
+    assert (compute_row_fingerprints(df) == fingerprints).all()
+
+
+def test_split_new_rows_skips_seen_rows(stored):
+    first = pd.DataFrame({"工單號": ["A1", "A2"], "數量": [1, 2]})
+    stored.extend(enumerate(compute_row_fingerprints(first).tolist(), start=1))
+
+    grown = pd.DataFrame({"工單號": ["A1", "A2", "A3"], "數量": [1, 2, 3]})
+    is_new = split_new_rows(None, "AMA", "零件出貨", compute_row_fingerprints(grown))
+
+    assert is_new.tolist() == [False, False, True]
+
+
+def test_split_new_rows_syncs_rows_added_by_other_workers(stored):
+    df = pd.DataFrame({"工單號": ["A1", "A2"], "數量": [1, 2]})
+    fingerprints = compute_row_fingerprints(df)
+    assert split_new_rows(None, "AMA", "零件出貨", fingerprints).all()
+
+    stored.append((1, int(fingerprints[0])))
+    assert split_new_rows(None, "AMA", "零件出貨", fingerprints).tolist() == [False, True]
+
+
+def test_split_new_rows_confirms_bloom_hits(stored, monkeypatch):
+    # Bloom filter 判定可能存在時，以資料庫確認，誤判的資料行仍視為新資料
+    monkeypatch.setattr(row_fingerprint.BloomFilter, "contains", lambda self, hashes: np.ones(len(hashes), dtype=bool))
+    df = pd.DataFrame({"工單號": ["A1", "A2"], "數量": [1, 2]})
+    fingerprints = compute_row_fingerprints(df)
+    stored.append((1, int(fingerprints[1])))
+
+    assert split_new_rows(None, "AMA", "零件出貨", fingerprints).tolist() == [True, False]
+
+
+def test_rows_failing_validation_are_not_registered(db, ingest):
+    df = pd.DataFrame({
+        "工單號": ["WO1", "WO2", "WO3"],
+        "零件編號": ["P1", "P2", "P3"],
+        "數量": ["1", "abc", "3"],
+        "金額": [100, 200, 300],
+        "出貨日期": ["2024-05-01", "2024-05-02", "2024-05-03"],
+    })
+    [upload] = ingest("AMA_零件出貨_0501.csv", df)
+    assert upload.record_count == 2
+    registered = db.execute(text("SELECT COUNT(*) FROM row_fingerprints")).scalar()
+    assert registered == 2
+
+    # 修正後的累積檔：先前無效的資料行這次要寫入，其餘略過
+    corrected = df.assign(數量=["1", "2", "3"])
+    [upload] = ingest("AMA_零件出貨_0502.csv", corrected)
+    assert upload.record_count == 1
+    shipments = db.execute(text("SELECT order_number FROM part_shipments ORDER BY order_number")).scalars().all()
+    assert shipments == ["WO1", "WO2", "WO3"]
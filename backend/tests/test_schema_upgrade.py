@@ -0,0 +1,114 @@
+import pandas as pd
+import pytest
+from sqlalchemy import inspect, text
+
+import database
+
+
+def columns(table):
+    return {column["name"] for column in inspect(database.engine).get_columns(table)}
+
+
+def indexes(table):
+    return {index["name"] for index in inspect(database.engine).get_indexes(table)}
+
+
+def trgm_available():
+    with database.engine.connect() as conn:
+        return bool(conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar())
+
+
+@pytest.fixture
+def upgrades(monkeypatch):
+    """伺服器沒有 pg_trgm 時（例如精簡版 PostgreSQL）略過需要它的升級項目，其餘照常驗證"""
+    if not trgm_available():
+        monkeypatch.setattr(database, "SCHEMA_UPGRADES", [
+            statement for statement in database.SCHEMA_UPGRADES if "trgm" not in statement
+        ])
+    return database.SCHEMA_UPGRADES
+
+
+def mark_previous_release():
+    with database.engine.begin() as conn:
+        conn.execute(text("UPDATE schema_version SET version = 'previous-release'"))
+
+
+def test_upgrade_adds_columns_missing_from_existing_tables(db, ingest, upgrades):
+    # 模擬以舊版 ORM 定義 create_all 建立、且已記錄過版本的資料庫
+    with database.engine.begin() as conn:
+        for table in ("part_shipments", "part_sales", "technician_performance", "maintenance_income"):
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN source_row"))
+        conn.execute(text("ALTER TABLE file_uploads DROP COLUMN error_summary"))
+        conn.execute(text("ALTER TABLE factories DROP COLUMN aliases"))
+        # 升級後以唯一索引補回（不是約束），重複執行測試時兩種都可能存在
+        conn.execute(text("ALTER TABLE work_orders DROP CONSTRAINT IF EXISTS work_orders_factory_code_order_number_key"))
+        conn.execute(text("DROP INDEX IF EXISTS work_orders_factory_code_order_number_key"))
+        conn.execute(text("DROP INDEX idx_part_sales_upload"))
+        conn.execute(text("UPDATE schema_version SET version = 'previous-release'"))
+
+    database.ensure_schema()
+
+    assert "source_row" in columns("part_sales")
+    assert "error_summary" in columns("file_uploads")
+    assert "aliases" in columns("factories")
+    assert "idx_part_sales_upload" in indexes("part_sales")
+    assert "idx_technicians_name_prefix" in indexes("technicians")
+    with database.engine.connect() as conn:
+        stored = conn.execute(text("SELECT version FROM schema_version WHERE id = 1")).scalar()
+    assert stored == database.schema_fingerprint()
+
+    [upload] = ingest("AMA_零件銷售_0501.csv", pd.DataFrame({
+        "工單號": ["WO1"], "零件編號": ["P1"], "數量": [1], "金額": [10.0], "銷售日期": ["2024-05-01"],
+    }))
+    assert upload.record_count == 1
+
+
+def test_failed_upgrade_does_not_stamp_version(db, monkeypatch):
+    mark_previous_release()
+    monkeypatch.setattr(database, "SCHEMA_UPGRADES", ["ALTER TABLE no_such_table ADD COLUMN x INTEGER"])
+
+    database.ensure_schema()
+
+    with database.engine.connect() as conn:
+        stored = conn.execute(text("SELECT version FROM schema_version WHERE id = 1")).scalar()
+    assert stored == "previous-release"
+
+
+def test_upgrade_indexes_fingerprints_by_upload(db, upgrades):
+    with database.engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS idx_row_fingerprints_upload"))
+    mark_previous_release()
+
+    database.ensure_schema()
+
+    index = next(i for i in inspect(database.engine).get_indexes("row_fingerprints") if i["name"] == "idx_row_fingerprints_upload")
+    assert index["column_names"] == ["file_upload_id"]
+
+
+def test_upgrade_backfills_technicians_from_performance(db, ingest, upgrades):
+    ingest("AMA_技師績效_0501.csv", pd.DataFrame({
+        "工單號": ["WO1", "WO2"], "技師名稱": ["王小明", "陳大同"], "工時": [1, 2], "時薪": [300, 300],
+    }))
+    with database.engine.begin() as conn:
+        conn.execute(text("DELETE FROM technicians"))
+    mark_previous_release()
+
+    database.ensure_schema()
+
+    names = db.execute(text("SELECT factory_code, technician_name FROM technicians ORDER BY technician_name")).all()
+    assert [tuple(row) for row in names] == [("AMA", "王小明"), ("AMA", "陳大同")]
+
+
+def test_upgrade_creates_search_indexes(db):
+    if not trgm_available():
+        pytest.skip("PostgreSQL 沒有 pg_trgm")
+    with database.engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS idx_technicians_name_trgm"))
+        conn.execute(text("DROP INDEX IF EXISTS idx_work_orders_number_prefix"))
+    mark_previous_release()
+
+    database.ensure_schema()
+
+    assert {"idx_technicians_name_trgm", "idx_technicians_name_prefix"} <= indexes("technicians")
+    assert {"idx_work_orders_number_trgm", "idx_work_orders_number_prefix"} <= indexes("work_orders")
+    assert {"idx_part_categories_number_trgm", "idx_part_categories_description_trgm"} <= indexes("part_categories")
@@ -0,0 +1,44 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+import crud
+from routers import reports
+
+
+@pytest.fixture
+def trgm(db):
+    """搜尋的相似度排序需要 pg_trgm（精簡版 PostgreSQL 沒有時略過）"""
+    if not db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar():
+        pytest.skip("資料庫未安裝 pg_trgm")
+    return db
+
+
+@pytest.mark.parametrize("route", [reports.search, reports.autocomplete])
+def test_blank_query_is_rejected(route):
+    with pytest.raises(HTTPException) as error:
+        route(q="   ", types="work_order,part,technician", factory_code=None, limit=5, db=None)
+
+    assert error.value.status_code == 400
+
+
+def test_prefix_hits_rank_before_substring_hits(trgm, monkeypatch):
+    crud.upsert_work_orders(trgm, "AMA", ["XWO123", "WO1234", "WO123"])
+    crud.upsert_work_orders(trgm, "AMC", ["WO1239"])
+    trgm.commit()
+
+    hits = crud.search_work_orders(trgm, "WO123", "AMA")
+    assert [(h["order_number"], h["match_type"]) for h in hits] == [
+        ("WO123", "prefix"), ("WO1234", "prefix"), ("XWO123", "substring"),
+    ]
+
+    # 候選上限只影響子字串結果
+    monkeypatch.setattr(crud, "SEARCH_CANDIDATE_LIMIT", 0)
+    assert [h["order_number"] for h in crud.search_work_orders(trgm, "WO123", "AMA")] == ["WO123", "WO1234"]
+
+
+def test_short_query_only_matches_prefix(trgm):
+    crud.upsert_part_categories(trgm, ["AB100", "XAB"])
+    trgm.commit()
+
+    assert [h["part_number"] for h in crud.search_parts(trgm, "AB")] == ["AB100"]
@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import text
+
+import crud
+from routers.upload import undo_upload
+
+
+def sales(orders):
+    return pd.DataFrame({
+        "工單號": orders,
+        "零件編號": [f"P{i}" for i in range(len(orders))],
+        "數量": [1] * len(orders),
+        "金額": [100.0] * len(orders),
+        "銷售日期": ["2024-05-01"] * len(orders),
+    })
+
+
+def count(db, table):
+    return db.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+
+def test_undo_removes_rows_record_and_fingerprints(db, ingest):
+    [upload] = ingest("AMA_零件銷售_0501.csv", sales(["WO1", "WO2", "WO3"]))
+    upload_id, file_name = upload.id, upload.file_name
+    version = crud.get_data_version(db)
+
+    result = undo_upload(upload_id, BackgroundTasks(), db)
+
+    assert result == {
+        "upload_id": upload_id,
+        "file_name": file_name,
+        "deleted": {
+            "part_shipments": 0, "part_sales": 3, "technician_performance": 0,
+            "maintenance_income": 0, "row_fingerprints": 3,
+        },
+    }
+    assert count(db, "part_sales") == 0
+    assert count(db, "file_uploads") == 0
+    assert crud.get_data_version(db) == version + 1
+
+
+def test_undone_file_can_be_uploaded_again(db, ingest):
+    df = sales(["WO1", "WO2"])
+    [upload] = ingest("AMA_零件銷售_0501.csv", df)
+    undo_upload(upload.id, BackgroundTasks(), db)
+
+    [again] = ingest("AMA_零件銷售_0501.csv", df)
+
+    assert again.record_count == 2
+    assert count(db, "part_sales") == 2
+
+
+def test_undo_unknown_upload_is_404(db):
+    with pytest.raises(HTTPException) as raised:
+        undo_upload(12345, BackgroundTasks(), db)
+    assert raised.value.status_code == 404
@@ -0,0 +1,86 @@
+import hashlib
+import os
+
+import pytest
+
+from utils import upload_sessions
+from utils.upload_sessions import UploadSessionError
+
+CONTENT = os.urandom(10_000)
+
+
+@pytest.fixture(autouse=True)
+def session_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_sessions, "UPLOAD_SESSION_DIR", tmp_path)
+    # 小區塊：補算雜湊時需要讀取多個區塊
+    monkeypatch.setattr(upload_sessions, "UPLOAD_CHUNK_BYTES", 1024)
+    monkeypatch.setattr(upload_sessions, "_hashers", {})
+    return tmp_path
+
+
+def upload(chunks):
+    """chunks: (起點, 終點) 依序寫入，回傳工作階段 id"""
+    session_id = upload_sessions.create_session("AMA_零件銷售.xlsx", len(CONTENT))["session_id"]
+    for start, end in chunks:
+        upload_sessions.write_chunk(session_id, start, CONTENT[start:end])
+    return session_id
+
+
+def finalize(session_id):
+    file_name, content, digest = upload_sessions.finalize_session(session_id)
+    assert file_name == "AMA_零件銷售.xlsx"
+    assert content == CONTENT
+    return digest
+
+
+def test_in_order_chunks_hash_incrementally():
+    session_id = upload([(0, 4000), (4000, 8000), (8000, 10_000)])
+
+    assert upload_sessions._hashers[session_id].offset == len(CONTENT)
+    assert finalize(session_id) == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_out_of_order_and_overlapping_chunks():
+    session_id = upload([(6000, 10_000), (2000, 7000), (0, 3000), (2500, 2600)])
+
+    state = upload_sessions.get_session(session_id)
+    assert state["ranges"] == [[0, 10_000]]
+    assert state["complete"]
+    assert finalize(session_id) == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_hash_is_recomputed_after_restart():
+    session_id = upload([(0, 5000)])
+    # 重啟或換 worker：記憶體中的雜湊狀態遺失
+    upload_sessions._hashers.clear()
+    upload_sessions.write_chunk(session_id, 5000, CONTENT[5000:])
+
+    assert finalize(session_id) == hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.mark.parametrize("offset", [-1, 9_000])
+def test_out_of_range_chunk_is_rejected(offset):
+    session_id = upload([])
+
+    with pytest.raises(UploadSessionError) as error:
+        upload_sessions.write_chunk(session_id, offset, CONTENT[:2000])
+
+    assert error.value.status_code == 416
+
+
+def test_finalize_with_missing_bytes_is_rejected():
+    session_id = upload([(0, 4000), (5000, 10_000)])
+
+    with pytest.raises(UploadSessionError) as error:
+        upload_sessions.finalize_session(session_id)
+
+    assert error.value.status_code == 409
+    assert "1000" in str(error.value)
+
+
+@pytest.mark.parametrize("session_id", ["../etc", "A" * 32, "0" * 31, "0" * 32])
+def test_unknown_or_malformed_session_id(session_id):
+    with pytest.raises(UploadSessionError) as error:
+        upload_sessions.write_chunk(session_id, 0, b"x")
+
+    assert error.value.status_code == 404
@@ -0,0 +1,61 @@
+import pandas as pd
+
+from utils.upload_validator import validate_dataframe
+
+
+def rules_by_key(report):
+    return {(rule["rule"], rule["column"]): rule for rule in report["rules"]}
+
+
+def test_maps_columns_and_counts_invalid_rows():
+    df = pd.DataFrame({
+        " 工單號 ": ["WO1", "WO2", "", "WO4"],
+        "料號": ["P1", "P2", "P3", "P4"],
+        "數量": ["1", "x", "3", "1,200"],
+        "金額": [10.0, 20.0, 30.0, None],
+        "出貨日期": ["2024-05-01", "2024/05/02", "2024-05-03", "not a date"],
+        "備註": ["", "", "", ""],
+    })
+
+    report = validate_dataframe(df, "零件出貨")
+
+    assert report["mapped_columns"] == {
+        "工單號": "order_number", "料號": "part_number", "數量": "quantity",
+        "金額": "amount", "出貨日期": "shipment_date",
+    }
+    assert report["missing_columns"] == []
+    assert report["unmapped_columns"] == ["備註"]
+    # 第 1 行數量無法轉換、第 2 行工單號空白、第 3 行日期無法轉換（空白金額視為 0）
+    assert (report["valid_rows"], report["invalid_rows"]) == (1, 3)
+
+    rules = rules_by_key(report)
+    assert set(rules) == {("required", "order_number"), ("integer", "quantity"), ("date", "shipment_date")}
+    assert rules[("integer", "quantity")]["source_column"] == "數量"
+    assert rules[("integer", "quantity")]["samples"] == [{"row": 1, "value": "x"}]
+    assert rules[("required", "order_number")]["invalid_count"] == 1
+    assert rules[("date", "shipment_date")]["samples"] == [{"row": 3, "value": "not a date"}]
+
+
+def test_missing_required_column_is_reported_once_per_column():
+    df = pd.DataFrame({"工單號": ["WO1", "WO2"], "金額": [10.0, 20.0]})
+
+    report = validate_dataframe(df, "零件銷售")
+
+    assert report["missing_columns"] == ["part_number", "quantity", "sale_date"]
+    assert report["valid_rows"] == 0
+    assert report["rules"] == [{
+        "rule": "missing_column", "column": "part_number", "source_column": None,
+        "invalid_count": 2, "samples": [],
+    }]
+
+
+def test_duplicate_source_columns_use_the_last_one():
+    # 工時與時數都對應到 hours：與匯入時相同，取最後一個
+    df = pd.DataFrame({
+        "工單號": ["WO1"], "技師": ["王小明"], "工時": ["x"], "時數": ["2"], "時薪": [500],
+    })
+
+    report = validate_dataframe(df, "技師績效")
+
+    assert report["valid_rows"] == 1
+    assert report["rules"] == []
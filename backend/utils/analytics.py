@@ -0,0 +1,336 @@
+import os
+import threading
+import time
+import uuid
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 分析模式：匯入後把事實資料表匯出為依廠別分區的 Parquet 快照，
+# 歷史報表以內嵌的 DuckDB 查詢快照，不與 PostgreSQL 的匯入交易競爭
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "false").lower() in ("1", "true", "yes")
+ANALYTICS_DIR = Path(os.getenv("ANALYTICS_DIR", Path(__file__).resolve().parent.parent / "data" / "analytics"))
+# 舊快照檔保留時間（秒），讓進行中的查詢可讀完
+SNAPSHOT_GRACE_SECONDS = 600
+
+CURRENT_POINTER = "_current"
+# 資料表全部廠別都匯出成功後寫入，內容為匯出時的資料版本
+COMPLETE_MARKER = "_complete"
+
+# 匯出欄位（不含 row_data 等大欄位）
+SNAPSHOT_TABLES = {
+    "part_shipments": """
+        SELECT id, factory_code, order_number, part_number, quantity,
+               CAST(amount AS DOUBLE PRECISION) AS amount, shipment_date
+        FROM part_shipments WHERE factory_code = :factory_code
+        ORDER BY shipment_date
+    """,
+    "part_sales": """
+        SELECT id, factory_code, order_number, part_number, quantity,
+               CAST(amount AS DOUBLE PRECISION) AS amount, sale_date
+        FROM part_sales WHERE factory_code = :factory_code
+        ORDER BY sale_date
+    """,
+    "technician_performance": """
+        SELECT id, factory_code, order_number, technician_name,
+               CAST(work_hours AS DOUBLE PRECISION) AS work_hours,
+               CAST(salary AS DOUBLE PRECISION) AS salary,
+               CAST(bonus AS DOUBLE PRECISION) AS bonus,
+               performance_date
+        FROM technician_performance WHERE factory_code = :factory_code
+        ORDER BY performance_date
+    """,
+    "maintenance_income": """
+        SELECT id, factory_code, order_number, income_category,
+               CAST(amount AS DOUBLE PRECISION) AS amount, income_date
+        FROM maintenance_income WHERE factory_code = :factory_code
+        ORDER BY income_date
+    """,
+}
+
+FILE_TYPE_TABLES = {
+    "零件出貨": "part_shipments",
+    "零件銷售": "part_sales",
+    "技師績效": "technician_performance",
+    "維修收入": "maintenance_income",
+}
+
+_export_lock = threading.Lock()
+_duckdb_connection = None
+_duckdb_lock = threading.Lock()
+
+
+def _partition_dir(table: str, factory_code: str) -> Path:
+    return ANALYTICS_DIR / table / f"factory_code={factory_code}"
+
+
+def export_partition(db, table: str, factory_code: str) -> Optional[Path]:
+    """
+    匯出單一 (資料表, 廠別) 分區
+    - 寫入新檔後以 _current 指標原子切換，讀取端不會看到寫到一半的檔案
+    - 依日期排序寫入，DuckDB 可用 row group 統計值略過不相關的期間
+    """
+    import pandas as pd
+    from sqlalchemy import text
+
+    df = pd.read_sql_query(text(SNAPSHOT_TABLES[table]), db.connection(), params={"factory_code": factory_code})
+
+    partition = _partition_dir(table, factory_code)
+    partition.mkdir(parents=True, exist_ok=True)
+    
+    # 沒有資料的分區不留快照，查詢時直接略過
+    if len(df) == 0:
+        (partition / CURRENT_POINTER).unlink(missing_ok=True)
+        _remove_stale_snapshots(partition, keep="")
+        return None
+    
+    file_name = f"snapshot-{int(time.time())}-{uuid.uuid4().hex[:8]}.parquet"
+    df.to_parquet(partition / file_name, index=False, compression="zstd", row_group_size=100_000)
+
+    pointer_tmp = partition / f"{CURRENT_POINTER}.{uuid.uuid4().hex[:8]}.tmp"
+    pointer_tmp.write_text(file_name, encoding="utf-8")
+    os.replace(pointer_tmp, partition / CURRENT_POINTER)
+
+    _remove_stale_snapshots(partition, keep=file_name)
+    return partition / file_name
+
+
+def _remove_stale_snapshots(partition: Path, keep: str):
+    now = time.time()
+    for path in partition.glob("snapshot-*.parquet"):
+        if path.name != keep and now - path.stat().st_mtime > SNAPSHOT_GRACE_SECONDS:
+            path.unlink(missing_ok=True)
+
+
+def _marker(table: str) -> Path:
+    return ANALYTICS_DIR / table / COMPLETE_MARKER
+
+
+def _marker_version(table: str) -> Optional[int]:
+    """資料表最近一次完整匯出時的資料版本（未完整匯出過為 None）"""
+    try:
+        return int(_marker(table).read_text(encoding="utf-8").strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _mark_complete(table: str, version: int):
+    marker = _marker(table)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    marker_tmp = marker.with_name(f"{COMPLETE_MARKER}.{uuid.uuid4().hex[:8]}.tmp")
+    marker_tmp.write_text(str(version), encoding="utf-8")
+    os.replace(marker_tmp, marker)
+
+
+def _mark_incomplete(table: str):
+    _marker(table).unlink(missing_ok=True)
+
+
+def _export(tables: List[str], factory_codes: Optional[Iterable[str]] = None):
+    from database import SessionLocal
+    import crud
+
+    with _export_lock:
+        db = SessionLocal()
+        try:
+            # 先讀版本再匯出：標記的版本不會比快照內容新
+            version = crud.get_data_version(db)
+            all_codes = [f.code for f in crud.get_factories(db)]
+            for table in tables:
+                # 尚未完整匯出的資料表一律匯出全部廠別，只更新部分分區不算完整
+                complete = _marker_version(table) is not None
+                codes = list(factory_codes) if factory_codes and complete else all_codes
+                started = time.perf_counter()
+                try:
+                    for factory_code in codes:
+                        export_partition(db, table, factory_code)
+                except Exception as e:
+                    # 分區可能已過時：改回 PostgreSQL，直到下次完整匯出
+                    _mark_incomplete(table)
+                    logger.error(f"更新分析快照失敗: {table}: {str(e)}", exc_info=True)
+                    continue
+                _mark_complete(table, version)
+                logger.info(
+                    f"分析快照已更新: {table} × {codes}，{(time.perf_counter() - started) * 1000:.0f} ms"
+                )
+        except Exception as e:
+            logger.error(f"更新分析快照失敗: {str(e)}", exc_info=True)
+        finally:
+            db.close()
+
+
+def export_snapshots(file_type: Optional[str] = None, factory_codes: Optional[Iterable[str]] = None):
+    """
+    匯入完成後更新快照（於背景任務執行）
+    - file_type 為 None 時更新所有事實資料表
+    - factory_codes 為 None 時更新所有廠別
+    """
+    if not ANALYTICS_ENABLED:
+        return
+    tables = [FILE_TYPE_TABLES[file_type]] if file_type in FILE_TYPE_TABLES else list(SNAPSHOT_TABLES)
+    _export(tables, factory_codes)
+
+
+def refresh_stale_snapshots():
+    """
+    啟動時檢查快照（於背景執行緒執行）
+    - 標記的資料版本與資料庫不同（例如分析模式關閉期間有匯入）或未曾完整匯出的資料表重新完整匯出
+    - 匯出完成前該資料表視為不完整，歷史報表改由 PostgreSQL 計算
+    """
+    if not ANALYTICS_ENABLED:
+        return
+
+    from database import SessionLocal
+    import crud
+
+    db = SessionLocal()
+    try:
+        version = crud.get_data_version(db)
+    except Exception as e:
+        logger.error(f"無法檢查分析快照版本: {str(e)}")
+        return
+    finally:
+        db.close()
+
+    stale = [table for table in SNAPSHOT_TABLES if _marker_version(table) != version]
+    if not stale:
+        return
+    for table in stale:
+        _mark_incomplete(table)
+    logger.info(f"分析快照需重新匯出: {stale}")
+    _export(stale)
+
+
+def current_files(table: str, factory_code: Optional[str] = None) -> List[str]:
+    """列出資料表各分區目前的快照檔（指定廠別時只取該分區）"""
+    files = []
+    table_dir = ANALYTICS_DIR / table
+    if not table_dir.exists():
+        return files
+    if factory_code and not factory_code.isalnum():
+        return files
+    pattern = f"factory_code={factory_code}" if factory_code else "factory_code=*"
+    for partition in table_dir.glob(pattern):
+        pointer = partition / CURRENT_POINTER
+        if pointer.exists():
+            files.append(str(partition / pointer.read_text(encoding="utf-8").strip()))
+    return files
+
+
+def snapshot_generation() -> str:
+    """各資料表快照標記的版本；任一資料表重新匯出後即改變（歷史報表的 ETag 一併包含）"""
+    if not ANALYTICS_ENABLED:
+        return "0"
+    return "-".join(str(_marker_version(table) or 0) for table in SNAPSHOT_TABLES)
+
+
+def snapshots_available() -> bool:
+    """所有事實資料表都已完整匯出（只有部分分區的快照會漏算其他廠別）"""
+    return ANALYTICS_ENABLED and all(_marker_version(table) is not None for table in SNAPSHOT_TABLES)
+
+
+def _connection():
+    global _duckdb_connection
+    with _duckdb_lock:
+        if _duckdb_connection is None:
+            import duckdb
+            _duckdb_connection = duckdb.connect(database=":memory:")
+        return _duckdb_connection.cursor()
+
+
+def _relation(table: str, factory_code: Optional[str]) -> Optional[str]:
+    files = current_files(table, factory_code)
+    if not files:
+        return None
+    quoted = ", ".join("'" + path.replace("'", "''") + "'" for path in files)
+    return f"read_parquet([{quoted}])"
+
+
+# 各事實資料表對應的 (日期欄位, 量值欄位位置, 量值運算式)
+HISTORY_MEASURES = [
+    ("maintenance_income", "income_date", 0, "SUM(amount)"),
+    ("part_sales", "sale_date", 1, "SUM(amount)"),
+    ("part_shipments", "shipment_date", 2, "SUM(amount)"),
+    ("technician_performance", "performance_date", 3, "SUM(salary + bonus)"),
+]
+
+
+def query_monthly_history(
+    start_date: date,
+    end_date: date,
+    factory_codes: Iterable[str],
+    factory_code: Optional[str] = None
+) -> List[Dict]:
+    """
+    多年度跨廠月彙總（DuckDB 查詢 Parquet 快照）
+    - 欄位與 crud.get_performance_trend(bucket='month') 相同
+    - factory_codes 為 factories 資料表的廠別（與 PostgreSQL 相同來源），沒有資料的廠別補 0
+    - 指定廠別時只讀取該廠分區
+    """
+    factory_list = [code for code in factory_codes if factory_code is None or code == factory_code]
+    subqueries = []
+    for table, date_column, position, measure in HISTORY_MEASURES:
+        relation = _relation(table, factory_code)
+        if relation is None:
+            continue
+        measures = ["0"] * 4
+        measures[position] = measure
+        subqueries.append(f"""
+                SELECT factory_code, CAST(date_trunc('month', {date_column}) AS DATE) AS bucket,
+                       {measures[0]} AS income, {measures[1]} AS parts_sales,
+                       {measures[2]} AS parts_shipments, {measures[3]} AS labor_cost
+                FROM {relation}
+                WHERE {date_column} BETWEEN $start_date AND $end_date
+                GROUP BY 1, 2""")
+    if not subqueries:
+        # 尚無任何快照檔：各廠別仍補齊 0
+        subqueries.append("""
+                SELECT CAST(NULL AS VARCHAR) AS factory_code, CAST(NULL AS DATE) AS bucket,
+                       0 AS income, 0 AS parts_sales, 0 AS parts_shipments, 0 AS labor_cost
+                WHERE FALSE""")
+    facts = "\n                UNION ALL".join(subqueries)
+    
+    cursor = _connection()
+    try:
+        sql = f"""
+            WITH buckets AS (
+                SELECT CAST(range AS DATE) AS bucket
+                FROM range(date_trunc('month', CAST($start_date AS DATE)),
+                           date_trunc('month', CAST($end_date AS DATE)) + INTERVAL 1 DAY,
+                           INTERVAL 1 MONTH)
+            ),
+            facts AS (
+{facts}
+            ),
+            aggregated AS (
+                SELECT factory_code, bucket,
+                       SUM(income) AS income, SUM(parts_sales) AS parts_sales,
+                       SUM(parts_shipments) AS parts_shipments, SUM(labor_cost) AS labor_cost
+                FROM facts
+                GROUP BY factory_code, bucket
+            ),
+            factory_list AS (
+                SELECT UNNEST(CAST($factory_list AS VARCHAR[])) AS factory_code
+            )
+            SELECT fl.factory_code, b.bucket,
+                   COALESCE(a.income, 0) AS income,
+                   COALESCE(a.parts_sales, 0) AS parts_sales,
+                   COALESCE(a.parts_shipments, 0) AS parts_shipments,
+                   COALESCE(a.labor_cost, 0) AS labor_cost
+            FROM factory_list fl
+            CROSS JOIN buckets b
+            LEFT JOIN aggregated a ON a.factory_code = fl.factory_code AND a.bucket = b.bucket
+            ORDER BY fl.factory_code, b.bucket
+        """
+        result = cursor.execute(sql, {
+            "start_date": start_date,
+            "end_date": end_date,
+            "factory_list": factory_list,
+        })
+        columns = [column[0] for column in result.description]
+        return [dict(zip(columns, row)) for row in result.fetchall()]
+    finally:
+        cursor.close()
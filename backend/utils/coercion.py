@@ -0,0 +1,293 @@
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import logging
+
+from utils.row_errors import RowErrorCollector
+
+logger = logging.getLogger(__name__)
+
+# 向量化欄位轉換：民國日期、千分位數字、全形字元、Excel 序號日期
+# 每個欄位以樣本判斷格式一次，轉換器依欄位簽章快取
+
+# 判斷格式時取樣的非空值筆數
+DETECT_SAMPLE_SIZE = 200
+# 轉換器快取上限（超過時整批清除）
+CONVERTER_CACHE_SIZE = 1024
+
+# Excel 序號日期的合理範圍（1954-10-04 ~ 2119-01-01）
+EXCEL_SERIAL_MIN = 20000
+EXCEL_SERIAL_MAX = 80000
+EXCEL_EPOCH = "1899-12-30"
+ROC_YEAR_OFFSET = 1911
+
+# 全形 ASCII（！～）與全形空白轉半形
+_FULL_WIDTH = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+_FULL_WIDTH[0x3000] = 0x20
+_FULL_WIDTH_RE = re.compile("[！-～　]")
+
+_ROC_DATE_RE = r"^(?P<year>\d{2,3})[/\-.年](?P<month>\d{1,2})[/\-.月](?P<day>\d{1,2})日?$"
+_ROC_COMPACT_RE = r"^(?P<year>\d{2,3})(?P<month>\d{2})(?P<day>\d{2})$"
+# 讀取器把整數日期讀成浮點數時的字串形式（1130501.0）
+_INTEGRAL_FLOAT_RE = r"^(\d+)\.0+$"
+_GREGORIAN_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%Y%m%d", "%Y.%m.%d"]
+# 千分位、貨幣符號、空白；(1,234) 與 1,234- 視為負數
+_NUMBER_NOISE_RE = r"[,\s$]|NT\$|元"
+
+
+def normalize_text(values: pd.Series) -> pd.Series:
+    """轉為字串、全形轉半形、去除前後空白（空值保持為 NaN）"""
+    text = values.astype("string")
+    if text.str.contains(_FULL_WIDTH_RE, na=False).any():
+        text = text.str.translate(_FULL_WIDTH)
+    return text.str.strip()
+
+
+# ==================== 數值 ====================
+
+def _number_native(values: pd.Series) -> pd.Series:
+    return pd.to_numeric(values, errors="coerce").astype("float64")
+
+
+def _number_text(values: pd.Series) -> pd.Series:
+    text = normalize_text(values)
+    negative = text.str.match(r"^\(.*\)$", na=False) | text.str.endswith("-", na=False)
+    cleaned = (
+        text.str.replace(_NUMBER_NOISE_RE, "", regex=True)
+            .str.strip("()-")
+    )
+    # 保留開頭的負號
+    cleaned = cleaned.where(~text.str.startswith("-", na=False), "-" + cleaned)
+    numbers = pd.to_numeric(cleaned.replace("", pd.NA), errors="coerce").astype("float64")
+    return numbers.where(~negative, -numbers.abs())
+
+
+NUMBER_CONVERTERS: Dict[str, Callable[[pd.Series], pd.Series]] = {
+    "native": _number_native,
+    "text": _number_text,
+}
+
+
+# ==================== 日期 ====================
+
+def _date_native(values: pd.Series) -> pd.Series:
+    # datetime 物件直接轉換；字串只接受 ISO 8601，避免逐格落入 dateutil
+    return pd.to_datetime(values, format="ISO8601", errors="coerce")
+
+
+def _date_excel_serial(values: pd.Series) -> pd.Series:
+    serial = pd.to_numeric(values, errors="coerce")
+    serial = serial.where((serial >= EXCEL_SERIAL_MIN) & (serial <= EXCEL_SERIAL_MAX))
+    return pd.to_datetime(serial, unit="D", origin=EXCEL_EPOCH, errors="coerce")
+
+
+def _date_text(values: pd.Series) -> pd.Series:
+    """日期的文字形式：去除整數值浮點數的小數部分，民國 / 西元緊湊日期才比對得到"""
+    return normalize_text(values).str.replace(_INTEGRAL_FLOAT_RE, r"\1", regex=True)
+
+
+def _roc_parts(text: pd.Series, pattern: str) -> pd.Series:
+    parts = text.str.extract(pattern).apply(pd.to_numeric, errors="coerce").astype("float64")
+    parts["year"] = parts["year"] + ROC_YEAR_OFFSET
+    return pd.to_datetime(parts[["year", "month", "day"]], errors="coerce")
+
+
+def _date_roc(values: pd.Series) -> pd.Series:
+    text = _date_text(values)
+    dates = _roc_parts(text, _ROC_DATE_RE)
+    compact = dates.isna() & text.str.match(_ROC_COMPACT_RE, na=False)
+    if compact.any():
+        dates = dates.where(~compact, _roc_parts(text[compact], _ROC_COMPACT_RE))
+    return dates
+
+
+def _date_format(fmt: str) -> Callable[[pd.Series], pd.Series]:
+    def convert(values: pd.Series) -> pd.Series:
+        return pd.to_datetime(_date_text(values), format=fmt, errors="coerce")
+    convert.__name__ = f"_date_{fmt}"
+    return convert
+
+
+def _date_mixed(values: pd.Series) -> pd.Series:
+    return pd.to_datetime(_date_text(values), format="mixed", errors="coerce")
+
+
+DATE_CONVERTERS: Dict[str, Callable[[pd.Series], pd.Series]] = {
+    "native": _date_native,
+    "excel_serial": _date_excel_serial,
+    "roc": _date_roc,
+    **{f"format:{fmt}": _date_format(fmt) for fmt in _GREGORIAN_FORMATS},
+    "mixed": _date_mixed,
+}
+
+
+# ==================== 格式判斷與快取 ====================
+
+def _value_shape(value) -> str:
+    """值的外形（數字 -> 9、字母 -> a），用於欄位簽章"""
+    return re.sub(r"[A-Za-z]", "a", re.sub(r"\d", "9", str(value)))[:24]
+
+
+def column_signature(values: pd.Series, kind: str) -> Tuple:
+    """欄位簽章：欄名、型別、dtype 與前幾個非空值的外形"""
+    head = values.dropna().head(3)
+    return (kind, str(values.name), str(values.dtype), tuple(sorted({_value_shape(v) for v in head})))
+
+
+def _candidates(values: pd.Series, kind: str) -> List[str]:
+    if kind == "number":
+        if pd.api.types.is_numeric_dtype(values):
+            return ["native"]
+        return ["native", "text"]
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return ["native"]
+    if pd.api.types.is_numeric_dtype(values):
+        # 數值欄位：Excel 序號、民國緊湊日期（1130501）或西元緊湊日期（20240501），可能讀成浮點數
+        return ["excel_serial", "roc", "format:%Y%m%d"]
+    # object 欄位可能混有 datetime 物件與字串
+    return ["native"] + [name for name in DATE_CONVERTERS if name.startswith("format:")] + ["roc", "excel_serial", "mixed"]
+
+
+def detect_format(values: pd.Series, kind: str) -> str:
+    """以樣本挑選成功率最高的轉換器（同分時取先列出者）"""
+    candidates = _candidates(values, kind)
+    if len(candidates) == 1:
+        return candidates[0]
+    converters = NUMBER_CONVERTERS if kind == "number" else DATE_CONVERTERS
+    sample = values.dropna().head(DETECT_SAMPLE_SIZE)
+    if len(sample) == 0:
+        return candidates[0]
+
+    best, best_hits = candidates[0], -1
+    for name in candidates:
+        try:
+            hits = int(converters[name](sample).notna().sum())
+        except (ValueError, TypeError, OverflowError):
+            continue
+        if hits > best_hits:
+            best, best_hits = name, hits
+            if hits == len(sample):
+                break
+    return best
+
+
+_converter_cache: Dict[Tuple, str] = {}
+_cache_lock = threading.Lock()
+
+
+def _converter_for(values: pd.Series, kind: str) -> str:
+    signature = column_signature(values, kind)
+    with _cache_lock:
+        name = _converter_cache.get(signature)
+    if name is None:
+        name = detect_format(values, kind)
+        with _cache_lock:
+            if len(_converter_cache) >= CONVERTER_CACHE_SIZE:
+                _converter_cache.clear()
+            _converter_cache[signature] = name
+        logger.debug(f"欄位 {values.name} 使用 {kind} 轉換器 {name}")
+    return name
+
+
+def _convert(values: pd.Series, kind: str) -> pd.Series:
+    """
+    以快取的轉換器轉換整欄；同一欄混有多種格式時，
+    只對轉換失敗的值依序嘗試其他轉換器
+    """
+    converters = NUMBER_CONVERTERS if kind == "number" else DATE_CONVERTERS
+    name = _converter_for(values, kind)
+    result = converters[name](values)
+
+    failed = result.isna() & values.notna()
+    if failed.any():
+        for other in _candidates(values, kind):
+            if other == name:
+                continue
+            retry = values[failed]
+            try:
+                converted = converters[other](retry)
+            except (ValueError, TypeError, OverflowError):
+                continue
+            result = result.where(~failed, converted.reindex(result.index))
+            failed = result.isna() & values.notna()
+            if not failed.any():
+                break
+    return result
+
+
+def coerce_number(values: pd.Series) -> pd.Series:
+    """數值欄位（float64，無法轉換為 NaN）"""
+    return _convert(values, "number")
+
+
+def coerce_date(values: pd.Series) -> pd.Series:
+    """日期欄位（datetime64，無法轉換為 NaT）"""
+    return _convert(values, "date")
+
+
+def coerce_text(values: pd.Series) -> pd.Series:
+    """文字欄位（全形轉半形、去空白，空值為空字串）"""
+    return normalize_text(values).fillna("").astype(object)
+
+
+# ==================== 依欄位規格轉換整張表 ====================
+
+def coerce_fields(
+    df: pd.DataFrame,
+    specs: Dict[str, str],
+    errors: Optional[RowErrorCollector] = None
+) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    依 FIELD_SPECS 轉換標準欄位，回傳 (轉換後的欄位, 有效資料行遮罩)
+    - required / text：文字；required 空白者無效
+    - integer / number：數值，缺值為 0；有值但無法轉換者無效
+    - date：日期，缺值為 None；有值但無法轉換者無效
+    - 缺少的欄位以預設值補上（與逐格解析時 row.get 的預設相同）
+    """
+    out = {}
+    valid = pd.Series(True, index=df.index)
+    # 重新命名後可能有重複欄位，取最後一個
+    df = df.loc[:, ~df.columns.duplicated(keep="last")]
+
+    for column, kind in specs.items():
+        present = column in df.columns
+        values = df[column] if present else pd.Series(np.nan, index=df.index, dtype="float64", name=column)
+
+        if kind in ("required", "text"):
+            text = coerce_text(values)
+            if kind == "required":
+                invalid = text == ""
+                _report(errors, "required", column, invalid, values)
+                valid &= ~invalid
+            out[column] = text
+            continue
+
+        has_value = values.notna() & (normalize_text(values).fillna("") != "") if present else values.notna()
+        if kind in ("integer", "number"):
+            converted = coerce_number(values) if present else values
+            invalid = has_value & converted.isna()
+            if kind == "integer":
+                converted = np.trunc(converted)
+            out[column] = converted.fillna(0)
+        else:
+            converted = coerce_date(values) if present else pd.Series(pd.NaT, index=df.index)
+            invalid = has_value & converted.isna()
+            out[column] = converted
+
+        _report(errors, kind, column, invalid, values)
+        valid &= ~invalid
+
+    return pd.DataFrame(out, index=df.index), valid
+
+
+def _report(errors: Optional[RowErrorCollector], rule: str, column: str, invalid: pd.Series, values: pd.Series):
+    if errors is None or not invalid.any():
+        return
+    # 只記錄樣本所需的幾筆，其餘以計數累加
+    sample = values[invalid].head(errors.sample_size)
+    for idx, value in sample.items():
+        errors.add(rule, column, idx, None if pd.isna(value) else value)
+    errors.add_count(rule, column, int(invalid.sum()) - len(sample))
@@ -1,244 +1,310 @@
 import pandas as pd
-from typing import Dict, List, Optional, Tuple
-from io import BytesIO
+from typing import Dict, List, Optional
 import logging
+from utils.readers import select_backend
+from utils.row_errors import RowErrorCollector
+from utils.coercion import coerce_fields
 
 logger = logging.getLogger(__name__)
 
+# 各報表類型的欄位名稱映射（原始標題 -> 標準欄位）
+COLUMN_MAPPINGS: Dict[str, Dict[str, str]] = {
+    "零件出貨": {
+        '工單號': 'order_number',
+        '工单号': 'order_number',
+        '工單': 'order_number',
+        '零件編號': 'part_number',
+        '零件编号': 'part_number',
+        '料號': 'part_number',
+        '數量': 'quantity',
+        '数量': 'quantity',
+        '金額': 'amount',
+        '金额': 'amount',
+        '出貨日期': 'shipment_date',
+        '出货日期': 'shipment_date',
+        '日期': 'shipment_date'
+    },
+    "零件銷售": {
+        '工單號': 'order_number',
+        '工单号': 'order_number',
+        '工單': 'order_number',
+        '零件編號': 'part_number',
+        '零件编号': 'part_number',
+        '料號': 'part_number',
+        '數量': 'quantity',
+        '数量': 'quantity',
+        '金額': 'amount',
+        '金额': 'amount',
+        '銷售日期': 'sale_date',
+        '销售日期': 'sale_date',
+        '日期': 'sale_date'
+    },
+    "Shelf Life Code": {
+        '零件編號': 'part_number',
+        '零件编号': 'part_number',
+        '料號': 'part_number',
+        'Shelf Life Code': 'shelf_life_code',
+        'shelf life code': 'shelf_life_code',
+        '保存期限': 'shelf_life_code'
+    },
+    "技師績效": {
+        '工單號': 'order_number',
+        '工单号': 'order_number',
+        '技師名稱': 'technician_name',
+        '技师名称': 'technician_name',
+        '技師': 'technician_name',
+        '工時': 'hours',
+        '工时': 'hours',
+        '時薪': 'hourly_rate',
+        '时薪': 'hourly_rate',
+        '時數': 'hours',
+        '獎金': 'bonus',
+        '奖金': 'bonus',
+        '績效日期': 'performance_date',
+        '绩效日期': 'performance_date',
+        '工作日期': 'performance_date',
+        '日期': 'performance_date'
+    },
+    "維修收入": {
+        '工單號': 'order_number',
+        '工单号': 'order_number',
+        '分類': 'category',
+        '分类': 'category',
+        '類別': 'category',
+        '金額': 'amount',
+        '金额': 'amount',
+        '收入日期': 'income_date',
+        '日期': 'income_date'
+    },
+}
+
+# 各報表類型的標準欄位型別
+# required：空白時該行略過；integer / number / date：無法轉換時該行略過；text：不檢查
+FIELD_SPECS: Dict[str, Dict[str, str]] = {
+    "零件出貨": {
+        "order_number": "required", "part_number": "required",
+        "quantity": "integer", "amount": "number", "shipment_date": "date",
+    },
+    "零件銷售": {
+        "order_number": "required", "part_number": "required",
+        "quantity": "integer", "amount": "number", "sale_date": "date",
+    },
+    "Shelf Life Code": {
+        "part_number": "required", "shelf_life_code": "text",
+    },
+    "技師績效": {
+        "order_number": "required", "technician_name": "required",
+        "hours": "number", "hourly_rate": "number", "bonus": "number",
+        "performance_date": "date",
+    },
+    "維修收入": {
+        "order_number": "required", "category": "text",
+        "amount": "number", "income_date": "date",
+    },
+}
+
+def _nullable(values: pd.Series) -> pd.Series:
+    """NaT / NaN 轉為 None（寫入資料庫時為 NULL）"""
+    return values.astype(object).where(values.notna(), None)
+
 class ExcelParser:
     """Excel 檔案解析器"""
     
     @staticmethod
-    def read_excel(file_content: bytes, sheet_name: Optional[str] = None) -> pd.DataFrame:
-        """讀取 Excel 檔案"""
+    def read_excel(
+        file_content: bytes,
+        sheet_name: Optional[str] = None,
+        filename: Optional[str] = None,
+        backend: Optional[str] = None,
+        header: Optional[int] = 0
+    ) -> pd.DataFrame:
+        """
+        讀取報表檔案
+        - 依檔案簽章或設定選擇讀取後端（見 utils.readers）
+        - 支援 .xlsx / .xls / .csv / .parquet
+        - header=None 時不指定標題列（見 utils.report_templates）
+        """
+        reader = select_backend(file_content, filename=filename, backend=backend)
         try:
-            # 支援 .xlsx 和 .xls 格式
-            df = pd.read_excel(BytesIO(file_content), sheet_name=sheet_name or 0)
+            df = reader.read(file_content, sheet_name=sheet_name, header=header)
+            logger.debug(f"使用 {reader.name} 後端讀取檔案")
             return df
         except Exception as e:
+            # 原生讀取器失敗時退回 openpyxl
+            if reader.name == "calamine" and not backend:
+                logger.warning(f"calamine 讀取失敗，改用 openpyxl: {str(e)}")
+                return ExcelParser.read_excel(
+                    file_content, sheet_name=sheet_name, filename=filename, backend="openpyxl", header=header
+                )
             logger.error(f"讀取 Excel 檔案失敗: {str(e)}")
             raise ValueError(f"無法讀取 Excel 檔案: {str(e)}")
     
     @staticmethod
-    def parse_part_shipment(df: pd.DataFrame, factory_code: str) -> List[Dict]:
+    def parse_part_shipment(
+        df: pd.DataFrame,
+        factory_code: str,
+        errors: Optional[RowErrorCollector] = None
+    ) -> List[Dict]:
         """
         解析零件出貨報表
         預期欄位: 工單號, 零件編號, 數量, 金額, 出貨日期
+        錯誤彙總到 errors；未提供時於結束時輸出一行摘要
         """
-        records = []
-        
-        # 標準化欄位名稱（移除空格、統一大小寫）
-        df.columns = df.columns.str.strip()
+        collector = errors if errors is not None else RowErrorCollector()
+        values = ExcelParser._coerce(df, "零件出貨", collector)
         
-        # 常見的欄位名稱映射
-        column_mapping = {
-            '工單號': 'order_number',
-            '工单号': 'order_number',
-            '工單': 'order_number',
-            '零件編號': 'part_number',
-            '零件编号': 'part_number',
-            '料號': 'part_number',
-            '數量': 'quantity',
-            '数量': 'quantity',
-            '金額': 'amount',
-            '金额': 'amount',
-            '出貨日期': 'shipment_date',
-            '出货日期': 'shipment_date',
-            '日期': 'shipment_date'
-        }
-        
-        # 重命名欄位
-        df = df.rename(columns=column_mapping)
-        
-        for idx, row in df.iterrows():
-            try:
-                record = {
-                    'factory_code': factory_code,
-                    'order_number': str(row.get('order_number', '')).strip(),
-                    'part_number': str(row.get('part_number', '')).strip(),
-                    'quantity': int(row.get('quantity', 0)) if pd.notna(row.get('quantity')) else 0,
-                    'amount': float(row.get('amount', 0)) if pd.notna(row.get('amount')) else 0,
-                    'shipment_date': pd.to_datetime(row.get('shipment_date')) if pd.notna(row.get('shipment_date')) else None
-                }
-                
-                if record['order_number'] and record['part_number']:
-                    records.append(record)
-            except Exception as e:
-                logger.warning(f"解析零件出貨記錄時出錯 (行 {idx}): {str(e)}")
-                continue
+        records = [
+            {
+                'source_row': idx,
+                'factory_code': factory_code,
+                'order_number': order_number,
+                'part_number': part_number,
+                'quantity': int(quantity),
+                'amount': float(amount),
+                'shipment_date': shipment_date
+            }
+            for idx, order_number, part_number, quantity, amount, shipment_date in zip(
+                values.index, values['order_number'], values['part_number'],
+                values['quantity'], values['amount'], _nullable(values['shipment_date'])
+            )
+        ]
         
+        if errors is None:
+            collector.log_summary(logger, "解析零件出貨記錄")
         return records
 
     @staticmethod
-    def parse_part_sales(df: pd.DataFrame, factory_code: str) -> List[Dict]:
+    def parse_part_sales(
+        df: pd.DataFrame,
+        factory_code: str,
+        errors: Optional[RowErrorCollector] = None
+    ) -> List[Dict]:
         """
         解析零件銷售報表
         預期欄位: 工單號, 零件編號, 數量, 金額, 銷售日期
+        錯誤彙總到 errors；未提供時於結束時輸出一行摘要
         """
-        records = []
-        
-        # 標準化欄位名稱
-        df.columns = df.columns.str.strip()
+        collector = errors if errors is not None else RowErrorCollector()
+        values = ExcelParser._coerce(df, "零件銷售", collector)
         
-        # 常見的欄位名稱映射
-        column_mapping = {
-            '工單號': 'order_number',
-            '工单号': 'order_number',
-            '工單': 'order_number',
-            '零件編號': 'part_number',
-            '零件编号': 'part_number',
-            '料號': 'part_number',
-            '數量': 'quantity',
-            '数量': 'quantity',
-            '金額': 'amount',
-            '金额': 'amount',
-            '銷售日期': 'sale_date',
-            '销售日期': 'sale_date',
-            '日期': 'sale_date'
-        }
-        
-        # 重命名欄位
-        df = df.rename(columns=column_mapping)
-        
-        for idx, row in df.iterrows():
-            try:
-                record = {
-                    'factory_code': factory_code,
-                    'order_number': str(row.get('order_number', '')).strip(),
-                    'part_number': str(row.get('part_number', '')).strip(),
-                    'quantity': int(row.get('quantity', 0)) if pd.notna(row.get('quantity')) else 0,
-                    'amount': float(row.get('amount', 0)) if pd.notna(row.get('amount')) else 0,
-                    'sale_date': pd.to_datetime(row.get('sale_date')) if pd.notna(row.get('sale_date')) else None
-                }
-                
-                if record['order_number'] and record['part_number']:
-                    records.append(record)
-            except Exception as e:
-                logger.warning(f"解析零件銷售記錄時出錯 (行 {idx}): {str(e)}")
-                continue
+        records = [
+            {
+                'source_row': idx,
+                'factory_code': factory_code,
+                'order_number': order_number,
+                'part_number': part_number,
+                'quantity': int(quantity),
+                'amount': float(amount),
+                'sale_date': sale_date
+            }
+            for idx, order_number, part_number, quantity, amount, sale_date in zip(
+                values.index, values['order_number'], values['part_number'],
+                values['quantity'], values['amount'], _nullable(values['sale_date'])
+            )
+        ]
         
+        if errors is None:
+            collector.log_summary(logger, "解析零件銷售記錄")
         return records
 
     @staticmethod
-    def parse_shelf_life(df: pd.DataFrame) -> List[Dict]:
+    def parse_shelf_life(df: pd.DataFrame, errors: Optional[RowErrorCollector] = None) -> List[Dict]:
         """
         解析 Shelf Life Code 報表
         預期欄位: 零件編號, Shelf Life Code
+        錯誤彙總到 errors；未提供時於結束時輸出一行摘要
         """
-        records = []
-        
-        df.columns = df.columns.str.strip()
+        collector = errors if errors is not None else RowErrorCollector()
+        values = ExcelParser._coerce(df, "Shelf Life Code", collector)
         
-        column_mapping = {
-            '零件編號': 'part_number',
-            '零件编号': 'part_number',
-            '料號': 'part_number',
-            'Shelf Life Code': 'shelf_life_code',
-            'shelf life code': 'shelf_life_code',
-            '保存期限': 'shelf_life_code'
-        }
-        
-        df = df.rename(columns=column_mapping)
-        
-        for idx, row in df.iterrows():
-            try:
-                record = {
-                    'part_number': str(row.get('part_number', '')).strip(),
-                    'shelf_life_code': str(row.get('shelf_life_code', '')).strip()
-                }
-                
-                if record['part_number']:
-                    records.append(record)
-            except Exception as e:
-                logger.warning(f"解析 Shelf Life 記錄時出錯 (行 {idx}): {str(e)}")
-                continue
+        records = [
+            {
+                'part_number': part_number,
+                'shelf_life_code': shelf_life_code
+            }
+            for part_number, shelf_life_code in zip(values['part_number'], values['shelf_life_code'])
+        ]
         
+        if errors is None:
+            collector.log_summary(logger, "解析 Shelf Life 記錄")
         return records
 
     @staticmethod
-    def parse_technician_performance(df: pd.DataFrame, factory_code: str) -> List[Dict]:
+    def parse_technician_performance(
+        df: pd.DataFrame,
+        factory_code: str,
+        errors: Optional[RowErrorCollector] = None
+    ) -> List[Dict]:
         """
         解析技師績效報表
-        預期欄位: 工單號, 技師名稱, 工時, 時薪, 獎金
+        預期欄位: 工單號, 技師名稱, 工時, 時薪, 獎金, 日期
+        錯誤彙總到 errors；未提供時於結束時輸出一行摘要
         """
-        records = []
-        
-        df.columns = df.columns.str.strip()
+        collector = errors if errors is not None else RowErrorCollector()
+        values = ExcelParser._coerce(df, "技師績效", collector)
         
-        column_mapping = {
-            '工單號': 'order_number',
-            '工单号': 'order_number',
-            '技師名稱': 'technician_name',
-            '技师名称': 'technician_name',
-            '技師': 'technician_name',
-            '工時': 'hours',
-            '工时': 'hours',
-            '時薪': 'hourly_rate',
-            '时薪': 'hourly_rate',
-            '時數': 'hours',
-            '獎金': 'bonus',
-            '奖金': 'bonus'
-        }
-        
-        df = df.rename(columns=column_mapping)
-        
-        for idx, row in df.iterrows():
-            try:
-                record = {
-                    'factory_code': factory_code,
-                    'order_number': str(row.get('order_number', '')).strip(),
-                    'technician_name': str(row.get('technician_name', '')).strip(),
-                    'hours': float(row.get('hours', 0)) if pd.notna(row.get('hours')) else 0,
-                    'hourly_rate': float(row.get('hourly_rate', 0)) if pd.notna(row.get('hourly_rate')) else 0,
-                    'bonus': float(row.get('bonus', 0)) if pd.notna(row.get('bonus')) else 0
-                }
-                
-                if record['order_number'] and record['technician_name']:
-                    records.append(record)
-            except Exception as e:
-                logger.warning(f"解析技師績效記錄時出錯 (行 {idx}): {str(e)}")
-                continue
+        records = [
+            {
+                'source_row': idx,
+                'factory_code': factory_code,
+                'order_number': order_number,
+                'technician_name': technician_name,
+                'hours': float(hours),
+                'hourly_rate': float(hourly_rate),
+                'bonus': float(bonus),
+                'performance_date': performance_date
+            }
+            for idx, order_number, technician_name, hours, hourly_rate, bonus, performance_date in zip(
+                values.index, values['order_number'], values['technician_name'],
+                values['hours'], values['hourly_rate'], values['bonus'],
+                _nullable(values['performance_date'])
+            )
+        ]
         
+        if errors is None:
+            collector.log_summary(logger, "解析技師績效記錄")
         return records
 
     @staticmethod
-    def parse_maintenance_income(df: pd.DataFrame, factory_code: str) -> List[Dict]:
+    def parse_maintenance_income(
+        df: pd.DataFrame,
+        factory_code: str,
+        errors: Optional[RowErrorCollector] = None
+    ) -> List[Dict]:
         """
         解析維修收入報表
         預期欄位: 工單號, 分類, 金額, 收入日期
+        錯誤彙總到 errors；未提供時於結束時輸出一行摘要
         """
-        records = []
-        
-        df.columns = df.columns.str.strip()
+        collector = errors if errors is not None else RowErrorCollector()
+        values = ExcelParser._coerce(df, "維修收入", collector)
         
-        column_mapping = {
-            '工單號': 'order_number',
-            '工单号': 'order_number',
-            '分類': 'category',
-            '分类': 'category',
-            '類別': 'category',
-            '金額': 'amount',
-            '金额': 'amount',
-            '收入日期': 'income_date',
-            '日期': 'income_date'
-        }
-        
-        df = df.rename(columns=column_mapping)
-        
-        for idx, row in df.iterrows():
-            try:
-                record = {
-                    'factory_code': factory_code,
-                    'order_number': str(row.get('order_number', '')).strip(),
-                    'category': str(row.get('category', '')).strip(),
-                    'amount': float(row.get('amount', 0)) if pd.notna(row.get('amount')) else 0,
-                    'income_date': pd.to_datetime(row.get('income_date')) if pd.notna(row.get('income_date')) else None
-                }
-                
-                if record['order_number']:
-                    records.append(record)
-            except Exception as e:
-                logger.warning(f"解析維修收入記錄時出錯 (行 {idx}): {str(e)}")
-                continue
+        records = [
+            {
+                'source_row': idx,
+                'factory_code': factory_code,
+                'order_number': order_number,
+                'category': category,
+                'amount': float(amount),
+                'income_date': income_date
+            }
+            for idx, order_number, category, amount, income_date in zip(
+                values.index, values['order_number'], values['category'],
+                values['amount'], _nullable(values['income_date'])
+            )
+        ]
         
+        if errors is None:
+            collector.log_summary(logger, "解析維修收入記錄")
         return records
+
+    @staticmethod
+    def _coerce(df: pd.DataFrame, file_type: str, collector: RowErrorCollector) -> pd.DataFrame:
+        """
+        標準化欄位名稱後以向量化方式轉換型別（見 utils.coercion）
+        只回傳有效的資料行，無效者計入 collector
+        """
+        df = df.rename(columns=lambda col: str(col).strip())
+        df = df.rename(columns=COLUMN_MAPPINGS[file_type])
+        values, valid = coerce_fields(df, FIELD_SPECS[file_type], collector)
+        return values[valid]
@@ -1,25 +1,24 @@
-import re
 from typing import Optional, List
 import pandas as pd
 import logging
+from utils.factory_registry import get_factory_registry
 
 logger = logging.getLogger(__name__)
 
+# 廠別欄位的標題名稱
+FACTORY_COLUMN_NAMES = [
+    '廠別', '工廠', '廠', '工厂', 
+    'factory', 'Factory', 'FACTORY', 
+    '廠商', '供應商', '供应商',
+    '製造廠', '制造厂'
+]
+
 def detect_factory_from_filename(filename: str) -> Optional[str]:
     """
     從檔案名稱識別廠別
-    支援: AMA, AMC, AMD
+    支援 factories 資料表中的廠別代碼與別名（見 utils.factory_registry）
     """
-    filename_upper = filename.upper()
-    
-    if "AMA" in filename_upper:
-        return "AMA"
-    elif "AMC" in filename_upper:
-        return "AMC"
-    elif "AMD" in filename_upper:
-        return "AMD"
-    
-    return None
+    return get_factory_registry().search(filename)
 
 def detect_file_type(filename: str) -> Optional[str]:
     """
@@ -40,47 +39,39 @@ def detect_file_type(filename: str) -> Optional[str]:
     
     return None
 
-def detect_factories_from_dataframe(df: pd.DataFrame) -> List[str]:
+def detect_factories_from_dataframe(df: pd.DataFrame, factory_column: Optional[str] = None) -> List[str]:
     """
     從 DataFrame 中偵測所有廠別 - 改進版本
     採用多層策略:
     1. 先尋找標準廠別欄位
-    2. 如果找不到，掃描所有欄位尋找 AMA/AMC/AMD
+    2. 如果找不到，掃描所有欄位尋找完全等於廠別代碼 / 別名的值
     3. 如果還是找不到，檢查所有資料值（包含搜尋）
+    每個欄位只比對不重複值：完全比對為字典查詢，包含搜尋為單次 regex 掃描
     """
+    registry = get_factory_registry()
     factories = set()
     
     logger.info(f"開始偵測廠別，DataFrame 欄位: {list(df.columns)}")
     
-    # 第一步：尋找標準廠別欄位名稱
-    factory_column_names = [
-        '廠別', '工廠', '廠', '工厂', 
-        'factory', 'Factory', 'FACTORY', 
-        '廠商', '供應商', '供应商',
-        '製造廠', '制造厂'
-    ]
-    
+    # 第一步：尋找標準廠別欄位名稱（已知版型直接使用記錄的廠別欄位）
+    factory_columns = [factory_column] if factory_column in df.columns else FACTORY_COLUMN_NAMES
     for col in df.columns:
-        if col in factory_column_names:
+        if col in factory_columns:
             logger.info(f"找到廠別欄位: {col}")
-            unique_values = df[col].dropna().unique()
-            for value in unique_values:
-                value_str = str(value).strip().upper()
-                if value_str in ['AMA', 'AMC', 'AMD']:
-                    factories.add(value_str)
-                    logger.info(f"從欄位 {col} 找到廠別: {value_str}")
+            found = _exact_matches(registry, df[col])
+            if found:
+                logger.info(f"從欄位 {col} 找到廠別: {sorted(found)}")
+            factories |= found
     
     # 第二步：如果沒找到，掃描所有欄位尋找完全匹配
     if not factories:
         logger.info("未找到標準廠別欄位，掃描所有欄位...")
         for col in df.columns:
             try:
-                unique_values = df[col].dropna().unique()
-                for value in unique_values:
-                    value_str = str(value).strip().upper()
-                    if value_str in ['AMA', 'AMC', 'AMD']:
-                        factories.add(value_str)
-                        logger.info(f"從欄位 {col} 找到廠別: {value_str}")
+                found = _exact_matches(registry, df[col])
+                if found:
+                    logger.info(f"從欄位 {col} 找到廠別: {sorted(found)}")
+                factories |= found
             except Exception as e:
                 logger.debug(f"掃描欄位 {col} 時出錯: {e}")
     
@@ -89,50 +80,50 @@ def detect_factories_from_dataframe(df: pd.DataFrame) -> List[str]:
         logger.info("未找到完全匹配，進行包含搜尋...")
         for col in df.columns:
             try:
-                unique_values = df[col].dropna().unique()
-                for value in unique_values:
-                    value_str = str(value).strip().upper()
-                    # 檢查是否包含廠別代碼
-                    if 'AMA' in value_str:
-                        factories.add('AMA')
-                        logger.info(f"從欄位 {col} 值 '{value_str}' 找到廠別: AMA")
-                    if 'AMC' in value_str:
-                        factories.add('AMC')
-                        logger.info(f"從欄位 {col} 值 '{value_str}' 找到廠別: AMC")
-                    if 'AMD' in value_str:
-                        factories.add('AMD')
-                        logger.info(f"從欄位 {col} 值 '{value_str}' 找到廠別: AMD")
+                found = registry.find_all(df[col].dropna().unique())
+                if found:
+                    logger.info(f"從欄位 {col} 的值找到廠別: {sorted(found)}")
+                factories |= found
             except Exception as e:
                 logger.debug(f"掃描欄位 {col} 時出錯: {e}")
     
     logger.info(f"最終偵測到的廠別: {list(factories)}")
     return list(factories)
 
+def _exact_matches(registry, values: pd.Series) -> set:
+    """欄位中完全等於廠別代碼或別名的值（不分大小寫、去空白）"""
+    found = set()
+    for value in values.dropna().unique():
+        code = registry.match_exact(value)
+        if code:
+            found.add(code)
+    return found
+
 def get_factory_column_name(df: pd.DataFrame) -> Optional[str]:
     """
     取得 DataFrame 中廠別欄位的名稱
     """
-    factory_column_names = [
-        '廠別', '工廠', '廠', '工厂', 
-        'factory', 'Factory', 'FACTORY', 
-        '廠商', '供應商', '供应商',
-        '製造廠', '制造厂'
-    ]
-    
     for col in df.columns:
-        if col in factory_column_names:
+        if col in FACTORY_COLUMN_NAMES:
             return col
     
     return None
 
-def filter_dataframe_by_factory(df: pd.DataFrame, factory_code: str) -> pd.DataFrame:
+def filter_dataframe_by_factory(
+    df: pd.DataFrame,
+    factory_code: str,
+    factory_column: Optional[str] = None
+) -> pd.DataFrame:
     """
     根據廠別代碼篩選 DataFrame
+    factory_column 為已知版型記錄的廠別欄位，未提供時依欄位名稱尋找
     """
-    factory_col = get_factory_column_name(df)
+    factory_col = factory_column if factory_column in df.columns else get_factory_column_name(df)
     
     if factory_col:
-        return df[df[factory_col].astype(str).str.upper() == factory_code]
+        # 別名對應回廠別代碼後比對
+        codes = df[factory_col].astype(str).str.strip().str.upper().map(get_factory_registry().alias_to_code)
+        return df[codes == factory_code]
     
     # 如果沒有標準廠別欄位，返回整個 DataFrame
     return df
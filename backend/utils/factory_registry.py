@@ -0,0 +1,96 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 廠別登錄：廠別代碼與別名從 factories 資料表載入，編譯為單一 regex
+# 檔名與儲存格比對的成本與廠別數量無關（一次掃描 / 一次字典查詢）
+
+# 尚未載入資料表時使用的預設廠別
+DEFAULT_FACTORY_CODES = ("AMA", "AMC", "AMD")
+# 多個 worker 時，其他 worker 新增的廠別最晚在此秒數後載入
+FACTORY_REGISTRY_TTL_SECONDS = int(os.getenv("FACTORY_REGISTRY_TTL_SECONDS", "300"))
+
+
+class FactoryRegistry:
+    """廠別代碼 / 別名（不分大小寫）與編譯後的比對 regex"""
+
+    def __init__(self, aliases: Dict[str, Iterable[str]]):
+        # 別名（大寫） -> 廠別代碼；代碼本身也是別名
+        self.alias_to_code: Dict[str, str] = {}
+        for code, names in aliases.items():
+            code = code.strip().upper()
+            for name in [code, *names]:
+                name = str(name).strip().upper()
+                if name:
+                    self.alias_to_code.setdefault(name, code)
+        self.codes = sorted(set(self.alias_to_code.values()))
+        # 較長的別名優先，避免 AMA 先吃掉 AMA2 之類的前綴
+        ordered = sorted(self.alias_to_code, key=lambda name: (-len(name), name))
+        self.pattern = re.compile("|".join(re.escape(name) for name in ordered)) if ordered else None
+
+    def match_exact(self, value) -> Optional[str]:
+        """儲存格內容（去空白、不分大小寫）完全等於代碼或別名"""
+        return self.alias_to_code.get(str(value).strip().upper())
+
+    def search(self, text: str) -> Optional[str]:
+        """字串中第一個出現的廠別（檔名使用）"""
+        if self.pattern is None:
+            return None
+        found = self.pattern.search(text.upper())
+        return self.alias_to_code[found.group(0)] if found else None
+
+    def find_all(self, values: Iterable) -> Set[str]:
+        """一批字串中包含的所有廠別（以換行串接後單次掃描）"""
+        if self.pattern is None:
+            return set()
+        text = "\n".join(str(value) for value in values).upper()
+        return {self.alias_to_code[name] for name in self.pattern.findall(text)}
+
+
+_registry = FactoryRegistry({code: [] for code in DEFAULT_FACTORY_CODES})
+_loaded_at: Optional[float] = None
+_registry_lock = threading.Lock()
+
+
+def get_factory_registry() -> FactoryRegistry:
+    """目前的廠別登錄（尚未載入時為預設廠別）"""
+    return _registry
+
+
+def load_factory_registry(db) -> FactoryRegistry:
+    """從 factories 資料表重新載入並編譯"""
+    global _registry, _loaded_at
+    import crud
+    factories = crud.get_factories(db)
+    aliases = {factory.code: factory.aliases or [] for factory in factories}
+    if not aliases:
+        # 新建的資料庫尚未建立任何廠別：沿用預設廠別，否則檔名與資料都無法識別廠別
+        logger.warning(f"factories 資料表沒有廠別，使用預設廠別 {DEFAULT_FACTORY_CODES}")
+        aliases = {code: [] for code in DEFAULT_FACTORY_CODES}
+    registry = FactoryRegistry(aliases)
+    with _registry_lock:
+        _registry = registry
+        _loaded_at = time.monotonic()
+    logger.info(f"載入 {len(registry.codes)} 個廠別、{len(registry.alias_to_code)} 個代碼 / 別名")
+    return registry
+
+
+def refresh_factory_registry(db) -> FactoryRegistry:
+    """尚未載入、已失效或超過 TTL 時重新載入"""
+    loaded_at = _loaded_at
+    if loaded_at is None or time.monotonic() - loaded_at > FACTORY_REGISTRY_TTL_SECONDS:
+        return load_factory_registry(db)
+    return _registry
+
+
+def invalidate_factory_registry():
+    """廠別新增 / 修改後呼叫，下次偵測前重新載入"""
+    global _loaded_at
+    with _registry_lock:
+        _loaded_at = None
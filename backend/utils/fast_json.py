@@ -0,0 +1,46 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Sequence
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 為選用套件
+    orjson = None
+
+
+def _default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"無法序列化的型別: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """序列化為 JSON bytes；有 orjson 時使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class LeanJSONResponse(Response):
+    """略過 jsonable_encoder，直接序列化 dict / list / tuple"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def rows_to_records(columns: Sequence[str], rows: Sequence[tuple]) -> List[Dict]:
+    """列導向：[{欄位: 值}, ...]"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def rows_to_columns(columns: Sequence[str], rows: Sequence[tuple]) -> Dict:
+    """欄導向：{"count": n, "fields": {欄位: [值, ...]}}，表格元件可直接使用"""
+    fields = {name: list(values) for name, values in zip(columns, zip(*rows))} if rows else {name: [] for name in columns}
+    return {"count": len(rows), "fields": fields}
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+import hashlib
+from typing import Callable, Dict, Optional
+import logging
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# 報表 / 業績 GET 回應依資料版本產生 ETag，上傳後才會改變
+CACHEABLE_PREFIXES = ("/api/reports", "/api/performance")
+# 資料版本在各 worker 內的快取時間（秒）；本 worker 的匯入會立即更新
+DATA_VERSION_TTL_SECONDS = float(os.getenv("DATA_VERSION_TTL_SECONDS", "2"))
+
+
+def _snapshot_generation() -> str:
+    from utils.analytics import snapshot_generation
+    return snapshot_generation()
+
+
+# 回應另依資料版本以外的來源而定的路徑：ETag 一併包含該來源的世代
+# （歷史報表可能來自匯入提交後才在背景更新的分析快照；更新前的回應不會以新版本快取）
+ETAG_GENERATIONS: Dict[str, Callable[[], str]] = {
+    "/api/performance/history": _snapshot_generation,
+}
+
+_cached_version: Optional[int] = None
+_cached_at = 0.0
+_lock = threading.Lock()
+
+
+def current_data_version() -> Optional[int]:
+    """取得資料版本（與報表查詢同一個資料庫，避免副本延遲造成版本與資料不一致）"""
+    global _cached_version, _cached_at
+
+    with _lock:
+        if _cached_version is not None and time.monotonic() - _cached_at < DATA_VERSION_TTL_SECONDS:
+            return _cached_version
+
+    from database import ReportsSessionLocal
+    import crud
+
+    db = ReportsSessionLocal()
+    try:
+        version = crud.get_data_version(db)
+    except Exception as e:
+        logger.warning(f"讀取資料版本失敗: {str(e)}")
+        return None
+    finally:
+        db.close()
+
+    with _lock:
+        _cached_version = version
+        _cached_at = time.monotonic()
+    return version
+
+
+def note_data_version(version: int):
+    """本 worker 匯入後直接更新快取"""
+    global _cached_version, _cached_at
+    with _lock:
+        _cached_version = version
+        _cached_at = time.monotonic()
+
+
+def make_etag(version, request: Request) -> str:
+    target = f"{request.url.path}?{request.url.query}".encode("utf-8")
+    return f'W/"{version}-{hashlib.sha1(target).hexdigest()[:16]}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+async def conditional_get_middleware(request: Request, call_next):
+    """
+    條件式 GET
+    - 回應附上由資料版本產生的 ETag
+    - If-None-Match 相符時直接回 304，不執行查詢
+    """
+    if request.method != "GET" or not request.url.path.startswith(CACHEABLE_PREFIXES):
+        return await call_next(request)
+
+    version = await run_in_threadpool(current_data_version)
+    if version is None:
+        return await call_next(request)
+
+    generation = ETAG_GENERATIONS.get(request.url.path)
+    if generation is not None:
+        version = f"{version}.{await run_in_threadpool(generation)}"
+
+    etag = make_etag(version, request)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
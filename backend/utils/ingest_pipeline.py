@@ -0,0 +1,110 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 管線化匯入：生產者執行緒逐塊解析，呼叫端（持有 DB session）逐塊寫入
+PIPELINED_INGEST_ENABLED = os.getenv("PIPELINED_INGEST", "true").lower() in ("1", "true", "yes")
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "5000"))
+# 已解析但尚未寫入的區塊上限（背壓：解析太快時生產者會等待）
+INGEST_MAX_PENDING_CHUNKS = int(os.getenv("INGEST_MAX_PENDING_CHUNKS", "4"))
+
+_DONE = object()
+
+# 單一上傳的區塊設定（utils.memory_governor 在記憶體預算不足時縮小）
+_limits: ContextVar[Optional[Tuple[Optional[int], Optional[int]]]] = ContextVar("ingest_limits", default=None)
+
+
+@contextmanager
+def ingest_limits(chunk_rows: Optional[int], max_pending: Optional[int]):
+    """區塊內的 run_ingest 未指定參數時改用此設定"""
+    token = _limits.set((chunk_rows, max_pending))
+    try:
+        yield
+    finally:
+        _limits.reset(token)
+
+
+class _ProducerError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def run_ingest(
+    df,
+    parse_chunk: Callable[[object], List[dict]],
+    write_chunk: Callable[[List[dict]], int],
+    chunk_rows: int = None,
+    max_pending: int = None
+) -> int:
+    """
+    解析與寫入
+    - 資料量小於一個區塊或停用管線時，依序解析後寫入
+    - 否則解析與 DB 寫入重疊進行，總時間趨近 max(解析, 寫入)
+    - write_chunk 一律在呼叫端執行緒執行（SQLAlchemy session 不可跨執行緒）
+    """
+    limit_rows, limit_pending = _limits.get() or (None, None)
+    chunk_rows = chunk_rows or limit_rows or INGEST_CHUNK_ROWS
+    max_pending = max_pending or limit_pending or INGEST_MAX_PENDING_CHUNKS
+
+    if not PIPELINED_INGEST_ENABLED or len(df) <= chunk_rows:
+        return write_chunk(parse_chunk(df))
+
+    pending: "queue.Queue" = queue.Queue(maxsize=max_pending)
+    cancelled = threading.Event()
+    stats = {"parse_seconds": 0.0, "write_seconds": 0.0}
+
+    def put(item) -> bool:
+        # 消費端中止時不要永遠卡在已滿的佇列上
+        while not cancelled.is_set():
+            try:
+                pending.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for start in range(0, len(df), chunk_rows):
+                if cancelled.is_set():
+                    return
+                started = time.perf_counter()
+                records = parse_chunk(df.iloc[start:start + chunk_rows])
+                stats["parse_seconds"] += time.perf_counter() - started
+                if not put(records):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_ProducerError(e))
+
+    producer = threading.Thread(target=produce, name="ingest-parser", daemon=True)
+    producer.start()
+
+    total = 0
+    started_at = time.perf_counter()
+    try:
+        while True:
+            item = pending.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _ProducerError):
+                raise item.error
+            started = time.perf_counter()
+            total += write_chunk(item)
+            stats["write_seconds"] += time.perf_counter() - started
+    finally:
+        cancelled.set()
+        producer.join()
+
+    logger.info(
+        f"管線化匯入完成：{total} 筆，總計 {time.perf_counter() - started_at:.2f}s"
+        f"（解析 {stats['parse_seconds']:.2f}s，寫入 {stats['write_seconds']:.2f}s）"
+    )
+    return total
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import re
+import threading
+import time
+import tracemalloc
+import zipfile
+from io import BytesIO
+from typing import Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 匯入記憶體預算：讀取檔案前依檔案大小與工作表尺寸估算記憶體用量
+# - 單一上傳超過預算：縮小管線區塊；連資料表本身都放不下時回 413
+# - 全部進行中的上傳超過總預算：排隊等待，逾時回 429
+# 總預算只計算本 worker 程序內的上傳（各程序各自計算，不跨程序共享）：
+# 以 N 個 worker 執行時，整台機器的上限為 N × INGEST_GLOBAL_MEMORY_BUDGET_MB，請依可用記憶體 / N 設定
+INGEST_MEMORY_BUDGET_MB = int(os.getenv("INGEST_MEMORY_BUDGET_MB", "1024"))
+INGEST_GLOBAL_MEMORY_BUDGET_MB = int(os.getenv("INGEST_GLOBAL_MEMORY_BUDGET_MB", "2048"))
+INGEST_MEMORY_WAIT_SECONDS = float(os.getenv("INGEST_MEMORY_WAIT_SECONDS", "60"))
+# 每個儲存格讀入 DataFrame 後的平均成本（object 欄位的字串與讀取器暫存）
+INGEST_BYTES_PER_CELL = int(os.getenv("INGEST_BYTES_PER_CELL", "160"))
+# 峰值記憶體取樣：RSS 取樣間隔（秒）；tracemalloc 另計 Python 配置的峰值（有額外成本，預設關閉）
+INGEST_MEMORY_SAMPLE_SECONDS = float(os.getenv("INGEST_MEMORY_SAMPLE_SECONDS", "0.2"))
+INGEST_TRACEMALLOC = os.getenv("INGEST_TRACEMALLOC", "false").lower() in ("1", "true", "yes")
+
+MB = 1024 * 1024
+# 解析後的記錄與 ORM 物件約為原始儲存格的數倍
+RECORD_OVERHEAD = 3
+# 縮小區塊時的下限（再小寫入效率太差）
+MIN_CHUNK_ROWS = 500
+# worksheet XML 中每個儲存格約佔的位元組（沒有 <dimension> 時用來估算）
+XML_BYTES_PER_CELL = 40
+# xls / 無法判斷格式時，記憶體約為檔案大小的倍數
+FALLBACK_SIZE_FACTOR = 12
+POLL_SECONDS = 0.5
+
+_DIMENSION_RE = re.compile(rb'<dimension ref="(?:[A-Z]+\d+:)?([A-Z]+)(\d+)"')
+_SHEET_RE = re.compile(r"^xl/worksheets/sheet(\d+)\.xml$")
+
+
+class MemoryBudgetError(Exception):
+    """超過記憶體預算（status_code 對應 HTTP 狀態碼）"""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class IngestPlan:
+    """單一上傳的記憶體估算與管線設定"""
+
+    def __init__(self, file_name: str, rows: int, columns: int, frame_bytes: int):
+        self.file_name = file_name
+        self.rows = rows
+        self.columns = columns
+        self.frame_bytes = frame_bytes
+        # None 表示使用 utils.ingest_pipeline 的預設值
+        self.chunk_rows: Optional[int] = None
+        self.max_pending: Optional[int] = None
+        self.reserved_bytes = 0
+
+    @property
+    def constrained(self) -> bool:
+        return self.chunk_rows is not None
+
+
+# ==================== 估算 ====================
+
+def _column_number(letters: bytes) -> int:
+    number = 0
+    for char in letters:
+        number = number * 26 + (char - 64)
+    return number
+
+
+def _xlsx_dimensions(content: bytes) -> Tuple[int, int]:
+    """第一個工作表的列數與欄數（<dimension> 與 XML 大小取較大者，避免匯出程式寫錯尺寸）"""
+    with zipfile.ZipFile(BytesIO(content)) as archive:
+        sheets = sorted(
+            (int(m.group(1)), info) for info in archive.infolist()
+            if (m := _SHEET_RE.match(info.filename))
+        )
+        if not sheets:
+            raise ValueError("找不到工作表")
+        info = sheets[0][1]
+        with archive.open(info) as sheet:
+            head = sheet.read(4096)
+    rows, columns = 0, 0
+    found = _DIMENSION_RE.search(head)
+    if found:
+        columns, rows = _column_number(found.group(1)), int(found.group(2))
+    cells_from_xml = info.file_size // XML_BYTES_PER_CELL
+    if rows * columns < cells_from_xml:
+        columns = max(columns, 1)
+        rows = cells_from_xml // columns
+    return rows, columns
+
+
+def _csv_dimensions(content: bytes) -> Tuple[int, int]:
+    first_line = content[:content.find(b"\n")] if b"\n" in content else content
+    return content.count(b"\n") + 1, first_line.count(b",") + 1
+
+
+def _parquet_dimensions(content: bytes) -> Tuple[int, int]:
+    import pyarrow.parquet as pq
+    metadata = pq.ParquetFile(BytesIO(content)).metadata
+    return metadata.num_rows, metadata.num_columns
+
+
+def estimate_upload(file_name: str, content: bytes) -> IngestPlan:
+    """讀取前估算 DataFrame 的記憶體用量（只讀檔頭與中繼資料）"""
+    from utils.readers import detect_file_format
+
+    file_format = detect_file_format(content, file_name)
+    rows, columns = 0, 0
+    try:
+        if file_format == "xlsx":
+            rows, columns = _xlsx_dimensions(content)
+        elif file_format == "csv":
+            rows, columns = _csv_dimensions(content)
+        elif file_format == "parquet":
+            rows, columns = _parquet_dimensions(content)
+    except Exception as e:
+        logger.debug(f"無法讀取 {file_name} 的尺寸，改以檔案大小估算: {e}")
+        rows, columns = 0, 0
+
+    if rows and columns:
+        frame_bytes = rows * columns * INGEST_BYTES_PER_CELL + len(content)
+    else:
+        frame_bytes = len(content) * FALLBACK_SIZE_FACTOR
+    return IngestPlan(file_name, rows, columns, frame_bytes)
+
+
+def plan_upload(file_name: str, content: bytes) -> IngestPlan:
+    """
+    依單一上傳預算決定管線設定
+    - 資料表與管線暫存都放得下：使用預設區塊
+    - 只有資料表放得下：縮小區塊、只保留一個待寫入區塊
+    - 資料表本身就超過預算：413
+    """
+    from utils.ingest_pipeline import INGEST_CHUNK_ROWS, INGEST_MAX_PENDING_CHUNKS
+
+    plan = estimate_upload(file_name, content)
+    budget = INGEST_MEMORY_BUDGET_MB * MB
+    row_bytes = max(plan.columns, 1) * INGEST_BYTES_PER_CELL * RECORD_OVERHEAD
+
+    def working_bytes(chunk_rows: int, max_pending: int) -> int:
+        # 待寫入區塊 + 解析中與寫入中各一塊
+        return chunk_rows * (max_pending + 2) * row_bytes
+
+    if plan.frame_bytes + working_bytes(INGEST_CHUNK_ROWS, INGEST_MAX_PENDING_CHUNKS) <= budget:
+        plan.reserved_bytes = plan.frame_bytes + working_bytes(INGEST_CHUNK_ROWS, INGEST_MAX_PENDING_CHUNKS)
+        return plan
+
+    remaining = budget - plan.frame_bytes
+    chunk_rows = remaining // (3 * row_bytes) if remaining > 0 else 0
+    if chunk_rows < MIN_CHUNK_ROWS:
+        raise MemoryBudgetError(
+            f"檔案 {file_name} 預估需要 {plan.frame_bytes / MB:.0f} MB 記憶體"
+            f"（約 {plan.rows} 列 × {plan.columns} 欄），超過單一上傳預算 {INGEST_MEMORY_BUDGET_MB} MB，"
+            f"請分割檔案後再上傳",
+            status_code=413
+        )
+    plan.chunk_rows = min(int(chunk_rows), INGEST_CHUNK_ROWS)
+    plan.max_pending = 1
+    plan.reserved_bytes = plan.frame_bytes + working_bytes(plan.chunk_rows, plan.max_pending)
+    logger.info(
+        f"檔案 {file_name} 預估 {plan.frame_bytes / MB:.0f} MB，"
+        f"改以每塊 {plan.chunk_rows} 行、單一待寫入區塊處理"
+    )
+    return plan
+
+
+# ==================== 總預算（每個 worker 程序） ====================
+
+_reserved_bytes = 0
+_reserve_lock = threading.Lock()
+
+
+def _try_reserve(nbytes: int) -> bool:
+    global _reserved_bytes
+    with _reserve_lock:
+        # 沒有其他上傳時一律放行（單一上傳已受 INGEST_MEMORY_BUDGET_MB 限制）
+        if _reserved_bytes and _reserved_bytes + nbytes > INGEST_GLOBAL_MEMORY_BUDGET_MB * MB:
+            return False
+        _reserved_bytes += nbytes
+        return True
+
+
+def release(plan: IngestPlan):
+    global _reserved_bytes
+    with _reserve_lock:
+        _reserved_bytes = max(0, _reserved_bytes - plan.reserved_bytes)
+
+
+async def reserve(plan: IngestPlan, wait_seconds: Optional[float] = None):
+    """
+    從總預算保留本次上傳的估算用量
+    - 不足時排隊（讓出事件迴圈），逾時回 429
+    """
+    wait_seconds = INGEST_MEMORY_WAIT_SECONDS if wait_seconds is None else wait_seconds
+    if _try_reserve(plan.reserved_bytes):
+        return
+    logger.info(f"記憶體預算不足，檔案 {plan.file_name}（{plan.reserved_bytes / MB:.0f} MB）排隊等待")
+    deadline = time.monotonic() + wait_seconds
+    while not _try_reserve(plan.reserved_bytes):
+        if time.monotonic() > deadline:
+            raise MemoryBudgetError(
+                f"目前匯入中的檔案已用盡記憶體預算 {INGEST_GLOBAL_MEMORY_BUDGET_MB} MB，請稍後再上傳 {plan.file_name}",
+                status_code=429,
+                retry_after=int(max(wait_seconds, POLL_SECONDS * 2))
+            )
+        await asyncio.sleep(POLL_SECONDS)
+
+
+# ==================== 峰值取樣 ====================
+
+def current_rss() -> int:
+    """目前程序的 RSS（Linux 讀 /proc；其他平台以 getrusage 的峰值代替）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemorySampler:
+    """匯入期間以背景執行緒取樣 RSS 峰值；INGEST_TRACEMALLOC 啟用時另記 Python 配置峰值"""
+
+    def __init__(self, plan: IngestPlan):
+        self.plan = plan
+        self.start_rss = 0
+        self.peak_rss = 0
+        self.traced_peak: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._tracing = False
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = current_rss()
+        if INGEST_TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        self._thread = threading.Thread(target=self._sample, name="ingest-memory-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(INGEST_MEMORY_SAMPLE_SECONDS):
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, current_rss())
+        if self._tracing:
+            self.traced_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        traced = f"，tracemalloc 峰值 {self.traced_peak / MB:.0f} MB" if self.traced_peak is not None else ""
+        logger.info(
+            f"檔案 {self.plan.file_name} 記憶體：預估 {self.plan.reserved_bytes / MB:.0f} MB，"
+            f"RSS 增加峰值 {(self.peak_rss - self.start_rss) / MB:.0f} MB"
+            f"（RSS 峰值 {self.peak_rss / MB:.0f} MB）{traced}"
+        )
+        return False
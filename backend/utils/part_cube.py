@@ -0,0 +1,282 @@
+import calendar
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 記憶體中的零件銷售欄式 cube（廠別 × 分類 × 月份 × 料號）
+PART_CUBE_ENABLED = os.getenv("PART_CUBE_ENABLED", "true").lower() in ("1", "true", "yes")
+PART_CUBE_MEMORY_BUDGET_MB = int(os.getenv("PART_CUBE_MEMORY_BUDGET_MB", "256"))
+# 與資料庫比對是否有新資料的最短間隔（秒）
+PART_CUBE_REFRESH_SECONDS = float(os.getenv("PART_CUBE_REFRESH_SECONDS", "30"))
+
+CUBE_DIMENSIONS = ["factory_code", "category", "month", "part_number"]
+NO_MONTH = -1
+
+
+def month_key(value: date) -> int:
+    return value.year * 12 + value.month - 1
+
+
+def month_start(key: int) -> Optional[date]:
+    if key == NO_MONTH:
+        return None
+    return date(key // 12, key % 12 + 1, 1)
+
+
+class Dictionary:
+    """字典編碼：字串值 <-> 整數代碼"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, values: Sequence[str]) -> np.ndarray:
+        out = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            code = self.codes.get(value)
+            if code is None:
+                code = len(self.values)
+                self.codes[value] = code
+                self.values.append(value)
+            out[i] = code
+        return out
+
+
+class PartSalesCube:
+    """
+    零件銷售 cube
+    - 每個 cell 為 (廠別, 分類, 月份, 料號) 的筆數與金額
+    - 維度以字典編碼存成 int32 陣列，量值為 int64 / float64 陣列
+    - 新資料以附加 cell 的方式增量更新，查詢時再彙總
+    """
+
+    def __init__(self):
+        self.dictionaries = {dim: Dictionary() for dim in ("factory_code", "category", "part_number")}
+        self.columns = {
+            "factory_code": np.empty(0, dtype=np.int32),
+            "category": np.empty(0, dtype=np.int32),
+            "month": np.empty(0, dtype=np.int32),
+            "part_number": np.empty(0, dtype=np.int32),
+            "count": np.empty(0, dtype=np.int64),
+            "amount": np.empty(0, dtype=np.float64),
+        }
+        self.last_id = 0
+        self.row_count = 0
+        self.checked_at = 0.0
+        # 同步時的資料版本與分類對照的最後更新時間（其他 worker 的匯入由此得知）
+        self.data_version: Optional[int] = None
+        self.categories_at = None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
+
+    def append(self, rows: List[tuple]):
+        """附加 cell：(factory_code, category, month, part_number, count, amount)"""
+        if not rows:
+            return
+        factories, categories, months, parts, counts, amounts = zip(*rows)
+        new_columns = {
+            "factory_code": self.dictionaries["factory_code"].encode(factories),
+            "category": self.dictionaries["category"].encode(categories),
+            "month": np.array([month_key(m) if m else NO_MONTH for m in months], dtype=np.int32),
+            "part_number": self.dictionaries["part_number"].encode(parts),
+            "count": np.array(counts, dtype=np.int64),
+            "amount": np.array([float(a or 0) for a in amounts], dtype=np.float64),
+        }
+        for name, values in new_columns.items():
+            self.columns[name] = np.concatenate([self.columns[name], values])
+
+    def query(
+        self,
+        group_by: Sequence[str],
+        factory_code: Optional[str] = None,
+        start_month: Optional[int] = None,
+        end_month: Optional[int] = None
+    ) -> List[dict]:
+        """切片後依指定維度彙總"""
+        mask = np.ones(len(self.columns["count"]), dtype=bool)
+        if factory_code is not None:
+            code = self.dictionaries["factory_code"].codes.get(factory_code)
+            if code is None:
+                return []
+            mask &= self.columns["factory_code"] == code
+        if start_month is not None:
+            mask &= self.columns["month"] >= start_month
+        if end_month is not None:
+            mask &= (self.columns["month"] <= end_month) & (self.columns["month"] != NO_MONTH)
+
+        if not mask.any():
+            return []
+
+        keys = [self.columns[dim][mask] for dim in group_by]
+        if keys:
+            # 以 +1 位移讓 NO_MONTH(-1) 也能參與 ravel_multi_index
+            shifted = [k.astype(np.int64) + 1 for k in keys]
+            dims = [int(k.max()) + 1 for k in shifted]
+            combined = np.ravel_multi_index(shifted, dims)
+            unique_keys, inverse = np.unique(combined, return_inverse=True)
+        else:
+            unique_keys, inverse, dims = np.zeros(1, dtype=np.int64), np.zeros(mask.sum(), dtype=np.int64), []
+
+        counts = np.bincount(inverse, weights=self.columns["count"][mask]).astype(np.int64)
+        amounts = np.bincount(inverse, weights=self.columns["amount"][mask])
+
+        decoded = np.unravel_index(unique_keys, dims) if dims else []
+        results = []
+        for i in range(len(unique_keys)):
+            row = {}
+            for dim, codes in zip(group_by, decoded):
+                value = int(codes[i]) - 1
+                if dim == "month":
+                    row[dim] = month_start(value)
+                else:
+                    row[dim] = self.dictionaries[dim].values[value]
+            row["count"] = int(counts[i])
+            row["total_amount"] = round(float(amounts[i]), 2)
+            results.append(row)
+
+        results.sort(key=lambda r: r["total_amount"], reverse=True)
+        return results
+
+
+_CELL_QUERY = text("""
+    SELECT ps.factory_code, pc.category, CAST(date_trunc('month', ps.sale_date) AS DATE) AS month,
+           ps.part_number, COUNT(*) AS count, SUM(ps.amount) AS amount
+    FROM part_sales ps
+    JOIN part_categories pc ON pc.part_number = ps.part_number
+    WHERE ps.id > :since_id AND ps.id <= :until_id
+    GROUP BY 1, 2, 3, 4
+""")
+
+_VERSION_QUERY = text("""
+    SELECT COALESCE(MAX(id), 0) AS max_id,
+           COUNT(*) AS row_count,
+           COUNT(*) FILTER (WHERE id > :since_id) AS new_rows,
+           (SELECT MAX(updated_at) FROM part_categories) AS categories_at
+    FROM part_sales
+""")
+
+_cube: Optional[PartSalesCube] = None
+_disabled_reason: Optional[str] = None
+_lock = threading.Lock()
+
+
+def _load(db, cube: PartSalesCube, since_id: int, until_id: int):
+    rows = db.execute(_CELL_QUERY, {"since_id": since_id, "until_id": until_id}).fetchall()
+    cube.append([tuple(row) for row in rows])
+    cube.last_id = until_id
+
+
+def build_cube(db, data_version: Optional[int] = None) -> Optional[PartSalesCube]:
+    """從資料庫完整建立 cube（超過記憶體預算則停用）"""
+    global _cube, _disabled_reason
+
+    started = time.perf_counter()
+    version = db.execute(_VERSION_QUERY, {"since_id": 0}).one()
+    cube = PartSalesCube()
+    _load(db, cube, 0, version.max_id)
+    cube.row_count = version.row_count
+    cube.categories_at = version.categories_at
+    cube.data_version = data_version
+    cube.checked_at = time.monotonic()
+
+    if cube.nbytes > PART_CUBE_MEMORY_BUDGET_MB * 1024 * 1024:
+        _cube = None
+        _disabled_reason = f"超過記憶體預算 {PART_CUBE_MEMORY_BUDGET_MB} MB"
+        logger.warning(f"零件銷售 cube 停用：{_disabled_reason}（{cube.nbytes / 1024 / 1024:.1f} MB）")
+        return None
+
+    _cube = cube
+    _disabled_reason = None
+    logger.info(
+        f"零件銷售 cube 建立完成：{len(cube.columns['count'])} cells，"
+        f"{cube.nbytes / 1024 / 1024:.1f} MB，{(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+    return cube
+
+
+def refresh_cube(db, force: bool = False, data_version: Optional[int] = None) -> Optional[PartSalesCube]:
+    """
+    與資料庫同步
+    - data_version 與上次同步時不同（任一 worker 有匯入）時立即同步，否則依刷新間隔
+    - 只有新增資料：增量載入 id > last_id 的 cell
+    - 筆數對不上（有刪除 / 覆蓋）或分類對照有更新：完整重建
+    """
+    with _lock:
+        if _disabled_reason and not force:
+            return None
+        cube = _cube
+        if cube is None:
+            return build_cube(db, data_version)
+        changed = data_version is not None and data_version != cube.data_version
+        if not force and not changed and time.monotonic() - cube.checked_at < PART_CUBE_REFRESH_SECONDS:
+            return cube
+
+        version = db.execute(_VERSION_QUERY, {"since_id": cube.last_id}).one()
+        if version.row_count != cube.row_count + version.new_rows or version.categories_at != cube.categories_at:
+            return build_cube(db, data_version)
+        if version.new_rows:
+            _load(db, cube, cube.last_id, version.max_id)
+            cube.row_count = version.row_count
+            if cube.nbytes > PART_CUBE_MEMORY_BUDGET_MB * 1024 * 1024:
+                return build_cube(db, data_version)
+        cube.checked_at = time.monotonic()
+        if data_version is not None:
+            cube.data_version = data_version
+        return cube
+
+
+def invalidate_cube():
+    """分類對照變更（Shelf Life Code）、覆蓋或撤銷上傳後，下次查詢時重建"""
+    global _cube, _disabled_reason
+    with _lock:
+        _cube = None
+        _disabled_reason = None
+
+
+def mark_stale():
+    """匯入新資料後呼叫：下次查詢立即同步，不等待刷新間隔"""
+    with _lock:
+        if _cube is not None:
+            _cube.checked_at = 0.0
+
+
+def query_cube(
+    db,
+    group_by: Sequence[str],
+    factory_code: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Optional[List[dict]]:
+    """
+    由 cube 回答查詢；無法回答時回傳 None（呼叫端改走 SQL）
+    cube 以月為粒度，期間必須對齊整月
+    """
+    if not PART_CUBE_ENABLED:
+        return None
+    if start_date and start_date.day != 1:
+        return None
+    if end_date and end_date.day != calendar.monthrange(end_date.year, end_date.month)[1]:
+        return None
+
+    # 先取得資料版本再同步：回應內容不會比 ETag 的版本舊
+    from utils.http_cache import current_data_version
+    cube = refresh_cube(db, data_version=current_data_version())
+    if cube is None:
+        return None
+
+    return cube.query(
+        group_by,
+        factory_code=factory_code,
+        start_month=month_key(start_date) if start_date else None,
+        end_month=month_key(end_date) if end_date else None
+    )
@@ -0,0 +1,85 @@
+import os
+from pathlib import Path
+from typing import Dict, Optional, TYPE_CHECKING
+import logging
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 原始資料行封存：每次上傳的原始工作表寫成 zstd 壓縮的 Parquet 檔，
+# 事實資料表只保留 file_upload_id + source_row，不在熱表中存放 JSON
+RAW_ARCHIVE_ENABLED = os.getenv("RAW_ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+RAW_ARCHIVE_DIR = Path(os.getenv("RAW_ARCHIVE_DIR", Path(__file__).resolve().parent.parent / "data" / "raw_archive"))
+
+ROW_INDEX_COLUMN = "__row_index"
+
+
+def _archive_path(file_hash: str) -> Path:
+    return RAW_ARCHIVE_DIR / file_hash[:2] / f"{file_hash}.parquet"
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def write_archive(file_hash: str, df: "pd.DataFrame") -> Optional[Path]:
+    """
+    將上傳檔案的原始資料行寫入封存檔
+    - 以檔案雜湊值命名，同一檔案只寫一次
+    - 保留原始 DataFrame 索引作為 __row_index（即事實資料的 source_row）
+    """
+    if not RAW_ARCHIVE_ENABLED:
+        return None
+    if not _has_pyarrow():
+        logger.warning("未安裝 pyarrow，略過原始資料封存")
+        return None
+
+    path = _archive_path(file_hash)
+    if path.exists():
+        return path
+
+    archive_df = df.copy()
+    archive_df.columns = [str(col).strip() for col in archive_df.columns]
+    # 混合型別欄位統一轉為字串，Parquet 欄位需有單一型別
+    for col in archive_df.columns:
+        if archive_df[col].dtype == object:
+            archive_df[col] = archive_df[col].astype("string")
+    archive_df.insert(0, ROW_INDEX_COLUMN, df.index.astype("int64"))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    archive_df.to_parquet(tmp_path, index=False, compression="zstd", row_group_size=50_000)
+    os.replace(tmp_path, path)
+
+    logger.info(f"原始資料已封存: {path}（{len(archive_df)} 行）")
+    return path
+
+
+def read_raw_row(file_hash: str, row_index: int) -> Optional[Dict]:
+    """讀取封存檔中的單一原始資料行（以 row group 統計值跳過無關區塊）"""
+    path = _archive_path(file_hash)
+    if not path.exists() or not _has_pyarrow():
+        return None
+
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, filters=[(ROW_INDEX_COLUMN, "=", int(row_index))])
+    if table.num_rows == 0:
+        return None
+
+    row = table.slice(0, 1).to_pylist()[0]
+    row.pop(ROW_INDEX_COLUMN, None)
+    return row
+
+
+def delete_archive(file_hash: str):
+    """刪除封存檔（撤銷上傳時使用）"""
+    path = _archive_path(file_hash)
+    if path.exists():
+        path.unlink()
@@ -0,0 +1,150 @@
+import os
+import pandas as pd
+from typing import Dict, Optional
+from io import BytesIO
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 檔案簽章（magic bytes）
+XLSX_SIGNATURE = b"PK\x03\x04"
+XLS_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+PARQUET_SIGNATURE = b"PAR1"
+
+# 設定檔：強制指定 Excel 讀取後端（openpyxl / calamine），未設定則自動選擇
+EXCEL_READER_BACKEND = os.getenv("EXCEL_READER_BACKEND", "").strip().lower()
+
+
+class ReaderBackend:
+    """讀取後端基底類別"""
+
+    name = "base"
+
+    def is_available(self) -> bool:
+        return True
+
+    def read(
+        self,
+        file_content: bytes,
+        sheet_name: Optional[str] = None,
+        header: Optional[int] = 0
+    ) -> pd.DataFrame:
+        """header=None 時回傳原始儲存格（不指定標題列），供版型辨識使用"""
+        raise NotImplementedError
+
+
+class OpenpyxlReader(ReaderBackend):
+    """原本的 openpyxl 讀取路徑（最慢，但相容性最好）"""
+
+    name = "openpyxl"
+
+    def read(self, file_content: bytes, sheet_name: Optional[str] = None, header: Optional[int] = 0) -> pd.DataFrame:
+        # engine=None 讓 pandas 依格式選擇 openpyxl(.xlsx) 或 xlrd(.xls)
+        return pd.read_excel(BytesIO(file_content), sheet_name=sheet_name or 0, header=header)
+
+
+class CalamineReader(ReaderBackend):
+    """原生 (Rust) xlsx/xls 讀取器，需安裝 python-calamine"""
+
+    name = "calamine"
+
+    def is_available(self) -> bool:
+        try:
+            import python_calamine  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def read(self, file_content: bytes, sheet_name: Optional[str] = None, header: Optional[int] = 0) -> pd.DataFrame:
+        return pd.read_excel(BytesIO(file_content), sheet_name=sheet_name or 0, header=header, engine="calamine")
+
+
+class CsvReader(ReaderBackend):
+    """CSV 直接讀取（ERP 可直接輸出 CSV 時略過 Excel）"""
+
+    name = "csv"
+
+    def is_available(self) -> bool:
+        return True
+
+    def read(self, file_content: bytes, sheet_name: Optional[str] = None, header: Optional[int] = 0) -> pd.DataFrame:
+        # 有 pyarrow 時使用多執行緒的欄式解析器
+        engine = "pyarrow" if _has_pyarrow() else "c"
+        # ERP 匯出常見 UTF-8 BOM，其次為 Big5
+        for encoding in ("utf-8-sig", "cp950"):
+            try:
+                return pd.read_csv(BytesIO(file_content), encoding=encoding, engine=engine, header=header)
+            except UnicodeDecodeError:
+                continue
+        raise ValueError("無法辨識 CSV 檔案編碼")
+
+
+class ParquetReader(ReaderBackend):
+    """Parquet 欄式讀取，需安裝 pyarrow"""
+
+    name = "parquet"
+
+    def is_available(self) -> bool:
+        return _has_pyarrow()
+
+    def read(self, file_content: bytes, sheet_name: Optional[str] = None, header: Optional[int] = 0) -> pd.DataFrame:
+        # Parquet 本身帶有欄位名稱，沒有標題列
+        return pd.read_parquet(BytesIO(file_content), engine="pyarrow")
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+BACKENDS: Dict[str, ReaderBackend] = {
+    backend.name: backend
+    for backend in (OpenpyxlReader(), CalamineReader(), CsvReader(), ParquetReader())
+}
+
+
+def detect_file_format(file_content: bytes, filename: Optional[str] = None) -> str:
+    """
+    依檔案簽章判斷格式
+    回傳: xlsx / xls / parquet / csv
+    """
+    head = file_content[:8]
+    if head.startswith(XLSX_SIGNATURE):
+        return "xlsx"
+    if head.startswith(XLS_SIGNATURE):
+        return "xls"
+    if head.startswith(PARQUET_SIGNATURE):
+        return "parquet"
+    if filename and filename.lower().endswith((".xlsx", ".xlsm")):
+        return "xlsx"
+    return "csv"
+
+
+def select_backend(
+    file_content: bytes,
+    filename: Optional[str] = None,
+    backend: Optional[str] = None
+) -> ReaderBackend:
+    """
+    選擇讀取後端
+    優先順序: 參數指定 > 檔案簽章（CSV/Parquet） > EXCEL_READER_BACKEND 設定 > calamine > openpyxl
+    """
+    if backend:
+        if backend not in BACKENDS:
+            raise ValueError(f"未知的讀取後端: {backend}")
+        return BACKENDS[backend]
+
+    file_format = detect_file_format(file_content, filename)
+    if file_format == "parquet":
+        return BACKENDS["parquet"]
+    if file_format == "csv":
+        return BACKENDS["csv"]
+
+    preferred = EXCEL_READER_BACKEND or "calamine"
+    candidate = BACKENDS.get(preferred)
+    if candidate and candidate.is_available():
+        return candidate
+    return BACKENDS["openpyxl"]
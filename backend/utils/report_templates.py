@@ -0,0 +1,236 @@
+import hashlib
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import logging
+
+from utils.excel_parser import ExcelParser, COLUMN_MAPPINGS, FIELD_SPECS
+from utils.factory_detector import detect_file_type, FACTORY_COLUMN_NAMES
+from utils.readers import detect_file_format
+
+logger = logging.getLogger(__name__)
+
+# 報表版型：依標題列指紋記錄報表類型、標題列位置、欄位對應與廠別欄位
+# 每月重複上傳的固定版型直接套用，不再逐次判斷；新版型第一次上傳時自動記錄
+
+# 尋找標題列時掃描的前幾列（報表上方可能有標題、日期區間等說明列）
+HEADER_SCAN_ROWS = 10
+# 版型快取上限（超過時整批清除）
+TEMPLATE_CACHE_SIZE = 512
+
+# 所有已知的標題名稱（去除前後空白）
+_KNOWN_HEADERS = {name for mapping in COLUMN_MAPPINGS.values() for name in mapping} | set(FACTORY_COLUMN_NAMES)
+# 欄位對應的版本：對應表變更後，先前記錄的版型（欄位對應已過時）不再命中，改為重新辨識
+_MAPPING_VERSION = hashlib.sha1(
+    json.dumps([COLUMN_MAPPINGS, FIELD_SPECS], ensure_ascii=False, sort_keys=True).encode("utf-8")
+).hexdigest()[:12]
+
+
+class ReportTemplate:
+    """已辨識的報表版型"""
+
+    def __init__(
+        self,
+        signature: str,
+        file_type: Optional[str],
+        header_row: int,
+        column_mapping: Dict[str, str],
+        factory_column: Optional[str] = None,
+        learned: bool = False
+    ):
+        self.signature = signature
+        self.file_type = file_type
+        self.header_row = header_row
+        self.column_mapping = column_mapping
+        self.factory_column = factory_column
+        # 本次上傳才辨識出的新版型（尚未寫入資料庫，匯入提交後才加入快取）
+        self.learned = learned
+
+    def project(self, df: pd.DataFrame) -> pd.DataFrame:
+        """只保留對應到的欄位並改為標準欄位名稱"""
+        columns = [col for col in df.columns if str(col).strip() in self.column_mapping]
+        projected = df[columns]
+        projected.columns = [self.column_mapping[str(col).strip()] for col in columns]
+        return projected
+
+
+_templates: Dict[str, ReportTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def header_signature(cells: List, header_row: int, column_count: int, filename_type: Optional[str]) -> str:
+    """
+    標題列指紋：標題文字、標題列位置、欄數、檔名判斷的報表類型與欄位對應版本
+    （零件出貨與零件銷售的標題可能完全相同，需以檔名區分）
+    """
+    payload = json.dumps(
+        [_MAPPING_VERSION, filename_type, header_row, column_count, [_header_text(cell) for cell in cells]],
+        ensure_ascii=False
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _header_text(cell) -> str:
+    return "" if pd.isna(cell) else str(cell).strip()
+
+
+def _locate_header(rows: List[List]) -> int:
+    """已知標題名稱最多的一列視為標題列（同分取較前者；都沒有時為第一列）"""
+    best_row, best_hits = 0, 0
+    for idx, cells in enumerate(rows):
+        hits = sum(1 for cell in cells if _header_text(cell) in _KNOWN_HEADERS)
+        if hits > best_hits:
+            best_row, best_hits = idx, hits
+    return best_row
+
+
+def _infer_file_type(headers: List[str]) -> Optional[str]:
+    """
+    檔名無法判斷報表類型時，依標題判斷
+    必要欄位全部對應到、且對應欄位數唯一最多的類型
+    """
+    scores = {}
+    for file_type, mapping in COLUMN_MAPPINGS.items():
+        targets = {mapping[header] for header in headers if header in mapping}
+        required = [column for column, kind in FIELD_SPECS[file_type].items() if kind == "required"]
+        if all(column in targets for column in required):
+            scores[file_type] = len(targets)
+    if not scores:
+        return None
+    best = max(scores.values())
+    candidates = [file_type for file_type, score in scores.items() if score == best]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def _learn(signature: str, cells: List, header_row: int, filename_type: Optional[str], columns) -> ReportTemplate:
+    headers = [_header_text(cell) for cell in cells]
+    file_type = filename_type or _infer_file_type(headers)
+    mapping = COLUMN_MAPPINGS.get(file_type, {})
+    column_mapping = {header: mapping[header] for header in headers if header in mapping}
+    factory_column = next(
+        (col for col in columns if _header_text(col) in FACTORY_COLUMN_NAMES),
+        None
+    )
+    return ReportTemplate(
+        signature,
+        file_type,
+        header_row,
+        column_mapping,
+        None if factory_column is None else str(factory_column),
+        learned=file_type is not None
+    )
+
+
+def _lookup(signatures: List[str], db) -> Dict[str, ReportTemplate]:
+    """先查記憶體快取，未命中再查資料庫（其他 worker 記錄的版型）"""
+    with _templates_lock:
+        found = {sig: _templates[sig] for sig in signatures if sig in _templates}
+    if found or db is None:
+        return found
+
+    import crud
+    for row in crud.get_report_templates(db, signatures):
+        template = ReportTemplate(
+            row.signature, row.file_type, row.header_row, dict(row.column_mapping), row.factory_column
+        )
+        _cache(template)
+        found[row.signature] = template
+    return found
+
+
+def _cache(template: ReportTemplate):
+    with _templates_lock:
+        if len(_templates) >= TEMPLATE_CACHE_SIZE:
+            _templates.clear()
+        _templates[template.signature] = template
+
+
+def _column_labels(cells: List) -> List:
+    """與 pandas 讀取標題列相同：空白標題為 Unnamed: n，重複標題加上 .1、.2"""
+    labels, seen = [], {}
+    for idx, cell in enumerate(cells):
+        label = f"Unnamed: {idx}" if pd.isna(cell) else cell
+        if label in seen:
+            seen[label] += 1
+            label = f"{label}.{seen[label]}"
+        else:
+            seen[label] = 0
+        labels.append(label)
+    return labels
+
+
+def _frame_from_grid(raw: pd.DataFrame, header_row: int) -> pd.DataFrame:
+    """以原始儲存格的第 header_row 列為標題，其下為資料（只讀取一次檔案）"""
+    df = raw.iloc[header_row + 1:].copy()
+    df.columns = _column_labels(raw.iloc[header_row].tolist())
+    df = df.dropna(how="all").reset_index(drop=True)
+    return df.infer_objects()
+
+
+def read_report(content: bytes, filename: str, db=None) -> Tuple[pd.DataFrame, ReportTemplate]:
+    """
+    讀取報表並套用版型
+    - 已知版型：直接使用記錄的報表類型、標題列位置與欄位對應
+    - 新版型：尋找標題列、判斷報表類型（learned=True，由呼叫端以 remember 於交易中寫入）
+    - db 為 None 時只使用記憶體快取（試跑驗證）
+    """
+    filename_type = detect_file_type(filename)
+    file_format = detect_file_format(content, filename)
+
+    if file_format == "parquet":
+        # Parquet 帶有欄位名稱，沒有標題列
+        df = ExcelParser.read_excel(content, filename=filename)
+        raw, rows = None, [list(df.columns)]
+    else:
+        raw = ExcelParser.read_excel(content, filename=filename, header=None)
+        rows = raw.head(HEADER_SCAN_ROWS).values.tolist()
+
+    column_count = len(rows[0]) if rows else 0
+    signatures = [header_signature(cells, idx, column_count, filename_type) for idx, cells in enumerate(rows)]
+    known = _lookup(signatures, db)
+    template = next((known[sig] for sig in signatures if sig in known), None)
+
+    if template is None:
+        header_row = _locate_header(rows) if rows else 0
+        cells = rows[header_row] if rows else []
+        template = _learn(signatures[header_row] if rows else "", cells, header_row, filename_type, _column_labels(cells))
+        if template.learned:
+            logger.info(
+                f"記錄新報表版型 {template.signature[:12]}: {template.file_type}，"
+                f"標題列 {template.header_row}，對應 {len(template.column_mapping)} 個欄位"
+            )
+    else:
+        logger.info(f"套用已知報表版型 {template.signature[:12]}: {template.file_type}")
+
+    if raw is None:
+        return df, template
+    if file_format == "csv":
+        # CSV 以 header=None 讀取時所有欄位都是字串，重新以標題列讀取保留數值型別
+        return ExcelParser.read_excel(content, filename=filename, header=template.header_row), template
+    return _frame_from_grid(raw, template.header_row), template
+
+
+def remember(db, template: ReportTemplate):
+    """
+    將新辨識的版型寫入資料庫（於匯入交易中呼叫，與匯入一起提交）
+    - 提交後才加入快取：匯入回滾時版型未寫入，下次上傳仍會重新辨識並記錄
+    """
+    if not template.learned:
+        return
+    import crud
+    crud.create_report_template(
+        db,
+        signature=template.signature,
+        file_type=template.file_type,
+        header_row=template.header_row,
+        column_mapping=template.column_mapping,
+        factory_column=template.factory_column
+    )
+
+    def committed():
+        template.learned = False
+        _cache(template)
+
+    crud.on_commit(db, committed)
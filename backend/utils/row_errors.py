@@ -0,0 +1,84 @@
+import threading
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+# 每個 (規則, 欄位) 保留的錯誤樣本數
+ROW_ERROR_SAMPLE_SIZE = 5
+# 樣本值 / 訊息的最大長度
+ROW_ERROR_VALUE_MAX_LENGTH = 200
+
+
+def _truncate(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    text = str(value)
+    if len(text) > ROW_ERROR_VALUE_MAX_LENGTH:
+        text = text[:ROW_ERROR_VALUE_MAX_LENGTH] + "…"
+    return text
+
+
+class RowErrorCollector:
+    """
+    資料行錯誤彙總
+    - 依 (規則, 欄位) 計數，每組只保留前幾筆樣本
+    - 取代逐行 logger.warning，整份上傳只輸出一行摘要
+    - 管線化匯入時解析執行緒與寫入執行緒會同時寫入，以 lock 保護
+    """
+
+    def __init__(self, sample_size: int = ROW_ERROR_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self._groups: Dict[Tuple[str, Optional[str]], Dict] = {}
+        self._lock = threading.Lock()
+
+    def add(self, rule: str, column: Optional[str] = None, row: Any = None, value: Any = None):
+        key = (rule, column)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = {"count": 0, "samples": []}
+            group["count"] += 1
+            if len(group["samples"]) < self.sample_size:
+                group["samples"].append({
+                    "row": int(row) if row is not None else None,
+                    "value": _truncate(value),
+                })
+
+    def add_count(self, rule: str, column: Optional[str] = None, count: int = 1):
+        """只累加計數（向量化檢查時，樣本已另行以 add 記錄）"""
+        if count <= 0:
+            return
+        key = (rule, column)
+        with self._lock:
+            group = self._groups.setdefault(key, {"count": 0, "samples": []})
+            group["count"] += count
+
+    @property
+    def total(self) -> int:
+        return sum(group["count"] for group in self._groups.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._groups)
+
+    def summary(self) -> Optional[Dict]:
+        """回傳可序列化的摘要（沒有錯誤時為 None）"""
+        if not self._groups:
+            return None
+        with self._lock:
+            groups = sorted(self._groups.items(), key=lambda item: item[1]["count"], reverse=True)
+            return {
+                "total": self.total,
+                "errors": [
+                    {"rule": rule, "column": column, "count": group["count"], "samples": list(group["samples"])}
+                    for (rule, column), group in groups
+                ],
+            }
+
+    def log_summary(self, logger: logging.Logger, context: str):
+        """輸出一行摘要"""
+        if not self._groups:
+            return
+        parts = ", ".join(
+            f"{rule}{'/' + column if column else ''}={group['count']}"
+            for (rule, column), group in sorted(self._groups.items(), key=lambda item: -item[1]["count"])
+        )
+        logger.warning(f"{context}: 共 {self.total} 筆資料行錯誤（{parts}）")
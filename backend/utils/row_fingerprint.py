@@ -0,0 +1,147 @@
+import math
+import os
+import threading
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+import logging
+import crud
+
+logger = logging.getLogger(__name__)
+
+# 是否啟用逐行增量匯入（同廠別、同報表類型已見過的資料行不再寫入）
+DELTA_INGEST_ENABLED = os.getenv("DELTA_INGEST", "true").lower() in ("1", "true", "yes")
+
+# 不適用增量匯入的報表類型（本身即為 upsert）
+DELTA_EXEMPT_FILE_TYPES = {"Shelf Life Code"}
+
+
+def compute_row_fingerprints(df: pd.DataFrame) -> np.ndarray:
+    """
+    計算每一行的 64-bit 指紋（int64，可直接存入 BIGINT）
+    - 以原始欄位內容雜湊（向量化）
+    - 同一檔案內完全相同的資料行以出現次序區分，避免被誤判為重複
+    """
+    if len(df) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    content_hash = pd.util.hash_pandas_object(df.astype(str), index=False)
+    occurrence = content_hash.groupby(content_hash.values).cumcount()
+    combined = pd.util.hash_pandas_object(
+        pd.DataFrame({"h": content_hash.values, "n": occurrence.values}),
+        index=False
+    )
+    return combined.values.astype(np.uint64).view(np.int64)
+
+
+class BloomFilter:
+    """以 NumPy 位元陣列實作的 Bloom filter（輸入為 64-bit 雜湊值）"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(capacity, 1024)
+        self.error_rate = error_rate
+        self.size = int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, hashes: np.ndarray) -> np.ndarray:
+        # double hashing: h1 + i * h2
+        values = hashes.astype(np.int64).view(np.uint64)
+        h1 = values & np.uint64(0xFFFFFFFF)
+        h2 = (values >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.hash_count, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.size)
+
+    def add(self, hashes: np.ndarray):
+        if len(hashes) == 0:
+            return
+        positions = self._positions(hashes).ravel()
+        np.bitwise_or.at(self.bits, positions // np.uint64(8), (1 << (positions % np.uint64(8))).astype(np.uint8))
+        self.count += len(hashes)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """回傳布林陣列：False 表示一定不存在，True 表示可能存在"""
+        if len(hashes) == 0:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(hashes)
+        bit_set = (self.bits[positions // np.uint64(8)] >> (positions % np.uint64(8)).astype(np.uint8)) & 1
+        return bit_set.all(axis=1)
+
+
+class FingerprintIndex:
+    """
+    單一 (廠別, 報表類型) 的指紋索引快取
+    Bloom filter 由 row_fingerprints 資料表建立，並依 last_id 增量同步
+    """
+
+    def __init__(self, capacity: int):
+        self.bloom = BloomFilter(capacity)
+        self.last_id = 0
+
+    def needs_rebuild(self, incoming: int) -> bool:
+        return self.bloom.count + incoming > self.bloom.capacity
+
+    def add(self, hashes: np.ndarray, last_id: int = 0):
+        self.bloom.add(hashes)
+        self.last_id = max(self.last_id, last_id)
+
+
+_indexes: Dict[Tuple[str, str], FingerprintIndex] = {}
+_lock = threading.Lock()
+
+
+def get_fingerprint_index(db, factory_code: str, file_type: str) -> FingerprintIndex:
+    """取得（必要時建立 / 同步）指紋索引"""
+    key = (factory_code, file_type)
+    with _lock:
+        index = _indexes.get(key)
+
+        # 只載入上次同步之後（其他 worker）新增的指紋
+        since_id = index.last_id if index else 0
+        rows = crud.get_row_fingerprints_since(db, factory_code, file_type, since_id)
+
+        if index is None or index.needs_rebuild(len(rows)):
+            if index is not None:
+                rows = crud.get_row_fingerprints_since(db, factory_code, file_type, 0)
+            index = FingerprintIndex(capacity=max(len(rows) * 2, 100_000))
+            _indexes[key] = index
+            logger.info(f"建立指紋索引 {factory_code}/{file_type}，共 {len(rows)} 筆")
+
+        if rows:
+            ids, hashes = zip(*rows)
+            index.add(np.fromiter(hashes, dtype=np.int64, count=len(hashes)), max(ids))
+
+        return index
+
+
+def split_new_rows(db, factory_code: str, file_type: str, fingerprints: np.ndarray) -> np.ndarray:
+    """
+    找出尚未匯入過的資料行，回傳布林遮罩
+    - Bloom filter 判定不存在者直接視為新資料
+    - 可能存在者以一次索引查詢確認
+    """
+    index = get_fingerprint_index(db, factory_code, file_type)
+    maybe_seen = index.bloom.contains(fingerprints)
+
+    is_new = ~maybe_seen
+    if maybe_seen.any():
+        candidates = fingerprints[maybe_seen]
+        existing = crud.get_existing_row_fingerprints(db, factory_code, file_type, candidates.tolist())
+        is_new[maybe_seen] = ~np.isin(candidates, np.fromiter(existing, dtype=np.int64, count=len(existing)))
+
+    return is_new
+
+
+def register_fingerprints(
+    db,
+    factory_code: str,
+    file_type: str,
+    fingerprints: Iterable[int],
+    file_hash: str
+):
+    """寫入新指紋（記憶體索引於下次查詢時依 last_id 增量同步）"""
+    hashes = [int(h) for h in fingerprints]
+    if hashes:
+        crud.bulk_insert_row_fingerprints(db, factory_code, file_type, hashes, file_hash)
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 可續傳的分段上傳：分段依位移寫入暫存檔，SHA-256 隨連續前綴增量計算
+UPLOAD_SESSION_DIR = Path(os.getenv("UPLOAD_SESSION_DIR", Path(__file__).resolve().parent.parent / "data" / "upload_sessions"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(500 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(4 * 1024 * 1024)))
+# 未完成的上傳工作階段保留時間（秒）
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+
+SPOOL_FILE = "data.part"
+STATE_FILE = "session.json"
+
+
+class UploadSessionError(Exception):
+    """上傳工作階段錯誤（status_code 對應 HTTP 狀態碼）"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _Hasher:
+    """單一工作階段的增量雜湊：只涵蓋檔案開頭連續已收到的部分"""
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.offset = 0
+
+
+# 雜湊狀態無法序列化，只保存在處理該工作階段的 worker 記憶體中；
+# 遺失時（重啟或換 worker）於需要時從暫存檔補算
+_hashers: Dict[str, _Hasher] = {}
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def _session_lock(session_id: str) -> threading.Lock:
+    with _registry_lock:
+        return _locks.setdefault(session_id, threading.Lock())
+
+
+def _session_dir(session_id: str) -> Path:
+    # session_id 由伺服器產生（uuid4 hex），拒絕其他格式避免路徑跳脫
+    if len(session_id) != 32 or not all(c in "0123456789abcdef" for c in session_id):
+        raise UploadSessionError(f"找不到上傳工作階段: {session_id}", status_code=404)
+    return UPLOAD_SESSION_DIR / session_id
+
+
+def _load_state(session_id: str) -> dict:
+    path = _session_dir(session_id) / STATE_FILE
+    if not path.exists():
+        raise UploadSessionError(f"找不到上傳工作階段: {session_id}", status_code=404)
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _save_state(session_id: str, state: dict):
+    directory = _session_dir(session_id)
+    tmp = directory / f"{STATE_FILE}.{uuid.uuid4().hex[:8]}.tmp"
+    tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, directory / STATE_FILE)
+
+
+def _merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    merged = []
+    for r_start, r_end in sorted(ranges + [[start, end]]):
+        if merged and r_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], r_end)
+        else:
+            merged.append([r_start, r_end])
+    return merged
+
+
+def _contiguous_end(ranges: List[List[int]]) -> int:
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+
+def _advance_hash(session_id: str, state: dict, chunk: Optional[bytes] = None, offset: int = 0):
+    """把雜湊推進到連續前綴的結尾；剛好接續的分段直接使用記憶體中的資料"""
+    hasher = _hashers.get(session_id)
+    if hasher is None:
+        hasher = _hashers[session_id] = _Hasher()
+
+    target = _contiguous_end(state["ranges"])
+    if chunk is not None and offset == hasher.offset and offset + len(chunk) <= target:
+        hasher.sha256.update(chunk)
+        hasher.offset += len(chunk)
+
+    if hasher.offset < target:
+        # 亂序到達或雜湊狀態遺失：從暫存檔補算缺少的區段
+        with open(_session_dir(session_id) / SPOOL_FILE, "rb") as f:
+            f.seek(hasher.offset)
+            while hasher.offset < target:
+                block = f.read(min(UPLOAD_CHUNK_BYTES, target - hasher.offset))
+                if not block:
+                    break
+                hasher.sha256.update(block)
+                hasher.offset += len(block)
+    return hasher
+
+
+def cleanup_expired_sessions():
+    if not UPLOAD_SESSION_DIR.exists():
+        return
+    cutoff = time.time() - UPLOAD_SESSION_TTL_SECONDS
+    for directory in UPLOAD_SESSION_DIR.iterdir():
+        state_path = directory / STATE_FILE
+        try:
+            if state_path.stat().st_mtime < cutoff:
+                discard_session(directory.name)
+                logger.info(f"移除逾期的上傳工作階段: {directory.name}")
+        except (FileNotFoundError, UploadSessionError):
+            continue
+
+
+def create_session(file_name: str, total_size: int) -> dict:
+    """建立上傳工作階段並預先配置暫存檔"""
+    if total_size <= 0:
+        raise UploadSessionError("檔案大小必須大於 0")
+    if total_size > UPLOAD_MAX_BYTES:
+        raise UploadSessionError(
+            f"檔案大小 {total_size} 超過上限 {UPLOAD_MAX_BYTES} bytes", status_code=413
+        )
+
+    cleanup_expired_sessions()
+
+    session_id = uuid.uuid4().hex
+    directory = _session_dir(session_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / SPOOL_FILE, "wb") as f:
+        f.truncate(total_size)
+
+    state = {
+        "session_id": session_id,
+        "file_name": os.path.basename(file_name),
+        "total_size": total_size,
+        "ranges": [],
+        "created_at": time.time(),
+    }
+    _save_state(session_id, state)
+    _hashers[session_id] = _Hasher()
+    logger.info(f"建立上傳工作階段 {session_id}: {state['file_name']}（{total_size} bytes）")
+    return describe(state)
+
+
+def write_chunk(session_id: str, offset: int, chunk: bytes) -> dict:
+    """
+    寫入一個分段（可重送、可亂序）
+    - 依位移寫入暫存檔，已收到的區段以 ranges 記錄
+    - 重送相同區段為冪等操作
+    """
+    with _session_lock(session_id):
+        state = _load_state(session_id)
+        if offset < 0 or offset + len(chunk) > state["total_size"]:
+            raise UploadSessionError(
+                f"分段超出檔案範圍: offset={offset}, size={len(chunk)}, total={state['total_size']}",
+                status_code=416
+            )
+        if not chunk:
+            return describe(state)
+
+        with open(_session_dir(session_id) / SPOOL_FILE, "r+b") as f:
+            f.seek(offset)
+            f.write(chunk)
+
+        state["ranges"] = _merge_range(state["ranges"], offset, offset + len(chunk))
+        _save_state(session_id, state)
+        _advance_hash(session_id, state, chunk, offset)
+        return describe(state)
+
+
+def get_session(session_id: str) -> dict:
+    return describe(_load_state(session_id))
+
+
+def describe(state: dict) -> dict:
+    received = sum(end - start for start, end in state["ranges"])
+    return {
+        "session_id": state["session_id"],
+        "file_name": state["file_name"],
+        "total_size": state["total_size"],
+        "received_bytes": received,
+        "ranges": [list(r) for r in state["ranges"]],
+        "complete": received == state["total_size"],
+        "chunk_size": UPLOAD_CHUNK_BYTES,
+    }
+
+
+def finalize_session(session_id: str) -> Tuple[str, bytes, str]:
+    """
+    完成上傳：回傳 (檔名, 檔案內容, SHA-256)
+    雜湊已在接收分段時算好，不需再掃描一次檔案
+    """
+    with _session_lock(session_id):
+        state = _load_state(session_id)
+        if _contiguous_end(state["ranges"]) != state["total_size"]:
+            missing = state["total_size"] - sum(end - start for start, end in state["ranges"])
+            raise UploadSessionError(f"檔案尚未上傳完成，缺少 {missing} bytes", status_code=409)
+
+        hasher = _advance_hash(session_id, state)
+        content = (_session_dir(session_id) / SPOOL_FILE).read_bytes()
+        return state["file_name"], content, hasher.sha256.hexdigest()
+
+
+def discard_session(session_id: str):
+    """刪除工作階段與暫存檔（完成匯入或取消上傳時）"""
+    directory = _session_dir(session_id)
+    with _session_lock(session_id):
+        _hashers.pop(session_id, None)
+        shutil.rmtree(directory, ignore_errors=True)
+    with _registry_lock:
+        _locks.pop(session_id, None)
@@ -0,0 +1,124 @@
+import time
+from typing import Dict
+
+import pandas as pd
+import logging
+
+from utils.excel_parser import COLUMN_MAPPINGS, FIELD_SPECS
+from utils.coercion import coerce_fields
+from utils.row_errors import RowErrorCollector
+from utils.report_templates import read_report
+from utils.factory_detector import (
+    detect_factory_from_filename,
+    detect_file_type,
+    detect_factories_from_dataframe,
+    filter_dataframe_by_factory
+)
+
+logger = logging.getLogger(__name__)
+
+# 每條規則回傳的錯誤樣本數
+VALIDATION_SAMPLE_SIZE = 5
+
+
+def validate_dataframe(df: pd.DataFrame, file_type: str) -> Dict:
+    """
+    檢查欄位對應與型別（不寫入資料庫）
+    - 型別轉換與匯入時相同（utils.coercion），判定結果與實際匯入一致
+    - 回傳對應到的欄位、缺少的欄位，以及各規則的無效筆數與樣本
+    """
+    df = df.rename(columns=lambda col: str(col).strip())
+    mapping = COLUMN_MAPPINGS[file_type]
+    specs = FIELD_SPECS[file_type]
+
+    # 同一標準欄位對應到多個原始標題時，與 rename 相同取最後一個
+    mapped_columns = {col: mapping[col] for col in df.columns if col in mapping}
+    source_of = {target: col for col, target in mapped_columns.items()}
+    df = df.rename(columns=mapping)
+    missing_columns = [column for column in specs if column not in df.columns]
+
+    collector = RowErrorCollector(sample_size=VALIDATION_SAMPLE_SIZE)
+    _, valid = coerce_fields(df, specs, collector)
+
+    rules = []
+    for group in (collector.summary() or {"errors": []})["errors"]:
+        if group["column"] in missing_columns:
+            # 缺少必要欄位：整份檔案都會被略過
+            rules.append({
+                "rule": "missing_column",
+                "column": group["column"],
+                "source_column": None,
+                "invalid_count": group["count"],
+                "samples": [],
+            })
+            continue
+        rules.append({
+            "rule": group["rule"],
+            "column": group["column"],
+            "source_column": source_of.get(group["column"]),
+            "invalid_count": group["count"],
+            "samples": group["samples"],
+        })
+
+    return {
+        "mapped_columns": mapped_columns,
+        "missing_columns": missing_columns,
+        "unmapped_columns": [col for col in df.columns if col not in specs],
+        "valid_rows": int(valid.sum()),
+        "invalid_rows": int((~valid).sum()),
+        "rules": rules,
+    }
+
+
+def validate_upload(file_name: str, content: bytes) -> Dict:
+    """
+    試跑上傳檔案：讀取、識別報表類型與廠別、欄位對應與型別檢查
+    - 不查詢也不寫入資料庫，不計算指紋、不封存（新版型只記在記憶體快取）
+    """
+    started = time.perf_counter()
+    report = {
+        "file_name": file_name,
+        "file_type": detect_file_type(file_name),
+        "factories": {},
+        "factory_source": None,
+        "row_count": 0,
+        "mapped_columns": {},
+        "missing_columns": [],
+        "unmapped_columns": [],
+        "valid_rows": 0,
+        "invalid_rows": 0,
+        "rules": [],
+        "errors": [],
+    }
+
+    try:
+        df, template = read_report(content, file_name)
+    except ValueError as e:
+        report["errors"].append(str(e))
+        report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return report
+    report["row_count"] = len(df)
+    report["file_type"] = template.file_type
+    factory_column = template.factory_column
+
+    factory_code = detect_factory_from_filename(file_name)
+    if factory_code:
+        report["factory_source"] = "filename"
+        report["factories"] = {factory_code: len(filter_dataframe_by_factory(df, factory_code, factory_column)) or len(df)}
+    else:
+        factories = detect_factories_from_dataframe(df, factory_column)
+        if factories:
+            report["factory_source"] = "data"
+            report["factories"] = {
+                code: len(filter_dataframe_by_factory(df, code, factory_column)) for code in sorted(factories)
+            }
+        else:
+            report["errors"].append(f"無法從檔案名稱或資料中識別廠別: {file_name}")
+
+    if report["file_type"] in COLUMN_MAPPINGS:
+        report.update(validate_dataframe(df, report["file_type"]))
+    else:
+        report["errors"].append(f"無法從檔案名稱或標題列識別報表類型: {file_name}")
+
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report